@@ -6,11 +6,20 @@
 
 import json
 import sqlite3
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from flask import Flask, render_template, request, jsonify, send_from_directory
 
+sys.path.insert(0, str(Path(__file__).parent / 'crawler'))
+
+import codec
+import migrations
+import queries
+import retweets
+import storage
+
 app = Flask(__name__, template_folder='generator/templates')
 app.config['JSON_AS_ASCII'] = False
 
@@ -18,14 +27,32 @@ app.config['JSON_AS_ASCII'] = False
 DB_PATH = 'data/database.db'
 IMAGES_PATH = 'data/images'
 
+# 微博发布时间的时区（按日期筛选时日期按北京时间解释）
+WEIBO_TZ = timezone(timedelta(hours=8))
+
 
 def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    """获取数据库连接（WAL 模式，爬虫写入时不阻塞读取，见 crawler/storage.py）"""
+    conn = storage.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def upgrade_database():
+    """升级旧数据库的表结构（见 crawler/migrations.py，已是最新版本时不做任何事）"""
+    if not Path(DB_PATH).exists():
+        return
+    conn = storage.connect(DB_PATH)
+    try:
+        # 多个 worker 同时启动，不在这里整理数据库文件
+        migrations.migrate(conn, vacuum=False)
+    finally:
+        conn.close()
+
+
+upgrade_database()
+
+
 def datetimeformat(value, format='%Y-%m-%d %H:%M'):
     """日期时间格式化"""
     if not value:
@@ -37,25 +64,75 @@ def datetimeformat(value, format='%Y-%m-%d %H:%M'):
         return value
 
 
-def convert_pics_to_local(weibo_id, pic_urls, cursor):
-    """将图片URL列表转换为本地路径"""
-    if not pic_urls:
-        return []
+def load_local_pics(weibo_ids, cursor):
+    """一次查询这些微博已下载图片的本地路径，返回 {(微博ID, 图片URL): 本地路径}"""
+    weibo_ids = list({str(weibo_id) for weibo_id in weibo_ids})
+    if not weibo_ids:
+        return {}
+
+    cursor.execute(queries.local_pics_query(len(weibo_ids)), weibo_ids)
+    return {(row['weibo_id'], row['url']): row['local_path'] for row in cursor.fetchall()}
+
+
+def convert_pics_to_local(weibo_id, pic_urls, local_pics):
+    """将图片URL列表转换为本地路径（没有本地文件的使用原URL）"""
+    return [local_pics.get((str(weibo_id), pic_url), pic_url) for pic_url in pic_urls]
+
+
+def hydrate_weibos(rows, cursor, text_codec):
+    """把查询到的微博行组装成模板使用的数据：解码正文和图片列、图片换成本地路径、组装转发的原微博
+
+    整页的图片本地路径只查询一次
+    """
+    weibos = [text_codec.decode_row(dict(row)) for row in rows]
+    local_pics = load_local_pics([weibo['id'] for weibo in weibos if weibo['pics']], cursor)
+    for weibo in weibos:
+        # 解析图片JSON
+        pic_urls = json.loads(weibo['pics']) if weibo['pics'] else []
+        weibo['pics'] = convert_pics_to_local(weibo['id'], pic_urls, local_pics)
+
+        # 转发的原微博
+        retweets.attach(weibo)
+    return weibos
+
+
+def fetch_weibo_page(cursor, sort_columns, per_page, page=None, before=None, after=None,
+                     where=None, params=(), bounds=None):
+    """按 sort_columns 倒序取一页微博，返回 (行, 上一页游标, 下一页游标)
+
+    before/after 是微博ID（游标分页）：取比该微博更旧/更新的一页，索引直接从游标位置开始读，
+    翻到多深都只读一页；都没有时按页码 OFFSET 分页。返回的游标是本页最新/最旧一条微博的ID，
+    没有上一页/下一页时为None。
+    bounds 是第一个排序列的范围 (下限, 上限)，左闭右开（SQL见 crawler/queries.py）。
+    """
+    key = None
+    cursor_id = before or after
+    if cursor_id:
+        cursor.execute(queries.cursor_key_query(sort_columns), (cursor_id,))
+        key = cursor.fetchone()
+        if key is None or None in tuple(key):
+            return [], None, None
+        key = tuple(key)
+
+    # 倒序翻页（before 或页码）按倒序读，after 按正序读再反转；多取一条判断后面是否还有
+    ascending = bool(after) and not before
+    query, query_params = queries.weibo_page_query(
+        sort_columns, per_page + 1, offset=(max(page or 1, 1) - 1) * per_page, key=key, older=not ascending,
+        where=where, params=params, bounds=bounds)
+
+    cursor.execute(query, query_params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if ascending:
+        rows.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = bool(cursor_id) or (page or 1) > 1, has_more
 
-    local_pics = []
-    for pic_url in pic_urls:
-        # 从images表查询本地路径
-        cursor.execute(
-            'SELECT local_path FROM images WHERE weibo_id = ? AND url = ? AND downloaded = 1',
-            (weibo_id, pic_url)
-        )
-        result = cursor.fetchone()
-        if result and result['local_path']:
-            local_pics.append(result['local_path'])
-        else:
-            # 如果没有本地文件，使用原URL
-            local_pics.append(pic_url)
-    return local_pics
+    newer_cursor = rows[0]['id'] if rows and has_newer else None
+    older_cursor = rows[-1]['id'] if rows and has_older else None
+    return rows, newer_cursor, older_cursor
 
 
 # 注册过滤器
@@ -64,52 +141,33 @@ app.jinja_env.filters['datetimeformat'] = datetimeformat
 
 @app.route('/')
 def index():
-    """首页"""
-    page = request.args.get('page', 1, type=int)
+    """首页（?page=页码，或 ?before=/?after=微博ID 游标翻页）"""
+    before = request.args.get('before')
+    after = request.args.get('after')
+    # 游标翻页时页码只用于显示
+    page = request.args.get('page', None if before or after else 1, type=int)
     per_page = 50
-    offset = (page - 1) * per_page
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    text_codec = codec.TextCodec.load(conn)
 
     # 获取用户列表
     cursor.execute('SELECT * FROM users ORDER BY name')
     users = [dict(row) for row in cursor.fetchall()]
 
     # 获取微博总数
-    cursor.execute('SELECT COUNT(*) FROM weibos')
+    cursor.execute(queries.COUNT_ALL)
     total_count = cursor.fetchone()[0]
 
     # 计算总页数
     total_pages = (total_count + per_page - 1) // per_page
 
     # 获取当前页微博
-    cursor.execute('''
-        SELECT w.*, u.name as user_name
-        FROM weibos w
-        LEFT JOIN users u ON w.uid = u.uid
-        ORDER BY CAST(w.id AS INTEGER) DESC
-        LIMIT ? OFFSET ?
-    ''', (per_page, offset))
-
-    weibos = []
-    for row in cursor.fetchall():
-        weibo = dict(row)
-        # 解析图片JSON
-        if weibo['pics']:
-            pic_urls = json.loads(weibo['pics'])
-            weibo['pics'] = convert_pics_to_local(weibo['id'], pic_urls, cursor)
-        else:
-            weibo['pics'] = []
-
-        # 解析转发微博
-        if weibo['retweeted_status']:
-            try:
-                weibo['retweeted_status'] = json.loads(weibo['retweeted_status'])
-            except:
-                weibo['retweeted_status'] = None
+    rows, newer_cursor, older_cursor = fetch_weibo_page(
+        cursor, ('w.id_int',), per_page, page, before, after)
 
-        weibos.append(weibo)
+    weibos = hydrate_weibos(rows, cursor, text_codec)
 
     conn.close()
 
@@ -119,18 +177,23 @@ def index():
                           total_count=total_count,
                           current_page=page,
                           total_pages=total_pages,
+                          newer_cursor=newer_cursor,
+                          older_cursor=older_cursor,
                           page_title='微博归档')
 
 
 @app.route('/user/<uid>')
 def user_page(uid):
-    """用户页面"""
-    page = request.args.get('page', 1, type=int)
+    """用户页面（?page=页码，或 ?before=/?after=微博ID 游标翻页）"""
+    before = request.args.get('before')
+    after = request.args.get('after')
+    # 游标翻页时页码只用于显示
+    page = request.args.get('page', None if before or after else 1, type=int)
     per_page = 50
-    offset = (page - 1) * per_page
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    text_codec = codec.TextCodec.load(conn)
 
     # 获取用户信息
     cursor.execute('SELECT * FROM users WHERE uid = ?', (uid,))
@@ -143,40 +206,17 @@ def user_page(uid):
     user = dict(user)
 
     # 获取该用户的微博总数
-    cursor.execute('SELECT COUNT(*) FROM weibos WHERE uid = ?', (uid,))
+    cursor.execute(queries.COUNT_BY_USER, (uid,))
     total_count = cursor.fetchone()[0]
 
     # 计算总页数
     total_pages = (total_count + per_page - 1) // per_page
 
     # 获取当前页微博
-    cursor.execute('''
-        SELECT w.*, u.name as user_name
-        FROM weibos w
-        LEFT JOIN users u ON w.uid = u.uid
-        WHERE w.uid = ?
-        ORDER BY CAST(w.id AS INTEGER) DESC
-        LIMIT ? OFFSET ?
-    ''', (uid, per_page, offset))
-
-    weibos = []
-    for row in cursor.fetchall():
-        weibo = dict(row)
-        # 解析图片JSON
-        if weibo['pics']:
-            pic_urls = json.loads(weibo['pics'])
-            weibo['pics'] = convert_pics_to_local(weibo['id'], pic_urls, cursor)
-        else:
-            weibo['pics'] = []
-
-        # 解析转发微博
-        if weibo['retweeted_status']:
-            try:
-                weibo['retweeted_status'] = json.loads(weibo['retweeted_status'])
-            except:
-                weibo['retweeted_status'] = None
+    rows, newer_cursor, older_cursor = fetch_weibo_page(
+        cursor, ('w.id_int',), per_page, page, before, after, where='w.uid = ?', params=(uid,))
 
-        weibos.append(weibo)
+    weibos = hydrate_weibos(rows, cursor, text_codec)
 
     conn.close()
 
@@ -186,6 +226,8 @@ def user_page(uid):
                           total_count=total_count,
                           current_page=page,
                           total_pages=total_pages,
+                          newer_cursor=newer_cursor,
+                          older_cursor=older_cursor,
                           page_title=f"{user['name']}的微博")
 
 
@@ -194,13 +236,9 @@ def post_page(weibo_id):
     """微博详情页"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    text_codec = codec.TextCodec.load(conn)
 
-    cursor.execute('''
-        SELECT w.*, u.name as user_name
-        FROM weibos w
-        LEFT JOIN users u ON w.uid = u.uid
-        WHERE w.id = ?
-    ''', (weibo_id,))
+    cursor.execute(queries.WEIBO_BY_ID, (weibo_id,))
 
     row = cursor.fetchone()
 
@@ -208,21 +246,7 @@ def post_page(weibo_id):
         conn.close()
         return "微博不存在", 404
 
-    weibo = dict(row)
-
-    # 解析图片JSON
-    if weibo['pics']:
-        pic_urls = json.loads(weibo['pics'])
-        weibo['pics'] = convert_pics_to_local(weibo['id'], pic_urls, cursor)
-    else:
-        weibo['pics'] = []
-
-    # 解析转发微博
-    if weibo['retweeted_status']:
-        try:
-            weibo['retweeted_status'] = json.loads(weibo['retweeted_status'])
-        except:
-            weibo['retweeted_status'] = None
+    weibo = hydrate_weibos([row], cursor, text_codec)[0]
 
     conn.close()
 
@@ -249,13 +273,15 @@ def search_api():
         return bool(re.search(r'[\u4e00-\u9fff]', text))
 
     # 如果查询包含中文，直接使用LIKE搜索（FTS5对中文分词支持不好）
+    # 搜索都在 weibos_fts 的明文上进行，weibos.content 可能是压缩的（见 crawler/codec.py）
     if contains_chinese(query):
         cursor.execute('''
-            SELECT w.id, w.content, w.created_at, u.name as user_name
-            FROM weibos w
+            SELECT w.id, f.content, w.created_at, u.name as user_name
+            FROM weibos_fts f
+            JOIN weibos w ON w.id = CAST(f.id AS TEXT)
             LEFT JOIN users u ON w.uid = u.uid
-            WHERE w.content LIKE ?
-            ORDER BY CAST(w.id AS INTEGER) DESC
+            WHERE f.content LIKE ?
+            ORDER BY w.id_int DESC
             LIMIT 20
         ''', (f'%{query}%',))
     else:
@@ -270,22 +296,23 @@ def search_api():
 
         try:
             cursor.execute('''
-                SELECT w.id, w.content, w.created_at, u.name as user_name
+                SELECT w.id, f.content, w.created_at, u.name as user_name
                 FROM weibos_fts f
-                JOIN weibos w ON CAST(f.id AS TEXT) = CAST(w.id AS TEXT)
+                JOIN weibos w ON w.id = CAST(f.id AS TEXT)
                 LEFT JOIN users u ON w.uid = u.uid
                 WHERE f.content MATCH ?
-                ORDER BY CAST(w.id AS INTEGER) DESC
+                ORDER BY w.id_int DESC
                 LIMIT 20
             ''', (clean_query,))
         except Exception as e:
             # 如果FTS查询失败，回退到LIKE查询
             cursor.execute('''
-                SELECT w.id, w.content, w.created_at, u.name as user_name
-                FROM weibos w
+                SELECT w.id, f.content, w.created_at, u.name as user_name
+                FROM weibos_fts f
+                JOIN weibos w ON w.id = CAST(f.id AS TEXT)
                 LEFT JOIN users u ON w.uid = u.uid
-                WHERE w.content LIKE ?
-                ORDER BY CAST(w.id AS INTEGER) DESC
+                WHERE f.content LIKE ?
+                ORDER BY w.id_int DESC
                 LIMIT 20
             ''', (f'%{query}%',))
 
@@ -308,20 +335,24 @@ def date_range():
     """按日期范围筛选微博"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    text_codec = codec.TextCodec.load(conn)
 
     # 获取日期参数
     start_date = request.args.get('start', '')
     end_date = request.args.get('end', '')
-    page = request.args.get('page', 1, type=int)
+    before = request.args.get('before')
+    after = request.args.get('after')
+    # 游标翻页时页码只用于显示
+    page = request.args.get('page', None if before or after else 1, type=int)
     per_page = 50
 
     # 如果没有提供日期，显示日期选择页面
     if not start_date or not end_date:
         # 获取最早和最晚的微博日期（按ID排序，ID越小越早）
-        cursor.execute('SELECT created_at FROM weibos ORDER BY CAST(id AS INTEGER) ASC LIMIT 1')
+        cursor.execute(queries.EARLIEST_CREATED_AT)
         min_row = cursor.fetchone()
 
-        cursor.execute('SELECT created_at FROM weibos ORDER BY CAST(id AS INTEGER) DESC LIMIT 1')
+        cursor.execute(queries.LATEST_CREATED_AT)
         max_row = cursor.fetchone()
 
         min_date = None
@@ -341,89 +372,26 @@ def date_range():
                              min_date=min_date,
                              max_date=max_date)
 
-    # 转换日期格式用于查询
+    # 日期按北京时间（微博的 +0800）解释，结束日期包含当天
     try:
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-        # 结束日期包含当天23:59:59
-        end_dt = end_dt.replace(hour=23, minute=59, second=59)
+        start_ts = int(datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=WEIBO_TZ).timestamp())
+        end_ts = int((datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=WEIBO_TZ)
+                      + timedelta(days=1)).timestamp())
     except:
         conn.close()
         return "日期格式错误", 400
 
-    # 查询该日期范围内的微博总数
-    cursor.execute('''
-        SELECT COUNT(*) FROM weibos w
-        WHERE datetime(substr(w.created_at, -4) || '-' ||
-              CASE substr(w.created_at, 5, 3)
-                  WHEN 'Jan' THEN '01'
-                  WHEN 'Feb' THEN '02'
-                  WHEN 'Mar' THEN '03'
-                  WHEN 'Apr' THEN '04'
-                  WHEN 'May' THEN '05'
-                  WHEN 'Jun' THEN '06'
-                  WHEN 'Jul' THEN '07'
-                  WHEN 'Aug' THEN '08'
-                  WHEN 'Sep' THEN '09'
-                  WHEN 'Oct' THEN '10'
-                  WHEN 'Nov' THEN '11'
-                  WHEN 'Dec' THEN '12'
-              END || '-' ||
-              substr('0' || substr(w.created_at, 9, 2), -2) || ' ' ||
-              substr(w.created_at, 12, 8))
-        BETWEEN ? AND ?
-    ''', (start_dt.strftime('%Y-%m-%d %H:%M:%S'), end_dt.strftime('%Y-%m-%d %H:%M:%S')))
+    # 查询该日期范围内的微博总数（created_ts 索引上的范围查询）
+    cursor.execute(queries.COUNT_BY_DATE, (start_ts, end_ts))
 
     total = cursor.fetchone()[0]
     total_pages = (total + per_page - 1) // per_page
-    offset = (page - 1) * per_page
-
-    # 查询该日期范围内的微博
-    cursor.execute('''
-        SELECT w.*, u.name as user_name
-        FROM weibos w
-        LEFT JOIN users u ON w.uid = u.uid
-        WHERE datetime(substr(w.created_at, -4) || '-' ||
-              CASE substr(w.created_at, 5, 3)
-                  WHEN 'Jan' THEN '01'
-                  WHEN 'Feb' THEN '02'
-                  WHEN 'Mar' THEN '03'
-                  WHEN 'Apr' THEN '04'
-                  WHEN 'May' THEN '05'
-                  WHEN 'Jun' THEN '06'
-                  WHEN 'Jul' THEN '07'
-                  WHEN 'Aug' THEN '08'
-                  WHEN 'Sep' THEN '09'
-                  WHEN 'Oct' THEN '10'
-                  WHEN 'Nov' THEN '11'
-                  WHEN 'Dec' THEN '12'
-              END || '-' ||
-              substr('0' || substr(w.created_at, 9, 2), -2) || ' ' ||
-              substr(w.created_at, 12, 8))
-        BETWEEN ? AND ?
-        ORDER BY CAST(w.id AS INTEGER) DESC
-        LIMIT ? OFFSET ?
-    ''', (start_dt.strftime('%Y-%m-%d %H:%M:%S'), end_dt.strftime('%Y-%m-%d %H:%M:%S'),
-          per_page, offset))
-
-    weibos = []
-    for row in cursor.fetchall():
-        weibo = dict(row)
-        # 转换图片路径
-        if weibo['pics']:
-            pic_urls = json.loads(weibo['pics'])
-            weibo['pics'] = convert_pics_to_local(weibo['id'], pic_urls, cursor)
-        else:
-            weibo['pics'] = []
-
-        # 解析转发微博
-        if weibo.get('retweeted_status'):
-            try:
-                weibo['retweeted_status'] = json.loads(weibo['retweeted_status'])
-            except:
-                weibo['retweeted_status'] = None
 
-        weibos.append(weibo)
+    # 查询该日期范围内的微博（按发布时间倒序，与ID顺序一致）
+    rows, newer_cursor, older_cursor = fetch_weibo_page(
+        cursor, ('w.created_ts', 'w.id_int'), per_page, page, before, after, bounds=(start_ts, end_ts))
+
+    weibos = hydrate_weibos(rows, cursor, text_codec)
 
     conn.close()
 
@@ -433,6 +401,8 @@ def date_range():
                          total=total,
                          page=page,
                          total_pages=total_pages,
+                         newer_cursor=newer_cursor,
+                         older_cursor=older_cursor,
                          start_date=start_date,
                          end_date=end_date,
                          datetimeformat=datetimeformat)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+账号池 - 多个微博账号（Cookie）分担接口请求，提高整体吞吐
+
+- 每个账号有独立的会话、独立的限速器（请求预算）和健康状态
+- 请求分给当前进行中请求最少的健康账号
+- 被限流（418/429 或被限流的空页）的账号隔离一段时间，连续被限流时隔离时间翻倍
+- Cookie 过期（401、跳转到登录页、ok=-100）的账号在本次运行中停用
+
+配置多个账号：
+
+    "accounts": [
+        {"name": "main", "cookie": "..."},
+        {"name": "backup", "cookie": "..."}
+    ]
+
+没有配置 accounts 时使用 cookie 作为唯一的账号。
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List
+
+import requests
+
+from rate_limiter import RateLimiter, THROTTLE_STATUS_CODES
+
+
+# 说明 Cookie 已失效的跳转地址
+LOGIN_URL_MARKERS = ('passport.weibo.com', 'login.sina.com.cn')
+
+
+class AccountPoolExhausted(RuntimeError):
+    """所有账号都已过期，无法继续请求"""
+
+
+class Account:
+    """单个账号：会话、限速器和健康状态"""
+
+    def __init__(self, name: str, cookie: str, session: requests.Session,
+                 rate_limiter: RateLimiter):
+        self.name = name
+        self.cookie = cookie
+        self.session = session
+        self.rate_limiter = rate_limiter
+
+        self.expired = False
+        self.quarantined_until = 0.0
+        self.consecutive_throttles = 0
+        self.in_flight = 0
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'quarantines': 0
+        }
+
+    def healthy(self, now: float) -> bool:
+        """当前是否可以使用"""
+        return not self.expired and now >= self.quarantined_until
+
+    def status(self, now: float) -> str:
+        """健康状态描述"""
+        if self.expired:
+            return '已过期'
+        if now < self.quarantined_until:
+            return f'隔离中（剩余 {self.quarantined_until - now:.0f}秒）'
+        return '正常'
+
+
+class AccountPool:
+    """账号池"""
+
+    def __init__(self, config: dict, create_session: Callable[[str], requests.Session]):
+        """create_session(cookie) 用于为每个账号创建会话"""
+        self.config = config
+        self.quarantine = float(config.get('account_quarantine', 60))
+        self.max_quarantine = max(self.quarantine, float(config.get('account_max_quarantine', 1800)))
+
+        accounts = config.get('accounts') or [{'name': 'default', 'cookie': config.get('cookie', '')}]
+        self.accounts: List[Account] = []
+        for i, item in enumerate(accounts):
+            cookie = item.get('cookie', '')
+            self.accounts.append(Account(item.get('name') or f'account{i + 1}', cookie,
+                                         create_session(cookie), RateLimiter(config)))
+
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def acquire(self) -> Account:
+        """取一个健康账号（进行中请求最少的优先）；全部被隔离时等待最早恢复的账号"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [account for account in self.accounts if account.healthy(now)]
+                if candidates:
+                    # 从上次的位置开始轮询，进行中请求数相同时依次分配
+                    count = len(self.accounts)
+                    order = {id(self.accounts[(self._next + i) % count]): i for i in range(count)}
+                    account = min(candidates, key=lambda a: (a.in_flight, order[id(a)]))
+                    self._next = (self.accounts.index(account) + 1) % count
+                    account.in_flight += 1
+                    account.stats['requests'] += 1
+                    return account
+
+                waiting = [account for account in self.accounts if not account.expired]
+                if not waiting:
+                    raise AccountPoolExhausted("所有账号的Cookie都已过期，请更新配置中的Cookie")
+                wait = min(account.quarantined_until for account in waiting) - now
+
+            time.sleep(max(wait, 0.01))
+
+    def release(self, account: Account):
+        """请求结束"""
+        with self._lock:
+            account.in_flight -= 1
+
+    def report(self, account: Account, response: requests.Response):
+        """根据响应判断账号是否过期或被限流"""
+        if self.is_expired_response(response):
+            self.mark_expired(account)
+        elif response.status_code in THROTTLE_STATUS_CODES:
+            self.mark_throttled(account, f"HTTP {response.status_code}")
+        elif response.status_code < 400:
+            with self._lock:
+                account.consecutive_throttles = 0
+
+    @staticmethod
+    def is_expired_response(response: requests.Response) -> bool:
+        """响应是否说明Cookie已失效"""
+        if response.status_code == 401:
+            return True
+        urls = [response.url] + [item.headers.get('Location', '') for item in response.history]
+        if any(marker in url for url in urls if url for marker in LOGIN_URL_MARKERS):
+            return True
+        content_type = response.headers.get('Content-Type', '')
+        return 'json' in content_type and b'"ok":-100' in response.content[:200].replace(b' ', b'')
+
+    def mark_expired(self, account: Account):
+        """Cookie过期：本次运行中不再使用该账号"""
+        with self._lock:
+            if account.expired:
+                return
+            account.expired = True
+        print(f"  账号 {account.name} 的Cookie已过期，已停用")
+
+    def mark_throttled(self, account: Account, reason: str = ''):
+        """被限流：隔离该账号一段时间（连续被限流时加倍）"""
+        with self._lock:
+            account.stats['throttled'] += 1
+            now = time.monotonic()
+            if now < account.quarantined_until:
+                # 隔离前已经发出的请求陆续返回的限流，不再重复惩罚
+                return
+            account.consecutive_throttles += 1
+            account.stats['quarantines'] += 1
+            duration = min(self.quarantine * 2 ** (account.consecutive_throttles - 1), self.max_quarantine)
+            account.quarantined_until = now + duration
+        print(f"  账号 {account.name} 被限流（{reason}），隔离 {duration:.0f}秒")
+
+    def get_stats(self) -> Dict[str, dict]:
+        """各账号的统计和健康状态"""
+        with self._lock:
+            now = time.monotonic()
+            return {account.name: dict(account.stats, status=account.status(now))
+                    for account in self.accounts}
+
+    def print_stats(self):
+        """打印各账号统计和限速统计"""
+        stats = self.get_stats()
+        print("账号统计:")
+        for account in self.accounts:
+            item = stats[account.name]
+            print(f"  {account.name}: 请求 {item['requests']} 次, 被限流 {item['throttled']} 次, "
+                  f"隔离 {item['quarantines']} 次, 状态: {item['status']}")
+            account.rate_limiter.print_stats()
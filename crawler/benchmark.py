@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫吞吐压测 - 用本地模拟接口（mock_server.py）跑一遍完整的 WeiboSpider
+
+在临时目录中新建数据库和图片目录，输出 页/秒、微博/秒、图片/秒 和数据库写入耗时，
+用于离线衡量爬虫的每一项性能改动：
+
+    python benchmark.py --users 4 --posts 2000 --concurrency 4 --latency 20
+
+加 --pages N 时爬取结束后再用 Flask 测试客户端把每种动态页面（app.py）各请求 N 次，输出 p50/p99 延迟：
+
+    python benchmark.py --users 4 --posts 2000 --pages 200 --quiet
+"""
+
+import argparse
+import contextlib
+import io
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from mock_server import MockWeiboData, MockWeiboServer
+from weibo_spider import WeiboSpider
+
+
+def build_config(args, server_url: str, work_dir: Path) -> dict:
+    """生成指向模拟服务器的爬虫配置"""
+    unlimited = {'rate': args.rate, 'burst': args.rate, 'max_rate': args.rate,
+                 'cooldown': args.cooldown, 'max_cooldown': args.cooldown * 8}
+    return {
+        'target_users': [{'uid': str(10001 + i), 'name': f'mock_user_{10001 + i}'}
+                         for i in range(args.users)],
+        'cookie': '',
+        'accounts': [{'name': f'mock{i + 1}', 'cookie': f'SUB=mock{i + 1}'}
+                     for i in range(args.accounts)],
+        'account_quarantine': args.cooldown,
+        'api_base': server_url,
+        'image_base': server_url,
+        'download_images': not args.no_images,
+        'image_path': str(work_dir / 'images'),
+        'database_path': str(work_dir / 'database.db'),
+        'response_cache': {'path': str(work_dir / 'response_cache.db')},
+        'max_retries': 3,
+        'concurrency': args.concurrency,
+        'image_workers': args.image_workers,
+        'commit_interval': args.commit_interval,
+        'rate_limits': {
+            'weibo.com': dict(unlimited),
+            'longtext': dict(unlimited),
+            'sinaimg.cn': dict(unlimited)
+        }
+    }
+
+
+def measure_pages(db_path: str, requests_per_page: int) -> Dict[str, dict]:
+    """用 Flask 测试客户端请求动态页面，返回每种页面的请求数和 p50/p99 延迟（毫秒）
+
+    列表页依次请求不同页码，详情页依次请求不同微博，避免只测到同一页
+    """
+    # 延迟导入：只有测页面延迟时才需要 Flask
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    import app as web_app
+    web_app.DB_PATH = db_path
+    client = web_app.app.test_client()
+
+    conn = sqlite3.connect(db_path)
+    uid, user_count = conn.execute(
+        'SELECT uid, COUNT(*) FROM weibos GROUP BY uid ORDER BY COUNT(*) DESC LIMIT 1').fetchone()
+    ids = [row[0] for row in conn.execute('SELECT id FROM weibos ORDER BY id_int')]
+    min_ts, max_ts = conn.execute('SELECT MIN(created_ts), MAX(created_ts) FROM weibos').fetchone()
+    conn.close()
+
+    tz = timezone(timedelta(hours=8))
+    start = datetime.fromtimestamp(min_ts, tz).strftime('%Y-%m-%d')
+    end = datetime.fromtimestamp(max_ts, tz).strftime('%Y-%m-%d')
+    pages = (len(ids) + 49) // 50
+    user_pages = (user_count + 49) // 50
+    routes = {
+        '首页': lambda i: f'/?page={i % pages + 1}',
+        '用户页': lambda i: f'/user/{uid}?page={i % user_pages + 1}',
+        '详情页': lambda i: f'/post/{ids[i * 7919 % len(ids)]}',
+        '日期筛选': lambda i: f'/date-range?start={start}&end={end}&page={i % pages + 1}'
+    }
+
+    results = {}
+    for name, url in routes.items():
+        latencies = []
+        for i in range(requests_per_page):
+            start_time = time.perf_counter()
+            response = client.get(url(i))
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url(i)} 返回 {response.status_code}")
+        latencies.sort()
+        results[name] = {
+            'requests': len(latencies),
+            'p50': latencies[int(0.5 * (len(latencies) - 1))],
+            'p99': latencies[int(0.99 * (len(latencies) - 1))]
+        }
+    return results
+
+
+def run_benchmark(args) -> dict:
+    """启动模拟服务器，运行爬虫并返回统计结果"""
+    data = MockWeiboData(posts_per_user=args.posts, image_size=args.image_size)
+    server = MockWeiboServer(data=data, latency=args.latency / 1000,
+                             error_rate=args.error_rate, throttle_rps=args.throttle_rps).start()
+    work_dir = Path(tempfile.mkdtemp(prefix='weibo-bench-'))
+
+    try:
+        config = build_config(args, server.url, work_dir)
+        spider = WeiboSpider(config=config)
+
+        output = io.StringIO()
+        start_time = time.time()
+        try:
+            with contextlib.redirect_stdout(output if args.quiet else sys.stdout):
+                spider.run()
+        finally:
+            spider.close()
+        elapsed = time.time() - start_time
+
+        conn = sqlite3.connect(config['database_path'])
+        total_weibos = conn.execute('SELECT COUNT(*) FROM weibos').fetchone()[0]
+        images = conn.execute('SELECT COUNT(*) FROM images WHERE downloaded = 1').fetchone()[0]
+        conn.close()
+
+        page_latency = measure_pages(config['database_path'], args.pages) if args.pages else {}
+
+        return {
+            'elapsed': elapsed,
+            'pages': spider.stats['pages'],
+            'weibos': total_weibos,
+            'images': images,
+            'db_write_time': spider.stats['db_write_time'],
+            'fetch': dict(spider.fetch_stats),
+            'stages': spider.pipeline_stats.get_stats(),
+            'bottleneck': spider.pipeline_stats.bottleneck(),
+            'server': dict(server.stats),
+            'page_latency': page_latency
+        }
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"保留压测数据: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_report(result: dict):
+    """打印压测报告"""
+    elapsed = result['elapsed'] or 1e-9
+    print("\n" + "=" * 50)
+    print("压测结果")
+    print("=" * 50)
+    print(f"总耗时: {elapsed:.2f}秒")
+    print(f"页面: {result['pages']} 页, {result['pages'] / elapsed:.1f} 页/秒")
+    print(f"微博: {result['weibos']} 条, {result['weibos'] / elapsed:.1f} 条/秒")
+    print(f"图片: {result['images']} 张, {result['images'] / elapsed:.1f} 张/秒")
+    print(f"数据库写入: {result['db_write_time']:.2f}秒 ({result['db_write_time'] / elapsed * 100:.1f}%)")
+    if result['fetch']:
+        print("列表请求: " + ", ".join(f"{status} {count}" for status, count in sorted(result['fetch'].items())))
+    for name, stage in result['stages'].items():
+        print(f"阶段 {name}: {stage['items']} 条, 线程 {stage['workers']}, "
+              f"平均 {stage['avg_latency'] * 1000:.1f}ms, 队列最深 {stage['max_depth']}, "
+              f"下游阻塞 {stage['blocked_time']:.2f}秒")
+    if result['bottleneck']:
+        print(f"瓶颈阶段: {result['bottleneck']}")
+    server = result['server']
+    print(f"模拟服务器: 请求 {server['requests']} 次, 错误 {server['errors']} 次, "
+          f"限流 {server['throttled']} 次, 传输 {server['bytes'] / 1024 / 1024:.1f} MB")
+    for name, latency in result['page_latency'].items():
+        print(f"页面 {name}: {latency['requests']} 次, p50 {latency['p50']:.1f}ms, p99 {latency['p99']:.1f}ms")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用本地模拟接口压测爬虫吞吐')
+    parser.add_argument('--users', type=int, default=2, help='模拟用户数')
+    parser.add_argument('--posts', type=int, default=500, help='每个用户的微博数')
+    parser.add_argument('--image-size', type=int, default=20 * 1024, help='图片大小（字节）')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟接口响应延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟接口返回500的概率')
+    parser.add_argument('--throttle-rps', type=float, default=0.0, help='模拟接口每秒请求上限')
+    parser.add_argument('--rate', type=float, default=1000.0, help='爬虫限速器每个端点的速率（次/秒）')
+    parser.add_argument('--cooldown', type=float, default=1.0, help='被限流后的冷却秒数')
+    parser.add_argument('--concurrency', type=int, default=1, help='并发爬取的用户数')
+    parser.add_argument('--accounts', type=int, default=1, help='模拟账号数（模拟接口按账号限流）')
+    parser.add_argument('--image-workers', type=int, default=4, help='图片下载线程数')
+    parser.add_argument('--commit-interval', type=int, default=1, help='每多少页提交一次')
+    parser.add_argument('--no-images', action='store_true', help='不下载图片')
+    parser.add_argument('--pages', type=int, default=0, help='爬取后每种动态页面请求的次数（0为不测）')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库和图片目录')
+    parser.add_argument('--quiet', action='store_true', help='不输出爬虫日志')
+    args = parser.parse_args()
+
+    print_report(run_benchmark(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+熔断器 - 某个主机连续出现临时错误（超时、连接失败、5xx）时暂停对它的请求
+
+- 连续失败 failure_threshold 次后熔断（打开），cooldown 秒内所有请求线程都等待，不再白白发请求
+- 暂停结束后只放行一个试探请求（半开）：成功则恢复，失败则再次熔断，暂停时间翻倍（不超过 max_cooldown）
+- 被限流、Cookie过期由账号池按账号处理（见 account_pool.py），不计入熔断
+
+配置：
+
+    "circuit_breaker": {"failure_threshold": 5, "cooldown": 30, "max_cooldown": 600}
+"""
+
+import threading
+import time
+from typing import Dict
+
+
+class _Circuit:
+    """单个主机的熔断状态"""
+
+    def __init__(self):
+        self.failures = 0  # 连续失败次数
+        self.open = False  # 是否处于熔断（或半开）状态
+        self.open_until = 0.0
+        self.probing = False  # 半开状态下是否已有试探请求在进行
+        self.consecutive_opens = 0
+        self.stats = {'failures': 0, 'opens': 0, 'wait_time': 0.0}
+
+
+class CircuitBreaker:
+    """按主机划分的熔断器，所有请求线程共享"""
+
+    # 等待其他线程的试探请求时的轮询间隔（秒）
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30, max_cooldown: float = 600):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = float(cooldown)
+        self.max_cooldown = max(self.cooldown, float(max_cooldown))
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'CircuitBreaker':
+        """按配置创建熔断器"""
+        options = config.get('circuit_breaker', {})
+        return cls(failure_threshold=options.get('failure_threshold', 5),
+                   cooldown=options.get('cooldown', 30),
+                   max_cooldown=options.get('max_cooldown', 600))
+
+    def _circuit(self, key: str) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        return circuit
+
+    def before_request(self, key: str) -> float:
+        """请求前调用：熔断中时等待，半开时只放行一个试探请求；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                circuit = self._circuit(key)
+                now = time.monotonic()
+                if not circuit.open:
+                    break
+                if now >= circuit.open_until and not circuit.probing:
+                    circuit.probing = True
+                    break
+                wait = circuit.open_until - now if now < circuit.open_until else self._POLL_INTERVAL
+
+            time.sleep(max(wait, 0.01))
+            waited += max(wait, 0.01)
+
+        if waited:
+            with self._lock:
+                circuit.stats['wait_time'] += waited
+        return waited
+
+    def record_success(self, key: str):
+        """请求成功（主机正常响应，包括被限流）"""
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit.failures = 0
+            if circuit.open:
+                circuit.open = False
+                circuit.probing = False
+                circuit.consecutive_opens = 0
+                recovered = True
+            else:
+                recovered = False
+        if recovered:
+            print(f"  熔断恢复: {key}")
+
+    def record_failure(self, key: str, reason: str = ''):
+        """请求出现临时错误；连续失败达到阈值（或试探请求失败）时熔断"""
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit.failures += 1
+            circuit.stats['failures'] += 1
+            if circuit.open and not circuit.probing:
+                # 熔断前已经发出的请求陆续失败，不重复熔断
+                return
+            if not circuit.probing and circuit.failures < self.failure_threshold:
+                return
+
+            circuit.consecutive_opens += 1
+            circuit.stats['opens'] += 1
+            duration = min(self.cooldown * 2 ** (circuit.consecutive_opens - 1), self.max_cooldown)
+            circuit.open = True
+            circuit.probing = False
+            circuit.open_until = time.monotonic() + duration
+            failures = circuit.failures
+        print(f"  熔断: {key} 连续失败 {failures} 次（{reason}），暂停请求 {duration:.0f}秒")
+
+    def get_stats(self) -> Dict[str, dict]:
+        """各主机的统计和当前状态"""
+        with self._lock:
+            now = time.monotonic()
+            return {key: dict(circuit.stats,
+                              state='熔断中' if circuit.open and now < circuit.open_until
+                              else '半开' if circuit.open else '正常')
+                    for key, circuit in self._circuits.items()}
+
+    def print_stats(self):
+        """打印熔断统计（没有失败时不输出）"""
+        stats = {key: item for key, item in self.get_stats().items() if item['failures']}
+        if not stats:
+            return
+        print("熔断统计:")
+        for key, item in sorted(stats.items()):
+            print(f"  {key}: 临时错误 {item['failures']} 次, 熔断 {item['opens']} 次, "
+                  f"等待 {item['wait_time']:.1f}秒, 状态: {item['state']}")
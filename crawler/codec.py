@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本列压缩 - 可选地把 weibos.content、weibos.pics 压缩后以 BLOB 保存
+
+- 压缩格式：b'WZ' + 4字节字典编号 + zlib 数据；字典编号为0表示不用字典
+- 微博大多只有一两百字，单独压缩效果有限；用自己的微博训练一个共享字典（zlib 的 zdict）
+  后短文本也能明显变小。字典按内容的 CRC32 编号保存在 codec_dictionaries 表中，只增不改，
+  合并数据库时一起复制，不会冲突
+- 解码对调用方透明：未压缩的旧数据仍是 TEXT，原样返回，新旧数据可以混存
+- 搜索走 weibos_fts 表（始终保存明文），不受压缩影响
+
+配置（默认关闭）：
+
+    "compression": {"enabled": true, "level": 6, "min_bytes": 64, "dictionary": true, "dictionary_size": 16384}
+
+字典越大压缩率越高，但每次解码都要先载入字典：32KB 字典的解码耗时约为 16KB 的两倍，默认取 16KB。
+
+命令：
+
+    python codec.py train       # 用最近的微博训练新字典
+    python codec.py compress    # 按当前配置重新编码已有数据并整理数据库
+    python codec.py benchmark   # 对比 不压缩 / zlib / zlib+字典 的大小和每页解码耗时
+"""
+
+import argparse
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import storage
+from config_loader import load_config, resolve_project_path
+
+
+MAGIC = b'WZ'
+_HEADER = struct.Struct('>2sI')
+
+# weibos 表中按本模块编码的列
+ENCODED_COLUMNS = ('content', 'pics')
+
+# zlib 的窗口为32KB，字典超过这个长度的部分用不上
+MAX_DICTIONARY_SIZE = 32 * 1024
+DEFAULT_DICTIONARY_SIZE = 16 * 1024
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """创建字典表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS codec_dictionaries (
+            id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            samples INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def dictionary_id(data: bytes) -> int:
+    """字典编号：内容的 CRC32（0 保留给不用字典的数据）"""
+    return zlib.crc32(data) or 1
+
+
+def train_dictionary(samples: List[str], size: int = DEFAULT_DICTIONARY_SIZE) -> bytes:
+    """用一批微博训练共享字典
+
+    zlib 的字典就是一段"预先见过"的文本：出现在字典中的片段压缩时可以直接引用。
+    这里把去重后的样本拼接起来，截取最后 size 字节（zlib 对靠近末尾的内容引用更短，新的样本放在末尾）
+    """
+    seen = set()
+    parts = []
+    for text in samples:
+        if text and text not in seen:
+            seen.add(text)
+            parts.append(text.encode('utf-8'))
+    return b'\n'.join(reversed(parts))[-min(size, MAX_DICTIONARY_SIZE):]
+
+
+class TextCodec:
+    """文本列的编码器/解码器；解码只需要字典表，编码时按配置决定是否压缩"""
+
+    def __init__(self, dictionaries: Optional[Dict[int, bytes]] = None, enabled: bool = False,
+                 level: int = 6, min_bytes: int = 64, use_dictionary: bool = True,
+                 dictionary_size: int = DEFAULT_DICTIONARY_SIZE):
+        self.dictionaries = dict(dictionaries or {})
+        self.enabled = enabled
+        self.level = int(level)
+        self.min_bytes = int(min_bytes)
+        self.use_dictionary = use_dictionary
+        self.dictionary_size = int(dictionary_size)
+        # 编码使用最新的字典（load 时按创建顺序传入）
+        self.dictionary_id = next(reversed(self.dictionaries), 0) if use_dictionary else 0
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, config: Optional[dict] = None) -> 'TextCodec':
+        """从数据库加载字典；config 为 None 时只用于解码"""
+        options = (config or {}).get('compression', {})
+        dictionaries = {}
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'codec_dictionaries'").fetchone()
+        if exists:
+            for row in conn.execute('SELECT id, data FROM codec_dictionaries ORDER BY created_at, rowid'):
+                dictionaries[row[0]] = bytes(row[1])
+        return cls(dictionaries,
+                   enabled=options.get('enabled', False),
+                   level=options.get('level', 6),
+                   min_bytes=options.get('min_bytes', 64),
+                   use_dictionary=options.get('dictionary', True),
+                   dictionary_size=options.get('dictionary_size', DEFAULT_DICTIONARY_SIZE))
+
+    def add_dictionary(self, conn: sqlite3.Connection, data: bytes, samples: int = 0) -> int:
+        """保存一个新字典并用于之后的编码，返回字典编号"""
+        ensure_schema(conn)
+        dict_id = dictionary_id(data)
+        conn.execute('INSERT OR IGNORE INTO codec_dictionaries (id, data, samples) VALUES (?, ?, ?)',
+                     (dict_id, data, samples))
+        conn.commit()
+        self.dictionaries.pop(dict_id, None)
+        self.dictionaries[dict_id] = data
+        if self.use_dictionary:
+            self.dictionary_id = dict_id
+        return dict_id
+
+    def compress(self, text: str, dict_id: Optional[int] = None) -> bytes:
+        """压缩（不判断是否值得）"""
+        dict_id = self.dictionary_id if dict_id is None else dict_id
+        if dict_id:
+            compressor = zlib.compressobj(self.level, zdict=self.dictionaries[dict_id])
+        else:
+            compressor = zlib.compressobj(self.level)
+        data = compressor.compress(text.encode('utf-8')) + compressor.flush()
+        return _HEADER.pack(MAGIC, dict_id) + data
+
+    def encode(self, text: Optional[str]) -> Union[str, bytes, None]:
+        """写库前编码：未启用、文本太短或压缩后没有变小时原样返回"""
+        if not self.enabled or not text or len(text.encode('utf-8')) < self.min_bytes:
+            return text
+        data = self.compress(text)
+        return data if len(data) < len(text.encode('utf-8')) else text
+
+    def decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        """读库后解码；未压缩的值原样返回"""
+        if not isinstance(value, bytes) or not value.startswith(MAGIC):
+            return value
+        _, dict_id = _HEADER.unpack_from(value)
+        if dict_id:
+            decompressor = zlib.decompressobj(zdict=self.dictionaries[dict_id])
+        else:
+            decompressor = zlib.decompressobj()
+        data = decompressor.decompress(value[_HEADER.size:]) + decompressor.flush()
+        return data.decode('utf-8')
+
+    def decode_row(self, weibo: Dict) -> Dict:
+        """就地解码一行微博中压缩的列"""
+        for column in ENCODED_COLUMNS:
+            if column in weibo:
+                weibo[column] = self.decode(weibo[column])
+        return weibo
+
+    def register(self, conn: sqlite3.Connection, name: str = 'weibo_text'):
+        """注册SQL函数 weibo_text(列)，在SQL中解码（如合并数据库时）"""
+        conn.create_function(name, 1, self.decode, deterministic=True)
+
+
+def sample_contents(conn: sqlite3.Connection, codec: TextCodec, limit: int = 2000) -> List[str]:
+    """取最近入库的微博正文作为训练样本"""
+    rows = conn.execute('SELECT content FROM weibos ORDER BY rowid DESC LIMIT ?', (limit,)).fetchall()
+    return [codec.decode(row[0]) for row in rows]
+
+
+def train(conn: sqlite3.Connection, codec: TextCodec, limit: int = 2000) -> Optional[int]:
+    """用库中最近的微博训练新字典，返回字典编号；样本太少时返回None"""
+    samples = sample_contents(conn, codec, limit)
+    if len(samples) < 100:
+        return None
+    return codec.add_dictionary(conn, train_dictionary(samples, codec.dictionary_size), len(samples))
+
+
+def recompress(conn: sqlite3.Connection, codec: TextCodec, batch: int = 1000) -> int:
+    """按当前设置重新编码全部微博的压缩列（关闭压缩时即解压），返回改动的行数"""
+    changed = 0
+    last_rowid = 0
+    columns = ', '.join(ENCODED_COLUMNS)
+    assignments = ', '.join(f'{column} = ?' for column in ENCODED_COLUMNS)
+    while True:
+        rows = conn.execute(f'SELECT rowid, {columns} FROM weibos WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                            (last_rowid, batch)).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        updates = []
+        for rowid, *values in rows:
+            encoded = [codec.encode(codec.decode(value)) for value in values]
+            if encoded != values:
+                updates.append((*encoded, rowid))
+        conn.executemany(f'UPDATE weibos SET {assignments} WHERE rowid = ?', updates)
+        conn.commit()
+        changed += len(updates)
+    return changed
+
+
+def benchmark(conn: sqlite3.Connection, codec: TextCodec, limit: int = 5000, page_size: int = 50) -> Dict:
+    """对比三种编码的总大小和每页（page_size 条）解码耗时"""
+    rows = conn.execute(f'SELECT {", ".join(ENCODED_COLUMNS)} FROM weibos ORDER BY rowid DESC LIMIT ?',
+                        (limit,)).fetchall()
+    values = [codec.decode(value) or '' for row in rows for value in row]
+    if not values:
+        return {}
+
+    dictionary = (train_dictionary(sample_contents(conn, codec), codec.dictionary_size)
+                  if len(rows) >= 100 else b'')
+    modes = {'不压缩': None, 'zlib': 0}
+    if dictionary:
+        modes['zlib+字典'] = dictionary_id(dictionary)
+    trial = TextCodec({modes['zlib+字典']: dictionary} if dictionary else {}, enabled=True,
+                      level=codec.level, min_bytes=codec.min_bytes)
+
+    raw_size = sum(len(value.encode('utf-8')) for value in values)
+    results = {}
+    for name, dict_id in modes.items():
+        if dict_id is None:
+            encoded = values
+        else:
+            trial.dictionary_id = dict_id
+            encoded = [trial.encode(value) for value in values]
+        size = sum(len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+                   for value in encoded)
+        start_time = time.perf_counter()
+        for value in encoded:
+            trial.decode(value)
+        elapsed = time.perf_counter() - start_time
+        pages = len(rows) / page_size
+        results[name] = {
+            'size': size,
+            'ratio': size / raw_size if raw_size else 1.0,
+            'decode_ms_per_page': elapsed / pages * 1000 if pages else 0.0
+        }
+    results['rows'] = len(rows)
+    return results
+
+
+def main():
+    """训练字典、重新编码已有数据或对比压缩效果"""
+    parser = argparse.ArgumentParser(description='文本列压缩')
+    parser.add_argument('command', choices=['train', 'compress', 'benchmark'])
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    db_path = resolve_project_path(config.get('database_path', '../data/database.db'))
+    conn = storage.connect(db_path, config)
+    try:
+        ensure_schema(conn)
+        codec = TextCodec.load(conn, config)
+
+        if args.command == 'train':
+            dict_id = train(conn, codec)
+            if dict_id is None:
+                print("微博太少（不到100条），暂不训练字典")
+            else:
+                print(f"已训练字典 {dict_id}（{len(codec.dictionaries[dict_id]) / 1024:.1f} KB）")
+
+        elif args.command == 'compress':
+            if codec.enabled and codec.use_dictionary and not codec.dictionaries:
+                train(conn, codec)
+            size_before = db_path.stat().st_size
+            changed = recompress(conn, codec)
+            storage.vacuum(conn)
+            print(f"{'压缩' if codec.enabled else '解压'} {changed} 条微博，数据库大小: "
+                  f"{size_before / 1024 / 1024:.1f} MB -> {db_path.stat().st_size / 1024 / 1024:.1f} MB")
+
+        else:
+            results = benchmark(conn, codec)
+            if not results:
+                print("数据库中没有微博")
+                return
+            print(f"最近 {results.pop('rows')} 条微博的 {' / '.join(ENCODED_COLUMNS)} 列:")
+            for name, item in results.items():
+                print(f"  {name}: {item['size'] / 1024:.1f} KB（{item['ratio'] * 100:.0f}%），"
+                      f"每页解码 {item['decode_ms_per_page']:.2f}ms")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -31,10 +31,52 @@ def load_config(config_path: str = 'config.json') -> Dict[str, Any]:
             ],
             'download_images': os.getenv('DOWNLOAD_IMAGES', 'true').lower() == 'true',
             'image_path': os.getenv('IMAGE_PATH', '../data/images'),
+            'image_workers': int(os.getenv('IMAGE_WORKERS', '4')),
             'database_path': os.getenv('DATABASE_PATH', '../data/database.db'),
             'delay': int(os.getenv('CRAWL_DELAY', '2')),
+            'concurrency': int(os.getenv('CRAWL_CONCURRENCY', '1')),
+            'longtext_workers': int(os.getenv('LONGTEXT_WORKERS', '4')),
+            'pipeline': {
+                'queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', '4')),
+                'enrich_workers': int(os.getenv('PIPELINE_ENRICH_WORKERS', '2'))
+            },
             'max_retries': int(os.getenv('MAX_RETRIES', '3')),
+            'transient_retries': int(os.getenv('TRANSIENT_RETRIES', '2')),
+            'circuit_breaker': {
+                'failure_threshold': int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+                'cooldown': int(os.getenv('CIRCUIT_COOLDOWN', '30')),
+                'max_cooldown': int(os.getenv('CIRCUIT_MAX_COOLDOWN', '600'))
+            },
+            'response_cache': {
+                'enabled': os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+                'path': os.getenv('RESPONSE_CACHE_PATH', '../data/response_cache.db'),
+                'max_mb': int(os.getenv('RESPONSE_CACHE_MAX_MB', '64')),
+                'ttl': {
+                    'profile': int(os.getenv('RESPONSE_CACHE_PROFILE_TTL', '21600')),
+                    'longtext': int(os.getenv('RESPONSE_CACHE_LONGTEXT_TTL', '2592000'))
+                }
+            },
+            'compression': {
+                'enabled': os.getenv('COMPRESSION_ENABLED', 'false').lower() == 'true',
+                'level': int(os.getenv('COMPRESSION_LEVEL', '6')),
+                'min_bytes': int(os.getenv('COMPRESSION_MIN_BYTES', '64')),
+                'dictionary': os.getenv('COMPRESSION_DICTIONARY', 'true').lower() == 'true',
+                'dictionary_size': int(os.getenv('COMPRESSION_DICTIONARY_SIZE', '16384'))
+            },
+            'storage': {
+                'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+                'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '30')),
+                'cache_mb': int(os.getenv('SQLITE_CACHE_MB', '64')),
+                'mmap_mb': int(os.getenv('SQLITE_MMAP_MB', '256')),
+                'checkpoint_interval': int(os.getenv('SQLITE_CHECKPOINT_INTERVAL', '60'))
+            },
             'force_update': os.getenv('FORCE_UPDATE', 'false').lower() == 'true',
+            'refresh_days': int(os.getenv('REFRESH_DAYS', '7')),
+            'commit_interval': int(os.getenv('COMMIT_INTERVAL', '1')),
+            'account_quarantine': int(os.getenv('ACCOUNT_QUARANTINE', '60')),
+            'work_queue_path': os.getenv('WORK_QUEUE_PATH', '../data/work_queue.db'),
+            'lease_seconds': int(os.getenv('LEASE_SECONDS', '300')),
+            'queue_max_attempts': int(os.getenv('QUEUE_MAX_ATTEMPTS', '3')),
             'scheduler': {
                 'active_start_hour': int(os.getenv('SCHEDULER_START_HOUR', '7')),
                 'active_end_hour': int(os.getenv('SCHEDULER_END_HOUR', '24')),
@@ -44,6 +86,14 @@ def load_config(config_path: str = 'config.json') -> Dict[str, Any]:
             }
         }
 
+        # 多账号：WEIBO_COOKIE_2、WEIBO_COOKIE_3 ... 依次加入账号池
+        cookies = [config['cookie']]
+        while os.getenv(f'WEIBO_COOKIE_{len(cookies) + 1}'):
+            cookies.append(os.getenv(f'WEIBO_COOKIE_{len(cookies) + 1}'))
+        if len(cookies) > 1:
+            config['accounts'] = [{'name': f'account{i + 1}', 'cookie': cookie}
+                                  for i, cookie in enumerate(cookies)]
+
         return config
 
     # 方式2：从配置文件加载（本地开发）
@@ -59,6 +109,15 @@ def load_config(config_path: str = 'config.json') -> Dict[str, Any]:
             return json.load(f)
 
 
+def resolve_project_path(path_str: str) -> Path:
+    """解析配置中的路径：相对路径相对于项目根目录（crawler的上级目录）"""
+    path = Path(path_str)
+    if not path.is_absolute():
+        project_root = Path(__file__).parent.parent
+        path = project_root / path_str.lstrip('../')
+    return path
+
+
 def save_config_template(output_path: str = 'config.json.example'):
     """生成配置文件模板"""
     template = {
@@ -71,10 +130,60 @@ def save_config_template(output_path: str = 'config.json.example'):
         "cookie": "YOUR_WEIBO_COOKIE_HERE",
         "download_images": True,
         "image_path": "../data/images",
+        "image_workers": 4,
+        "image_queue_size": 500,
+        "image_max_retries": 3,
         "database_path": "../data/database.db",
         "delay": 2,
+        "concurrency": 1,
+        "longtext_workers": 4,
+        "longtext_max_attempts": 5,
+        "pipeline": {
+            "queue_size": 4,
+            "enrich_workers": 2
+        },
+        "rate_limits": {
+            "weibo.com": {"rate": 0.5, "max_rate": 2.0},
+            "longtext": {"rate": 0.5, "max_rate": 2.0},
+            "sinaimg.cn": {"rate": 5.0, "max_rate": 20.0}
+        },
         "max_retries": 3,
+        "transient_retries": 2,
+        "circuit_breaker": {
+            "failure_threshold": 5,
+            "cooldown": 30,
+            "max_cooldown": 600
+        },
+        "response_cache": {
+            "enabled": True,
+            "path": "../data/response_cache.db",
+            "max_mb": 64,
+            "ttl": {
+                "profile": 21600,
+                "longtext": 2592000
+            }
+        },
+        "compression": {
+            "enabled": False,
+            "level": 6,
+            "min_bytes": 64,
+            "dictionary": True,
+            "dictionary_size": 16384
+        },
+        "storage": {
+            "journal_mode": "wal",
+            "busy_timeout": 30,
+            "cache_mb": 64,
+            "mmap_mb": 256,
+            "checkpoint_interval": 60
+        },
         "force_update": False,
+        "refresh_days": 7,
+        "commit_interval": 1,
+        "account_quarantine": 60,
+        "work_queue_path": "../data/work_queue.db",
+        "lease_seconds": 300,
+        "queue_max_attempts": 3,
         "scheduler": {
             "active_start_hour": 7,
             "active_end_hour": 24,
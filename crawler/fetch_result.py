@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+接口请求结果分类 - 区分"没有更多微博"和各种失败，避免把失败误当作爬完
+
+- ok: 成功，有数据
+- end: 没有更多微博了（正常结束）
+- throttled: 被限流（418/429），重试后仍被限流
+- auth_expired: Cookie过期（所有账号都已过期）
+- transient: 临时错误（超时、连接失败、5xx、响应不是JSON），稍后重试通常能恢复
+- error: 接口返回的其他错误（4xx、ok 不为 1），重试也不会恢复
+
+爬取时 end 以外的失败都会抛出 FetchError：不推进高水位、不删除断点，下次从断点继续。
+"""
+
+from typing import Dict, List, Optional
+
+
+OK = 'ok'
+END = 'end'
+THROTTLED = 'throttled'
+AUTH_EXPIRED = 'auth_expired'
+TRANSIENT = 'transient'
+ERROR = 'error'
+
+# 各类结果的中文名称（统计输出用）
+STATUS_NAMES = {
+    OK: '成功',
+    END: '到底',
+    THROTTLED: '被限流',
+    AUTH_EXPIRED: 'Cookie过期',
+    TRANSIENT: '临时错误',
+    ERROR: '接口错误'
+}
+
+
+class FetchError(RuntimeError):
+    """请求失败（不是正常的"没有更多数据"），爬取应当中止并保留断点"""
+
+    def __init__(self, result: 'FetchResult'):
+        super().__init__(str(result))
+        self.result = result
+
+
+class FetchResult:
+    """一次接口请求的分类结果"""
+
+    def __init__(self, status: str, weibos: Optional[List[Dict]] = None, message: str = '',
+                 http_status: Optional[int] = None, total: Optional[int] = None):
+        self.status = status
+        self.weibos = weibos or []
+        self.message = message
+        self.http_status = http_status
+        # 接口返回的微博总数（微博列表请求才有）
+        self.total = total
+
+    @property
+    def ok(self) -> bool:
+        """成功拿到数据，或正常到底"""
+        return self.status in (OK, END)
+
+    def raise_for_error(self) -> 'FetchResult':
+        """失败时抛出 FetchError，否则返回自身"""
+        if not self.ok:
+            raise FetchError(self)
+        return self
+
+    def __str__(self) -> str:
+        text = STATUS_NAMES.get(self.status, self.status)
+        if self.http_status:
+            text += f"（HTTP {self.http_status}）"
+        if self.message:
+            text += f": {self.message}"
+        return text
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片下载池 - 在后台并发下载 images 表中待下载的图片
+
+爬虫保存微博时只向 images 表写入 downloaded = 0 的记录并放入队列，
+由本模块的下载线程负责实际的 HTTP 下载和状态回写。
+图片保存在内容寻址仓库中（见 image_store.py），同一张图片只下载一次。
+也可以单独运行，补下载历史上失败的图片：
+
+    python image_downloader.py [--workers 4] [--limit 1000]
+"""
+
+import argparse
+import hashlib
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import image_store
+import storage
+from config_loader import load_config, resolve_project_path
+from rate_limiter import RateLimiter
+
+
+class DownloadError(Exception):
+    """下载结果校验失败"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ImageDownloader:
+    """后台图片下载池"""
+
+    # 队列结束标记
+    _STOP = None
+
+    # 允许保存的内容类型
+    ALLOWED_CONTENT_TYPES = ('image/', 'video/', 'application/octet-stream')
+
+    # 按图片键分段加锁，避免两个线程同时下载同一张图片
+    _KEY_LOCK_STRIPES = 64
+
+    def __init__(self, config: dict, db_path: Path,
+                 session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        """初始化下载池（不会立即启动线程）"""
+        self.config = config
+        self.db_path = db_path
+        self.session = session or self._create_session()
+        self.rate_limiter = rate_limiter or RateLimiter(config)
+
+        self.image_dir = resolve_project_path(config.get('image_path', '../data/images'))
+        self.num_workers = max(1, int(config.get('image_workers', 4)))
+        self.max_retries = max(0, int(config.get('image_max_retries', 3)))
+
+        # 有界队列：队列满时 enqueue 会阻塞，避免爬虫远远跑在下载前面
+        self.queue = queue.Queue(maxsize=max(1, int(config.get('image_queue_size', 500))))
+
+        self._threads = []
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(self._KEY_LOCK_STRIPES)]
+        self._start_time = None
+        self._end_time = None
+        # 作为爬虫流水线的图片阶段时，由爬虫设置（见 pipeline.py）：
+        # stage_stats 记录队列深度和每张图片的耗时，upstream_stats 记录入队时因队列已满而等待的时间
+        self.stage_stats = None
+        self.upstream_stats = None
+        self.stats = {
+            'queued': 0,
+            'downloaded': 0,
+            'skipped': 0,
+            'deduped': 0,
+            'failed': 0,
+            'retries': 0,
+            'bytes': 0
+        }
+
+    def _create_session(self) -> requests.Session:
+        """创建带重试机制的会话（单独运行时使用）"""
+        session = requests.Session()
+        retry = Retry(
+            total=self.config.get('max_retries', 3),
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=16)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'https://weibo.com'
+        })
+        return session
+
+    @property
+    def running(self) -> bool:
+        """下载线程是否已启动"""
+        return bool(self._threads)
+
+    def start(self):
+        """启动下载线程"""
+        if self.running:
+            return
+
+        self._start_time = time.time()
+        self._end_time = None
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f'image-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, key: str, url: str):
+        """加入下载队列（队列满时阻塞）；下载完成后回写所有引用该图片键的行"""
+        if not self.running:
+            self.start()
+        start_time = time.time()
+        if not self._put((key, url)):
+            raise RuntimeError("图片下载线程已全部退出，无法继续加入下载队列")
+        if self.upstream_stats is not None:
+            self.upstream_stats.record_blocked(time.time() - start_time)
+        with self._lock:
+            self.stats['queued'] += 1
+        if self.stage_stats is not None:
+            self.stage_stats.observe_depth(self.queue.qsize())
+
+    def enqueue_pending(self, limit: Optional[int] = None) -> int:
+        """将数据库中所有未下载的图片加入队列（同一图片只加入一次），返回加入数量"""
+        conn = storage.connect(self.db_path, self.config)
+        try:
+            image_store.ensure_schema(conn)
+            query = '''
+                SELECT store_key, MIN(url) FROM images
+                WHERE downloaded = 0 AND url IS NOT NULL
+                GROUP BY store_key ORDER BY MIN(id)
+            '''
+            params = []
+            if limit:
+                query += ' LIMIT ?'
+                params.append(limit)
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+        for key, url in rows:
+            self.enqueue(key, url)
+        return len(rows)
+
+    def close(self):
+        """等待队列中的图片全部处理完毕并停止线程"""
+        if not self.running:
+            return
+
+        for _ in self._threads:
+            if not self._put(self._STOP):
+                # 下载线程都已退出，没有线程会再取队列，剩余任务留在数据库中下次补下载
+                break
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._end_time = time.time()
+
+    def _put(self, item) -> bool:
+        """放入队列，队列满时等待；下载线程全部退出（不会再有人取队列）时返回False，避免永远阻塞"""
+        while True:
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if not any(thread.is_alive() for thread in self._threads):
+                    return False
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        """图片键对应的锁"""
+        return self._key_locks[hash(key) % self._KEY_LOCK_STRIPES]
+
+    def download(self, url: str) -> str:
+        """下载单张图片到仓库，返回相对路径（从images目录开始）"""
+        return self.fetch(url)[0]
+
+    def fetch(self, url: str) -> Tuple[str, str, int]:
+        """下载单张图片到仓库，返回 (相对路径, SHA-256, 字节数)
+
+        分块流式写入 .partial 目录下的临时文件，同时计算内容哈希，内存占用与文件大小无关；
+        校验类型和大小后原子重命名为仓库中的最终文件，内容相同的文件已存在时直接丢弃；
+        中断留下的临时文件下次用 HTTP Range 续传。
+        """
+        key = image_store.store_key(url)
+        part_dir = self.image_dir / image_store.PARTIAL_DIR
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part_path = part_dir / (key + '.part')
+        offset = part_path.stat().st_size if part_path.exists() else 0
+
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        self.rate_limiter.acquire('sinaimg.cn')
+        start_time = time.time()
+        try:
+            response = self.session.get(url, timeout=30, stream=True, headers=headers)
+        except requests.RequestException:
+            self.rate_limiter.record_error('sinaimg.cn')
+            raise
+        self.rate_limiter.record('sinaimg.cn', response.status_code, time.time() - start_time)
+
+        with response:
+            if response.status_code == 416:
+                # 临时文件和服务器上的文件对不上，丢弃后重新下载
+                part_path.unlink(missing_ok=True)
+                raise DownloadError(f"续传范围无效 {url}")
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type and not content_type.startswith(self.ALLOWED_CONTENT_TYPES):
+                part_path.unlink(missing_ok=True)
+                raise DownloadError(f"内容类型不是图片或视频: {content_type}", retryable=False)
+
+            chunk_size = int(self.config.get('image_chunk_size', 64 * 1024))
+            hasher = hashlib.sha256()
+            if response.status_code == 206 and offset:
+                mode = 'ab'
+                # 续传时先把已下载部分计入哈希
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        hasher.update(chunk)
+            else:
+                # 服务器不支持续传，从头开始
+                mode = 'wb'
+                offset = 0
+
+            content_length = response.headers.get('Content-Length')
+            expected_size = offset + int(content_length) if content_length else None
+
+            written = 0
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+
+        with self._lock:
+            self.stats['bytes'] += written
+
+        # 大小不符说明传输中断，保留临时文件以便续传
+        actual_size = part_path.stat().st_size
+        if expected_size is not None and actual_size != expected_size:
+            raise DownloadError(f"文件大小不符 {url}: {actual_size}/{expected_size}")
+        if actual_size == 0:
+            part_path.unlink(missing_ok=True)
+            raise DownloadError(f"下载内容为空 {url}")
+
+        digest = hasher.hexdigest()
+        relative_path = image_store.store_relative_path(digest, key)
+        local_path = image_store.absolute_path(self.image_dir, relative_path)
+        if local_path.exists():
+            # 内容相同的图片已经在仓库中（不同的 pic_id）
+            part_path.unlink(missing_ok=True)
+            with self._lock:
+                self.stats['deduped'] += 1
+        else:
+            image_store.place_file(part_path, local_path, move=True)
+        return relative_path, digest, actual_size
+
+    def _download_with_retry(self, url: str) -> Optional[Tuple[str, str, int]]:
+        """下载图片，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.fetch(url)
+            except requests.HTTPError as e:
+                # 4xx 错误重试也没有用
+                status = e.response.status_code if e.response is not None else 0
+                if 400 <= status < 500 and status not in (408, 418, 429):
+                    print(f"下载图片失败 {url}: {str(e)}")
+                    return None
+                error = e
+            except DownloadError as e:
+                if not e.retryable:
+                    print(f"下载图片失败 {url}: {str(e)}")
+                    return None
+                error = e
+            except Exception as e:
+                error = e
+
+            if attempt < self.max_retries:
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(2 ** attempt)
+
+        print(f"下载图片失败 {url}: {str(error)}")
+        return None
+
+    def _worker(self):
+        """下载线程：从队列取任务，已在仓库中的直接回写，否则下载后回写"""
+        conn = storage.connect(self.db_path, self.config)
+        try:
+            while True:
+                task = self.queue.get()
+                if task is self._STOP:
+                    break
+
+                key, url = task
+                start_time = time.time()
+                stored = result = None
+                with self._key_lock(key):
+                    try:
+                        stored = image_store.lookup(conn, self.image_dir, key)
+                        if stored:
+                            conn.execute('UPDATE images SET local_path = ?, downloaded = 1 '
+                                         'WHERE store_key = ? AND downloaded = 0', (stored, key))
+                        else:
+                            result = self._download_with_retry(url)
+                            if result:
+                                image_store.record_stored(conn, key, *result)
+                        conn.commit()
+                    except Exception as e:
+                        # 回写失败（如数据库被锁）只算这张图片失败，线程继续处理队列，
+                        # 图片保持 downloaded = 0，下次补下载
+                        print(f"保存图片状态失败 {url}: {str(e)}")
+                        conn.rollback()
+                        stored = result = None
+
+                with self._lock:
+                    if stored:
+                        self.stats['skipped'] += 1
+                    elif not result:
+                        self.stats['failed'] += 1
+                    else:
+                        self.stats['downloaded'] += 1
+                if self.stage_stats is not None:
+                    self.stage_stats.record(time.time() - start_time)
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict:
+        """获取吞吐统计"""
+        with self._lock:
+            stats = dict(self.stats)
+
+        if self._start_time:
+            end_time = self._end_time or time.time()
+            elapsed = end_time - self._start_time
+        else:
+            elapsed = 0.0
+
+        stats['elapsed'] = elapsed
+        stats['images_per_sec'] = stats['downloaded'] / elapsed if elapsed > 0 else 0.0
+        stats['mb_per_sec'] = stats['bytes'] / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def print_stats(self):
+        """打印下载统计"""
+        stats = self.get_stats()
+        print(f"图片下载统计:")
+        print(f"  入队: {stats['queued']} 张")
+        print(f"  下载: {stats['downloaded']} 张, 已在仓库: {stats['skipped']} 张, "
+              f"内容重复: {stats['deduped']} 张, 失败: {stats['failed']} 张, "
+              f"重试: {stats['retries']} 次")
+        print(f"  耗时: {stats['elapsed']:.1f}秒, "
+              f"{stats['images_per_sec']:.2f} 张/秒, {stats['mb_per_sec']:.2f} MB/秒")
+
+
+def main():
+    """单独运行：补下载数据库中未下载的图片"""
+    parser = argparse.ArgumentParser(description='补下载未下载成功的微博图片')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--workers', type=int, help='下载线程数')
+    parser.add_argument('--limit', type=int, help='最多处理的图片数')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.workers:
+        config['image_workers'] = args.workers
+
+    db_path = resolve_project_path(config.get('database_path', '../data/database.db'))
+    downloader = ImageDownloader(config, db_path)
+    if config.get('cookie'):
+        downloader.session.headers['Cookie'] = config['cookie']
+
+    print("=" * 50)
+    print("补下载图片")
+    print("=" * 50)
+
+    count = downloader.enqueue_pending(limit=args.limit)
+    print(f"待下载图片: {count} 张")
+    downloader.close()
+    downloader.print_stats()
+    downloader.rate_limiter.print_stats()
+
+
+if __name__ == '__main__':
+    main()
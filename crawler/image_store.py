@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址的图片仓库 - 同一张图片只下载、只保存一次
+
+- 下载前按图片键（URL中的文件名，即 pic_id + 扩展名）去重：
+  image_store 表中已有本地文件的图片不会再次下载，转发和多条微博共用同一张图
+- 下载后按内容的 SHA-256 存放到 images/store/{sha256前两位}/{sha256}{扩展名}，
+  不同 pic_id 但内容相同的图片也只保存一份
+- image_store.ref_count 记录 images 表中引用该图片的行数
+
+旧版本按 images/{weibo_id}/{文件名} 保存的图片，用本模块迁移并去重：
+
+    python image_store.py [--dry-run]
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import storage
+from config_loader import load_config, resolve_project_path
+
+
+# 仓库目录（相对于 images 目录）
+STORE_DIR = 'store'
+# 下载中的临时文件目录（相对于 images 目录，生成静态网站时不复制）
+PARTIAL_DIR = '.partial'
+
+
+def store_key(url: str) -> str:
+    """图片键：URL中的文件名（去掉查询参数）"""
+    filename = url.split('?')[0].rstrip('/').split('/')[-1]
+    return filename or hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def store_relative_path(digest: str, key: str) -> str:
+    """按内容哈希计算仓库中的相对路径（从images目录开始）"""
+    return f"images/{STORE_DIR}/{digest[:2]}/{digest}{Path(key).suffix.lower()}"
+
+
+def file_digest(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """创建 image_store 表，为 images 表补充 store_key 列并回填旧数据"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_store (
+            key TEXT PRIMARY KEY,
+            sha256 TEXT,
+            local_path TEXT,
+            size INTEGER,
+            ref_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(images)')]
+    if 'store_key' not in columns:
+        cursor.execute('ALTER TABLE images ADD COLUMN store_key TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_store_key ON images(store_key)')
+
+    if fill_store_keys(conn):
+        recount_references(conn)
+    conn.commit()
+
+
+def fill_store_keys(conn: sqlite3.Connection) -> int:
+    """为还没有 store_key 的图片记录（旧数据）计算图片键，返回回填数量（不提交）"""
+    cursor = conn.cursor()
+    rows = cursor.execute(
+        'SELECT id, url FROM main.images WHERE store_key IS NULL AND url IS NOT NULL'
+    ).fetchall()
+    if rows:
+        cursor.executemany('UPDATE main.images SET store_key = ? WHERE id = ?',
+                           [(store_key(url), image_id) for image_id, url in rows])
+    return len(rows)
+
+
+def recount_references(conn: sqlite3.Connection):
+    """按 images 表重新统计每张图片的引用数"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO image_store (key, ref_count)
+        SELECT DISTINCT store_key, 0 FROM images WHERE store_key IS NOT NULL
+    ''')
+    cursor.execute('''
+        UPDATE image_store SET ref_count =
+            (SELECT COUNT(*) FROM images WHERE images.store_key = image_store.key)
+    ''')
+
+
+def add_references(cursor: sqlite3.Cursor, keys: Iterable[str]):
+    """新增图片引用（引用数加一，首次出现时登记到 image_store）"""
+    counts = Counter(keys)
+    cursor.executemany('''
+        INSERT INTO image_store (key, ref_count) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET ref_count = ref_count + excluded.ref_count
+    ''', list(counts.items()))
+
+
+def resolve_stored(cursor: sqlite3.Cursor, weibo_ids: List[str]) -> int:
+    """这些微博中已在仓库里的图片直接标记为已下载，返回标记数量"""
+    if not weibo_ids:
+        return 0
+
+    placeholders = ','.join('?' * len(weibo_ids))
+    cursor.execute(f'''
+        UPDATE images
+        SET local_path = (SELECT s.local_path FROM image_store s WHERE s.key = images.store_key),
+            downloaded = 1
+        WHERE downloaded = 0 AND weibo_id IN ({placeholders})
+          AND store_key IN (SELECT key FROM image_store WHERE local_path IS NOT NULL)
+    ''', [str(weibo_id) for weibo_id in weibo_ids])
+    return cursor.rowcount
+
+
+def lookup(conn: sqlite3.Connection, image_dir: Path, key: str) -> Optional[str]:
+    """查询图片是否已在仓库中，返回相对路径（文件丢失时视为不在仓库中）"""
+    row = conn.execute('SELECT local_path FROM image_store WHERE key = ?', (key,)).fetchone()
+    if row and row[0] and absolute_path(image_dir, row[0]).exists():
+        return row[0]
+    return None
+
+
+def record_stored(conn: sqlite3.Connection, key: str, relative_path: str,
+                  digest: str, size: int):
+    """登记已入库的图片，并把引用它的所有行标记为已下载（不提交）"""
+    conn.execute('''
+        INSERT INTO image_store (key, sha256, local_path, size) VALUES (?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            sha256 = excluded.sha256,
+            local_path = excluded.local_path,
+            size = excluded.size
+    ''', (key, digest, relative_path, size))
+    conn.execute('UPDATE images SET local_path = ?, downloaded = 1 WHERE store_key = ?',
+                 (relative_path, key))
+
+
+def absolute_path(image_dir: Path, relative_path: str) -> Path:
+    """相对路径（images/...）对应的本地文件"""
+    parts = Path(relative_path).parts
+    if parts and parts[0] == 'images':
+        parts = parts[1:]
+    return image_dir.joinpath(*parts)
+
+
+def place_file(source: Path, target: Path, move: bool = False):
+    """把文件放入仓库：目标已存在时什么也不做；否则硬链接（不支持时复制）或移动"""
+    if target.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if move:
+        os.replace(source, target)
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        tmp_path = target.with_name(target.name + '.tmp')
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+def migrate(conn: sqlite3.Connection, image_dir: Path, dry_run: bool = False,
+            batch_size: int = 500) -> Dict[str, int]:
+    """把旧目录结构中的图片迁移到仓库并删除重复文件
+
+    同一图片键有多个文件时保留最大的一个（旧版本中断的下载可能留下截断文件）。
+    先把文件链接进仓库并提交数据库，再删除旧文件，中途中断后重新运行即可。
+    """
+    ensure_schema(conn)
+    stats = Counter()
+
+    rows = conn.execute(f'''
+        SELECT store_key, local_path FROM images
+        WHERE downloaded = 1 AND local_path IS NOT NULL
+          AND local_path NOT LIKE 'images/{STORE_DIR}/%'
+        GROUP BY store_key, local_path
+        ORDER BY store_key
+    ''').fetchall()
+
+    legacy_files: Dict[str, List[Path]] = {}
+    for key, local_path in rows:
+        legacy_files.setdefault(key, []).append(absolute_path(image_dir, local_path))
+
+    seen_digests = set()
+    to_delete: List[Path] = []
+    pending = 0
+    for key, paths in legacy_files.items():
+        existing = [path for path in paths if path.exists()]
+        stats['files'] += len(paths)
+        stats['missing'] += len(paths) - len(existing)
+
+        stored = lookup(conn, image_dir, key)
+        if not existing:
+            if dry_run:
+                continue
+            if stored:
+                conn.execute('UPDATE images SET local_path = ?, downloaded = 1 WHERE store_key = ?',
+                             (stored, key))
+            else:
+                # 文件已丢失，交给下载池重新下载
+                conn.execute('UPDATE images SET local_path = NULL, downloaded = 0 WHERE store_key = ?',
+                             (key,))
+            continue
+
+        if stored:
+            keep = None
+            if not dry_run:
+                conn.execute('UPDATE images SET local_path = ?, downloaded = 1 WHERE store_key = ?',
+                             (stored, key))
+        else:
+            keep = max(existing, key=lambda path: path.stat().st_size)
+            digest = file_digest(keep)
+            relative_path = store_relative_path(digest, key)
+            target = absolute_path(image_dir, relative_path)
+            if target.exists() or digest in seen_digests:
+                stats['duplicates'] += 1
+                stats['bytes_freed'] += keep.stat().st_size
+            else:
+                stats['moved'] += 1
+            seen_digests.add(digest)
+            if not dry_run:
+                place_file(keep, target)
+                record_stored(conn, key, relative_path, digest, target.stat().st_size)
+
+        for path in existing:
+            if path != keep:
+                stats['duplicates'] += 1
+                stats['bytes_freed'] += path.stat().st_size
+        to_delete.extend(existing)
+
+        pending += 1
+        if pending >= batch_size and not dry_run:
+            conn.commit()
+            _remove_files(to_delete)
+            to_delete = []
+            pending = 0
+
+    if not dry_run:
+        conn.commit()
+        _remove_files(to_delete)
+        _remove_empty_dirs(image_dir)
+    return dict(stats)
+
+
+def _remove_files(paths: List[Path]):
+    """删除已迁移的旧文件"""
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _remove_empty_dirs(image_dir: Path):
+    """删除迁移后留下的空目录（仓库目录除外）"""
+    for path in sorted(image_dir.glob('*/'), reverse=True):
+        if path.name in (STORE_DIR, PARTIAL_DIR) or not path.is_dir():
+            continue
+        try:
+            path.rmdir()
+        except OSError:
+            pass
+
+
+def get_stats(conn: sqlite3.Connection) -> Tuple[int, int, int]:
+    """仓库统计：(图片数, 引用数, 占用字节)"""
+    row = conn.execute('''
+        SELECT COUNT(DISTINCT sha256), COALESCE(SUM(ref_count), 0),
+               (SELECT COALESCE(SUM(size), 0) FROM
+                   (SELECT MAX(size) AS size FROM image_store
+                    WHERE sha256 IS NOT NULL GROUP BY sha256))
+        FROM image_store
+    ''').fetchone()
+    return row[0], row[1], row[2]
+
+
+def main():
+    """迁移旧的图片目录并去重"""
+    parser = argparse.ArgumentParser(description='把旧的图片目录迁移到内容寻址仓库并去重')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不修改文件和数据库')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    db_path = resolve_project_path(config.get('database_path', '../data/database.db'))
+    image_dir = resolve_project_path(config.get('image_path', '../data/images'))
+
+    print("=" * 50)
+    print("图片去重迁移" + ("（仅统计）" if args.dry_run else ""))
+    print("=" * 50)
+
+    conn = storage.connect(db_path, config)
+    try:
+        stats = migrate(conn, image_dir, dry_run=args.dry_run)
+        images, references, size = get_stats(conn)
+    finally:
+        conn.close()
+
+    print(f"旧文件: {stats.get('files', 0)} 个, 移入仓库: {stats.get('moved', 0)} 个, "
+          f"重复: {stats.get('duplicates', 0)} 个, 丢失: {stats.get('missing', 0)} 个")
+    print(f"释放空间: {stats.get('bytes_freed', 0) / 1024 / 1024:.1f} MB")
+    print(f"仓库: {images} 张图片, {references} 处引用, {size / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并数据库 - 把其他机器上爬虫进程的数据库合并到中心数据库
+
+分布式模式下每台机器可以写自己的本地数据库，定期用本工具汇总：
+
+    python merge_db.py /path/to/worker.db --images /path/to/worker/images
+
+- 只插入中心库中没有的微博（连同全文索引和图片记录），已有的微博不覆盖
+- 用户信息以来源库为准，高水位取两边较大的值，互动数历史合并
+- 指定 --images 时把来源机器上已下载的图片复制到中心图片仓库
+"""
+
+import argparse
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import codec
+import image_store
+import migrations
+import retweets
+from config_loader import load_config, resolve_project_path
+
+
+def _columns(conn: sqlite3.Connection, table: str, schema: str = 'main') -> List[str]:
+    """表的列名"""
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _has_table(conn: sqlite3.Connection, table: str, schema: str = 'src') -> bool:
+    """来源库中是否有这张表（旧版本的数据库可能没有）"""
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+                        (table,)).fetchone() is not None
+
+
+def merge_database(conn: sqlite3.Connection, source_path: Path,
+                   source_images: Optional[Path] = None,
+                   target_images: Optional[Path] = None) -> Dict[str, int]:
+    """把 source_path 合并到 conn 所连接的中心库，返回各项合并数量"""
+    stats = {}
+    conn.execute('ATTACH DATABASE ? AS src', (str(source_path),))
+    try:
+        cursor = conn.cursor()
+
+        # 中心库中还没有的微博
+        cursor.execute('DROP TABLE IF EXISTS temp.merge_new_ids')
+        cursor.execute('''
+            CREATE TEMP TABLE merge_new_ids AS
+            SELECT id FROM src.weibos WHERE id NOT IN (SELECT id FROM main.weibos)
+        ''')
+
+        # 压缩字典按内容编号，直接复制；来源库的压缩数据原样复制，全文索引需要解码后的明文
+        if _has_table(conn, 'codec_dictionaries'):
+            cursor.execute('INSERT OR IGNORE INTO main.codec_dictionaries SELECT * FROM src.codec_dictionaries')
+        codec.TextCodec.load(conn).register(conn)
+
+        user_columns = ', '.join(column for column in _columns(conn, 'users', 'src')
+                                 if column in _columns(conn, 'users'))
+        cursor.execute(f'INSERT OR REPLACE INTO main.users ({user_columns}) SELECT {user_columns} FROM src.users')
+        stats['users'] = cursor.rowcount
+
+        columns = [column for column in _columns(conn, 'weibos', 'src')
+                   if column in _columns(conn, 'weibos')]
+        column_list = ', '.join(columns)
+        cursor.execute(f'''
+            INSERT INTO main.weibos ({column_list})
+            SELECT {column_list} FROM src.weibos WHERE id IN (SELECT id FROM temp.merge_new_ids)
+        ''')
+        stats['weibos'] = cursor.rowcount
+
+        cursor.execute('''
+            INSERT INTO main.weibos_fts (id, content)
+            SELECT id, weibo_text(content) FROM src.weibos WHERE id IN (SELECT id FROM temp.merge_new_ids)
+        ''')
+
+        image_columns = [column for column in ('weibo_id', 'url', 'local_path', 'downloaded', 'store_key')
+                         if column in _columns(conn, 'images', 'src')]
+        image_column_list = ', '.join(image_columns)
+        cursor.execute(f'''
+            INSERT INTO main.images ({image_column_list})
+            SELECT {image_column_list} FROM src.images
+            WHERE weibo_id IN (SELECT id FROM temp.merge_new_ids)
+        ''')
+        stats['images'] = cursor.rowcount
+        # 旧版本的来源库没有 store_key 列，合并进来的记录补上图片键
+        image_store.fill_store_keys(conn)
+
+        if _has_table(conn, 'crawl_state'):
+            cursor.execute('''
+                INSERT INTO main.crawl_state (uid, high_water_mark, updated_at)
+                SELECT uid, high_water_mark, updated_at FROM src.crawl_state WHERE true
+                ON CONFLICT(uid) DO UPDATE SET
+                    high_water_mark = MAX(high_water_mark, excluded.high_water_mark),
+                    updated_at = excluded.updated_at
+            ''')
+
+        if _has_table(conn, 'retweeted_originals'):
+            cursor.execute('''
+                INSERT OR IGNORE INTO main.retweeted_originals
+                SELECT * FROM src.retweeted_originals
+                WHERE id IN (SELECT retweeted_id FROM src.weibos WHERE id IN (SELECT id FROM temp.merge_new_ids))
+            ''')
+        # 旧版本的来源库中转发微博仍是JSON，合并进来后转换；没有整数ID和发布时间戳列的补上
+        retweets.migrate(conn)
+        migrations.fill_sort_keys(conn)
+
+        if _has_table(conn, 'weibo_count_history'):
+            cursor.execute('INSERT OR IGNORE INTO main.weibo_count_history SELECT * FROM src.weibo_count_history')
+            stats['count_history'] = cursor.rowcount
+
+        if _has_table(conn, 'longtext_failures'):
+            cursor.execute('''
+                INSERT OR IGNORE INTO main.longtext_failures (weibo_id, uid, attempts, updated_at)
+                SELECT weibo_id, uid, attempts, updated_at FROM src.longtext_failures
+                WHERE weibo_id IN (SELECT id FROM temp.merge_new_ids)
+            ''')
+
+        stats['image_files'] = 0
+        if _has_table(conn, 'image_store'):
+            rows = cursor.execute('''
+                SELECT key, sha256, local_path, size FROM src.image_store
+                WHERE local_path IS NOT NULL
+                  AND key NOT IN (SELECT key FROM main.image_store WHERE local_path IS NOT NULL)
+            ''').fetchall()
+            for key, digest, local_path, size in rows:
+                if not target_images:
+                    continue
+                target_file = image_store.absolute_path(target_images, local_path)
+                if not target_file.exists():
+                    source_file = image_store.absolute_path(source_images, local_path) if source_images else None
+                    if source_file is None or not source_file.exists():
+                        continue
+                    target_file.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(source_file, target_file)
+                    stats['image_files'] += 1
+                # 只有中心库确实有这个文件时才登记为已存储
+                image_store.record_stored(conn, key, local_path, digest, size)
+
+        # 合并进来的图片记录以中心仓库为准：仓库中有的指向仓库文件（旧版本来源库的路径不在仓库里），
+        # 没有的（没指定 --images、来源文件缺失或旧版本来源库）交给下载池重新下载
+        cursor.execute('''
+            UPDATE main.images
+            SET local_path = (SELECT s.local_path FROM main.image_store s WHERE s.key = images.store_key),
+                downloaded = 1
+            WHERE weibo_id IN (SELECT id FROM temp.merge_new_ids)
+              AND store_key IN (SELECT key FROM main.image_store WHERE local_path IS NOT NULL)
+        ''')
+        cursor.execute('''
+            UPDATE main.images SET local_path = NULL, downloaded = 0
+            WHERE weibo_id IN (SELECT id FROM temp.merge_new_ids)
+              AND store_key NOT IN (SELECT key FROM main.image_store WHERE local_path IS NOT NULL)
+        ''')
+        stats['images_pending'] = cursor.rowcount
+
+        image_store.recount_references(conn)
+        cursor.execute('DROP TABLE temp.merge_new_ids')
+        conn.commit()
+    finally:
+        conn.execute('DETACH DATABASE src')
+    return stats
+
+
+def main():
+    """合并一个或多个爬虫进程的数据库到中心库"""
+    parser = argparse.ArgumentParser(description='把其他爬虫进程的数据库合并到中心数据库')
+    parser.add_argument('sources', nargs='+', help='要合并的数据库文件')
+    parser.add_argument('--images', help='来源机器的图片目录（复制已下载的图片）')
+    parser.add_argument('--config', default='config.json', help='中心库的配置文件路径')
+    args = parser.parse_args()
+
+    # 延迟导入：创建爬虫实例会初始化（或升级）中心库的表结构
+    from weibo_spider import WeiboSpider
+
+    config = load_config(args.config)
+    spider = WeiboSpider(config=config)
+    target_images = resolve_project_path(config.get('image_path', '../data/images'))
+    source_images = Path(args.images) if args.images else None
+
+    try:
+        for source in args.sources:
+            stats = merge_database(spider.db_conn, Path(source), source_images, target_images)
+            print(f"合并 {source}: 用户 {stats['users']} 个, 新微博 {stats['weibos']} 条, "
+                  f"图片记录 {stats['images']} 条, 复制图片 {stats['image_files']} 张, "
+                  f"待重新下载 {stats['images_pending']} 张")
+    finally:
+        spider.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构迁移 - 按版本号依次升级 data/database.db 的表结构
+
+schema_version 表记录已执行的迁移，爬虫、Web服务器和静态生成器打开数据库时只执行还没执行过的迁移。
+修改表结构时在 MIGRATIONS 末尾追加新版本，不要修改已发布的迁移。
+
+每个迁移都必须可以重复执行（CREATE ... IF NOT EXISTS、先检查列是否存在）：
+引入版本表之前的旧数据库没有版本记录，会从第一个迁移开始全部执行一遍；
+多个进程同时升级时也可能重复执行同一个迁移。
+
+热点查询的执行计划可以用 --check 检查，出现全表扫描或临时排序时返回非零退出码：
+
+    python migrations.py            # 执行迁移并显示当前版本
+    python migrations.py --check    # 检查热点查询的执行计划
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import codec
+import image_store
+import queries
+import retweets
+import storage
+from config_loader import load_config, resolve_project_path
+
+
+# 回填排序列时每批处理的行数
+_FILL_BATCH = 5000
+
+
+def id_int(weibo_id) -> Optional[int]:
+    """微博ID的整数形式（weibos.id_int），不是数字时返回None"""
+    try:
+        return int(weibo_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def created_ts(created_at) -> Optional[int]:
+    """发布时间（如 Tue Dec 31 12:00:00 +0800 2024）的Unix时间戳（weibos.created_ts），无法解析时返回None"""
+    try:
+        return int(datetime.strptime(created_at, '%a %b %d %H:%M:%S %z %Y').timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def fill_sort_keys(conn: sqlite3.Connection) -> int:
+    """为还没有 id_int 的微博（旧数据、从旧版本数据库合并进来的微博）回填 id_int 和 created_ts，返回回填行数"""
+    cursor = conn.cursor()
+    filled = 0
+    last_rowid = 0
+    while True:
+        rows = cursor.execute('''
+            SELECT rowid, id, created_at FROM weibos
+            WHERE id_int IS NULL AND rowid > ?
+            ORDER BY rowid LIMIT ?
+        ''', (last_rowid, _FILL_BATCH)).fetchall()
+        if not rows:
+            break
+        cursor.executemany('UPDATE weibos SET id_int = ?, created_ts = ? WHERE rowid = ?',
+                           [(id_int(weibo_id), created_ts(created_at), rowid)
+                            for rowid, weibo_id, created_at in rows])
+        filled += len(rows)
+        last_rowid = rows[-1][0]
+    return filled
+
+
+def _create_base_tables(conn: sqlite3.Connection, config: dict) -> bool:
+    """创建基础表"""
+    cursor = conn.cursor()
+
+    # 用户表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            uid TEXT PRIMARY KEY,
+            name TEXT,
+            description TEXT,
+            followers_count INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 微博表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weibos (
+            id TEXT PRIMARY KEY,
+            uid TEXT,
+            content TEXT,
+            created_at TEXT,
+            reposts_count INTEGER,
+            comments_count INTEGER,
+            attitudes_count INTEGER,
+            source TEXT,
+            pics TEXT,
+            retweeted_status TEXT,
+            crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (uid) REFERENCES users(uid)
+        )
+    ''')
+
+    # 图片表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            weibo_id TEXT,
+            url TEXT,
+            local_path TEXT,
+            downloaded INTEGER DEFAULT 0,
+            FOREIGN KEY (weibo_id) REFERENCES weibos(id)
+        )
+    ''')
+
+    # 爬取状态表（每个用户的高水位：已完整抓取到的最大微博ID）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            uid TEXT PRIMARY KEY,
+            high_water_mark INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 断点表（首次全量爬取/强制更新中途中断时，从这里继续）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+            uid TEXT PRIMARY KEY,
+            mode TEXT,
+            last_page INTEGER,
+            oldest_id INTEGER,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 长文本获取失败表（保存时先用截断文本，之后的补抓会重试）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS longtext_failures (
+            weibo_id TEXT PRIMARY KEY,
+            uid TEXT,
+            attempts INTEGER DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 互动数历史表（每次刷新到变化时记一个快照，用于绘制增长曲线）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weibo_count_history (
+            weibo_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            reposts_count INTEGER,
+            comments_count INTEGER,
+            attitudes_count INTEGER,
+            PRIMARY KEY (weibo_id, ts)
+        ) WITHOUT ROWID
+    ''')
+
+    # 全文搜索索引
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS weibos_fts
+        USING fts5(id, content, tokenize='porter unicode61')
+    ''')
+    return False
+
+
+def _add_fingerprint(conn: sqlite3.Connection, config: dict) -> bool:
+    """内容指纹列（强制更新时只写入真正有变化的微博）"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(weibos)')]
+    if 'fingerprint' not in columns:
+        conn.execute('ALTER TABLE weibos ADD COLUMN fingerprint TEXT')
+    return False
+
+
+def _split_retweets(conn: sqlite3.Connection, config: dict) -> bool:
+    """转发的原微博只保存一份，旧数据中的JSON移到 retweeted_originals 表；有迁移时需要整理数据库"""
+    image_base = config.get('image_base', retweets.DEFAULT_IMAGE_BASE).rstrip('/')
+    migrated = retweets.migrate(conn, image_base)
+    if migrated:
+        print(f"已迁移 {migrated} 条转发微博的原微博到 retweeted_originals 表")
+    return migrated > 0
+
+
+def _create_image_store(conn: sqlite3.Connection, config: dict) -> bool:
+    """图片仓库表（同一张图片只下载一次，按引用计数共享）"""
+    image_store.ensure_schema(conn)
+    return False
+
+
+def _create_codec_dictionaries(conn: sqlite3.Connection, config: dict) -> bool:
+    """压缩字典表"""
+    codec.ensure_schema(conn)
+    return False
+
+
+def _create_hot_path_indexes(conn: sqlite3.Connection, config: dict) -> bool:
+    """热点查询的索引
+
+    - 微博ID是文本，按 CAST(id AS INTEGER) 排序：表达式索引让分页直接按索引顺序读取，不再临时排序
+    - 用户页、用户微博数、已知ID索引按 uid 查询：(uid, 数字ID, id) 同时覆盖过滤、排序和取ID
+    - 页面把图片地址换成本地路径时按 (weibo_id, url) 查询：覆盖索引不用回表
+    """
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weibos_id_int ON weibos(CAST(id AS INTEGER))')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weibos_uid_id ON weibos(uid, CAST(id AS INTEGER), id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_images_weibo_url
+        ON images(weibo_id, url, downloaded, local_path)
+    ''')
+    cursor.execute('ANALYZE')
+    return False
+
+
+def _add_sort_keys(conn: sqlite3.Connection, config: dict) -> bool:
+    """整数ID和发布时间戳列：列表按 id_int 排序，按日期筛选时按 created_ts 范围查询
+
+    取代版本6中 CAST(id AS INTEGER) 的表达式索引，日期筛选也不再逐行解析 created_at 文本
+    """
+    cursor = conn.cursor()
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(weibos)')]
+    if 'id_int' not in columns:
+        cursor.execute('ALTER TABLE weibos ADD COLUMN id_int INTEGER')
+    if 'created_ts' not in columns:
+        cursor.execute('ALTER TABLE weibos ADD COLUMN created_ts INTEGER')
+
+    cursor.execute('DROP INDEX IF EXISTS idx_weibos_id_int')
+    cursor.execute('DROP INDEX IF EXISTS idx_weibos_uid_id')
+    cursor.execute('CREATE INDEX idx_weibos_id_int ON weibos(id_int)')
+    cursor.execute('CREATE INDEX idx_weibos_uid_id ON weibos(uid, id_int, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weibos_created_ts ON weibos(created_ts, id_int)')
+
+    filled = fill_sort_keys(conn)
+    if filled:
+        print(f"已为 {filled} 条微博回填整数ID和发布时间戳")
+    cursor.execute('ANALYZE')
+    return False
+
+
+# (版本号, 说明, 迁移函数)；迁移函数返回是否需要整理数据库文件
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection, dict], bool]]] = [
+    (1, '基础表', _create_base_tables),
+    (2, '内容指纹列', _add_fingerprint),
+    (3, '转发原微博表', _split_retweets),
+    (4, '图片仓库表', _create_image_store),
+    (5, '压缩字典表', _create_codec_dictionaries),
+    (6, '热点查询索引', _create_hot_path_indexes),
+    (7, '整数ID和发布时间戳列', _add_sort_keys),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """数据库当前的结构版本（没有版本表时为0）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, config: Optional[dict] = None, vacuum: bool = True) -> List[str]:
+    """执行还没执行过的迁移，返回本次执行的迁移说明
+
+    每个迁移执行完立即提交并记录版本，中途中断后下次从中断的迁移继续。
+    迁移腾出大量空间时整理数据库文件（vacuum=False 时跳过，如Web服务器启动时）
+    """
+    config = config or {}
+    version = current_version(conn)
+    conn.commit()
+
+    applied = []
+    needs_vacuum = False
+    for migration_version, name, upgrade in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        needs_vacuum = upgrade(conn, config) or needs_vacuum
+        conn.execute('INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)',
+                     (migration_version, name))
+        conn.commit()
+        applied.append(name)
+
+    if needs_vacuum and vacuum:
+        print("正在整理数据库...")
+        try:
+            storage.vacuum(conn)
+        except sqlite3.OperationalError as e:
+            print(f"  整理数据库失败（{e}），可稍后运行 sqlite3 data/database.db VACUUM 重试")
+    return applied
+
+
+# 热点查询：与 app.py、generator/build.py 和爬虫执行的是同一份SQL（见 queries.py），参数只用于生成执行计划
+_BY_ID = ('w.id_int',)
+_BY_DATE = ('w.created_ts', 'w.id_int')
+_BY_USER = {'where': 'w.uid = ?', 'params': ('0',)}
+HOT_QUERIES = [
+    ('首页分页', *queries.weibo_page_query(_BY_ID, 51, offset=50)),
+    ('用户页分页', *queries.weibo_page_query(_BY_ID, 51, offset=50, **_BY_USER)),
+    ('首页游标翻页（更旧）', *queries.weibo_page_query(_BY_ID, 51, key=(0,))),
+    ('首页游标翻页（更新）', *queries.weibo_page_query(_BY_ID, 51, key=(0,), older=False)),
+    ('用户页游标翻页（更旧）', *queries.weibo_page_query(_BY_ID, 51, key=(0,), **_BY_USER)),
+    ('用户页游标翻页（更新）', *queries.weibo_page_query(_BY_ID, 51, key=(0,), older=False, **_BY_USER)),
+    ('游标位置', queries.cursor_key_query(_BY_DATE), ('0',)),
+    ('用户微博数', queries.COUNT_BY_USER, ('0',)),
+    ('单条微博', queries.WEIBO_BY_ID, ('0',)),
+    ('整页图片本地路径', queries.local_pics_query(2), ('0', '1')),
+    ('最早微博', queries.EARLIEST_CREATED_AT, ()),
+    ('最新微博', queries.LATEST_CREATED_AT, ()),
+    ('日期筛选微博数', queries.COUNT_BY_DATE, (0, 1)),
+    ('日期筛选分页', *queries.weibo_page_query(_BY_DATE, 51, offset=50, bounds=(0, 1))),
+    ('日期筛选游标翻页（更旧）', *queries.weibo_page_query(_BY_DATE, 51, key=(0, 0), bounds=(0, 1))),
+    ('日期筛选游标翻页（更新）', *queries.weibo_page_query(_BY_DATE, 51, key=(0, 0), older=False, bounds=(0, 1))),
+    ('用户已知ID', queries.USER_WEIBO_IDS, ('0',)),
+    ('用户最新微博', queries.USER_LATEST_ID, ('0',)),
+]
+
+# 不允许出现的执行计划：整表扫描（不带索引的 SCAN）和临时排序
+_BAD_PLAN = re.compile(r'^SCAN \w+$|USE TEMP B-TREE')
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """EXPLAIN QUERY PLAN 的每一步"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """检查热点查询的执行计划，返回 [(查询, 有问题的步骤)]"""
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        for detail in query_plan(conn, sql, params):
+            if _BAD_PLAN.search(detail):
+                problems.append((name, detail))
+    return problems
+
+
+def main():
+    """执行迁移，或检查热点查询的执行计划"""
+    parser = argparse.ArgumentParser(description='升级数据库表结构')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--check', action='store_true', help='检查热点查询是否用到索引')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    db_path = resolve_project_path(config.get('database_path', '../data/database.db'))
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = storage.connect(db_path, config)
+    try:
+        for name in migrate(conn, config):
+            print(f"已执行迁移: {name}")
+        print(f"数据库结构版本: {current_version(conn)}（最新 {LATEST_VERSION}）")
+
+        if args.check:
+            for name, sql, params in HOT_QUERIES:
+                print(f"\n{name}:")
+                for detail in query_plan(conn, sql, params):
+                    print(f"  {detail}")
+            problems = check_query_plans(conn)
+            for name, detail in problems:
+                print(f"\n✗ {name}: {detail}")
+            if problems:
+                sys.exit(1)
+            print("\n✓ 热点查询均使用索引")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
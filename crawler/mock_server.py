@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟微博接口 - 用合成数据代替线上微博，用于离线压测爬虫
+
+实现的接口：
+- /ajax/profile/info?uid=          用户信息
+- /ajax/statuses/mymblog?uid=&page= 微博列表（每页20条，第一页带一条置顶微博）
+- /ajax/statuses/longtext?id=      长文本
+- /large/{pic_id}.jpg              图片（支持 Range 续传）
+
+可配置响应延迟、错误率（返回500）和限流（每个Cookie超过每秒请求数时返回429），
+以及已过期的Cookie（接口返回 ok=-100）。
+数据由 uid 和微博序号确定性生成，同样的参数每次得到同样的数据。
+
+    python mock_server.py --port 8000 --posts 2000 --latency 50 --error-rate 0.01
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+PAGE_SIZE = 20
+# 合成微博ID的起点，和真实微博ID的量级一致
+BASE_ID = 4_000_000_000_000_000
+
+
+class MockWeiboData:
+    """确定性生成的合成微博数据"""
+
+    def __init__(self, posts_per_user: int = 1000, max_pics: int = 9,
+                 long_text_ratio: float = 0.2, retweet_ratio: float = 0.2,
+                 image_size: int = 50 * 1024, shared_pic_ratio: float = 0.1):
+        """shared_pic_ratio 为图片取自公共图片池的概率（模拟多条微博、转发共用同一张图）"""
+        self.posts_per_user = posts_per_user
+        self.max_pics = max_pics
+        self.long_text_ratio = long_text_ratio
+        self.retweet_ratio = retweet_ratio
+        self.image_size = image_size
+        self.shared_pic_ratio = shared_pic_ratio
+        self._start_time = datetime(2024, 12, 31, 12, 0, 0, tzinfo=timezone(timedelta(hours=8)))
+
+    def _weibo_id(self, uid: str, index: int) -> int:
+        """第 index 条微博的ID（index 越大越旧，ID越小）"""
+        return BASE_ID + int(uid) % 100000 * 10_000_000 + (self.posts_per_user - index)
+
+    def _parse_id(self, weibo_id: int):
+        """从微博ID还原 (uid后缀, index)"""
+        offset = weibo_id - BASE_ID
+        return offset // 10_000_000, self.posts_per_user - offset % 10_000_000
+
+    def user_info(self, uid: str) -> Dict:
+        """用户信息"""
+        return {
+            'id': int(uid),
+            'screen_name': f'mock_user_{uid}',
+            'description': f'模拟用户 {uid}',
+            'followers_count': int(uid) % 100000
+        }
+
+    def weibo(self, uid: str, index: int) -> Dict:
+        """第 index 条微博"""
+        weibo_id = self._weibo_id(uid, index)
+        rng = random.Random(weibo_id)
+        created_at = self._start_time - timedelta(hours=index * 3)
+
+        text = f'模拟微博 {uid}-{index} ' + '这是一段用于压测的合成内容。' * rng.randint(1, 8)
+        weibo = {
+            'id': weibo_id,
+            'idstr': str(weibo_id),
+            'created_at': created_at.strftime('%a %b %d %H:%M:%S %z %Y'),
+            'text_raw': text,
+            'source': '模拟客户端',
+            'reposts_count': rng.randint(0, 1000),
+            'comments_count': rng.randint(0, 1000),
+            'attitudes_count': rng.randint(0, 5000),
+            'pic_ids': [f'mockshared{rng.randint(0, 49)}' if rng.random() < self.shared_pic_ratio
+                        else f'mock{weibo_id}p{i}'
+                        for i in range(rng.randint(0, self.max_pics))]
+        }
+
+        if rng.random() < self.long_text_ratio:
+            weibo['isLongText'] = True
+        if rng.random() < self.retweet_ratio:
+            weibo['retweeted_status'] = {
+                'id': weibo_id + 1,
+                'text_raw': f'被转发的原微博 {weibo_id}',
+                'user': {'id': 1, 'screen_name': 'original_author'},
+                'pics': []
+            }
+        return weibo
+
+    def weibo_list(self, uid: str, page: int) -> List[Dict]:
+        """第 page 页微博列表，第一页最前面是一条很旧的置顶微博"""
+        start = (page - 1) * PAGE_SIZE
+        weibos = [self.weibo(uid, index)
+                  for index in range(start, min(start + PAGE_SIZE, self.posts_per_user))]
+        if page == 1 and self.posts_per_user > PAGE_SIZE:
+            pinned = self.weibo(uid, self.posts_per_user - 1)
+            pinned['isTop'] = 1
+            weibos.insert(0, pinned)
+        return weibos
+
+    def long_text(self, weibo_id: int) -> str:
+        """长文本完整内容"""
+        uid_suffix, index = self._parse_id(weibo_id)
+        return f'模拟长微博全文 {uid_suffix}-{index} ' + '长文本内容。' * 200
+
+    def image(self, pic_id: str) -> bytes:
+        """图片内容（确定性的伪随机字节）"""
+        rng = random.Random(pic_id)
+        return b'\xff\xd8\xff\xe0' + rng.randbytes(max(0, self.image_size - 4))
+
+
+class MockWeiboServer:
+    """模拟微博接口服务器（在后台线程运行）"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 data: Optional[MockWeiboData] = None, latency: float = 0.0,
+                 error_rate: float = 0.0, throttle_rps: float = 0.0,
+                 expired_cookies=()):
+        """latency 为秒；error_rate 为返回500的概率；throttle_rps 为每个Cookie每秒请求上限（0不限流）"""
+        self.data = data or MockWeiboData()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.expired_cookies = set(expired_cookies)
+
+        self._lock = threading.Lock()
+        # 每个Cookie的限流窗口: cookie -> [窗口开始时间, 请求数]
+        self._windows = {}
+        self._rng = random.Random(0)
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0, 'bytes': 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """服务器地址"""
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockWeiboServer':
+        """在后台线程启动"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def _admit(self, cookie: str = '') -> Optional[int]:
+        """按错误率和限流（每个Cookie单独计算）决定是否返回错误状态码"""
+        with self._lock:
+            self.stats['requests'] += 1
+
+            if self.throttle_rps > 0:
+                now = time.monotonic()
+                window = self._windows.setdefault(cookie, [now, 0])
+                if now - window[0] >= 1.0:
+                    window[0] = now
+                    window[1] = 0
+                window[1] += 1
+                if window[1] > self.throttle_rps:
+                    self.stats['throttled'] += 1
+                    return 429
+
+            if self.error_rate > 0 and self._rng.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.stats['bytes'] += len(body)
+
+            def _send_json(self, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self._send(200, body, 'application/json; charset=utf-8')
+
+            def _send_image(self, body: bytes):
+                """返回图片，支持 Range: bytes=N- 续传请求"""
+                range_header = self.headers.get('Range', '')
+                if not range_header.startswith('bytes='):
+                    self._send(200, body, 'image/jpeg')
+                    return
+
+                start = int(range_header[len('bytes='):].split('-')[0] or 0)
+                if start >= len(body):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{len(body)}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                self.send_response(206)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+                self.send_header('Content-Length', str(len(body) - start))
+                self.end_headers()
+                self.wfile.write(body[start:])
+                with server._lock:
+                    server.stats['bytes'] += len(body) - start
+
+            def do_GET(self):
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                parsed = urlparse(self.path)
+                cookie = self.headers.get('Cookie', '')
+                if cookie in server.expired_cookies and parsed.path.startswith('/ajax/'):
+                    self._send_json({'ok': -100, 'url': 'https://passport.weibo.com/sso/signin'})
+                    return
+
+                status = server._admit(cookie)
+                if status:
+                    self._send(status, b'{"ok": 0}', 'application/json')
+                    return
+
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                data = server.data
+
+                if parsed.path == '/ajax/profile/info':
+                    self._send_json({'ok': 1, 'data': {'user': data.user_info(params.get('uid', '0'))}})
+                elif parsed.path == '/ajax/statuses/mymblog':
+                    page = int(params.get('page', 1))
+                    self._send_json({'ok': 1, 'data': {
+                        'list': data.weibo_list(params.get('uid', '0'), page),
+                        'total': data.posts_per_user
+                    }})
+                elif parsed.path == '/ajax/statuses/longtext':
+                    weibo_id = int(params.get('id', BASE_ID))
+                    self._send_json({'ok': 1, 'data': {'longTextContent': data.long_text(weibo_id)}})
+                elif parsed.path.startswith('/large/'):
+                    pic_id = parsed.path.rsplit('/', 1)[-1].split('.')[0]
+                    self._send_image(data.image(pic_id))
+                else:
+                    self._send(404, b'not found', 'text/plain')
+
+        return Handler
+
+
+def main():
+    """单独运行模拟服务器"""
+    parser = argparse.ArgumentParser(description='本地模拟微博接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--posts', type=int, default=1000, help='每个用户的微博数')
+    parser.add_argument('--image-size', type=int, default=50 * 1024, help='图片大小（字节）')
+    parser.add_argument('--latency', type=float, default=0.0, help='响应延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的概率')
+    parser.add_argument('--throttle-rps', type=float, default=0.0, help='每秒请求上限，超过返回429')
+    args = parser.parse_args()
+
+    data = MockWeiboData(posts_per_user=args.posts, image_size=args.image_size)
+    server = MockWeiboServer(args.host, args.port, data=data, latency=args.latency / 1000,
+                             error_rate=args.error_rate, throttle_rps=args.throttle_rps)
+    print(f"模拟微博接口已启动: {server.url}")
+    print(f"在 config.json 中设置 \"api_base\" 和 \"image_base\" 为该地址即可")
+    print("按 Ctrl+C 停止")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n模拟服务器已停止")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
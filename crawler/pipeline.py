@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线 - 把一个用户的爬取拆成 抓取 → 补全 → 写库 几个阶段，阶段之间用有界队列连接
+
+- 每个阶段有自己的线程数；下游处理不过来时队列写满，上游阻塞等待（背压），不会无限堆积
+- 多线程阶段按输入顺序输出（写库阶段依赖页的顺序）
+- 每个阶段统计处理条数、平均/最大耗时、输入队列深度和因下游阻塞而等待的时间，
+  多个流水线（多个用户）共用同一份统计，据此可以看出哪个阶段是瓶颈，只给这个阶段加线程
+
+    pipeline = Pipeline(stats, queue_size=4)
+    pipeline.source('fetch', pages())
+    pipeline.stage('enrich', enrich, workers=2)
+    for item in pipeline.sink('persist'):
+        ...
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+# 队列结束标记
+_END = object()
+
+
+class _Failure:
+    """某一条处理出错：和正常结果一样按顺序往下游传递，消费者取到时重新抛出
+
+    这样出错之前的数据仍会被下游处理完（例如第4页抓取失败时，前3页照常写库）
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class StageStats:
+    """单个阶段的统计（线程安全）"""
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_time = 0.0
+        self.max_latency = 0.0
+        self.depth = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+        self._lock = threading.Lock()
+        # 每个线程处理当前这一条时被下游阻塞的时间，不计入处理耗时
+        self._local = threading.local()
+
+    def record(self, elapsed: float):
+        """处理完一条，耗时 elapsed 秒（扣除处理期间被下游阻塞的时间）"""
+        elapsed = max(0.0, elapsed - getattr(self._local, 'blocked', 0.0))
+        self._local.blocked = 0.0
+        with self._lock:
+            self.items += 1
+            self.busy_time += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+
+    def observe_depth(self, depth: int):
+        """记录输入队列当前深度"""
+        with self._lock:
+            self.depth = depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def record_blocked(self, elapsed: float):
+        """输出时因下游队列已满等待了 elapsed 秒"""
+        self._local.blocked = getattr(self._local, 'blocked', 0.0) + elapsed
+        with self._lock:
+            self.blocked_time += elapsed
+
+    def snapshot(self) -> Dict:
+        """当前统计"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'items': self.items,
+                'busy_time': self.busy_time,
+                'avg_latency': self.busy_time / self.items if self.items else 0.0,
+                'max_latency': self.max_latency,
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'blocked_time': self.blocked_time
+            }
+
+
+class PipelineStats:
+    """按阶段名汇总的统计，所有用户的流水线共用一份"""
+
+    def __init__(self):
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, workers: int = 1) -> StageStats:
+        """获取（首次时创建）某个阶段的统计；workers 记为该阶段同时运行的线程数"""
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = StageStats(name, workers)
+            else:
+                stats.workers = max(stats.workers, workers)
+            return stats
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """各阶段的统计"""
+        with self._lock:
+            stages = list(self._stages.values())
+        return {stats.name: stats.snapshot() for stats in stages}
+
+    def bottleneck(self) -> Optional[str]:
+        """瓶颈阶段：平均到每个线程的忙碌时间最长的阶段"""
+        stats = self.get_stats()
+        busy = {name: item['busy_time'] / max(1, item['workers'])
+                for name, item in stats.items() if item['items']}
+        return max(busy, key=busy.get) if busy else None
+
+    def print_stats(self):
+        """打印各阶段统计"""
+        stats = self.get_stats()
+        if not stats:
+            return
+        print("流水线各阶段:")
+        for name, item in stats.items():
+            print(f"  {name}: {item['items']} 条, 线程 {item['workers']}, "
+                  f"平均 {item['avg_latency'] * 1000:.1f}ms, 最长 {item['max_latency'] * 1000:.1f}ms, "
+                  f"忙碌 {item['busy_time']:.1f}秒, 队列最深 {item['max_depth']}, "
+                  f"下游阻塞 {item['blocked_time']:.1f}秒")
+        bottleneck = self.bottleneck()
+        if bottleneck:
+            print(f"  瓶颈阶段: {bottleneck}")
+
+
+class Pipeline:
+    """单次运行的流水线：一个数据源、若干处理阶段，最后由调用线程逐条消费"""
+
+    # 阻塞操作的轮询间隔（秒），用于及时响应 stop()
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, stats: Optional[PipelineStats] = None, queue_size: int = 4,
+                 on_thread_exit: Optional[Callable[[], None]] = None):
+        """queue_size 为阶段之间队列的容量；on_thread_exit 在每个工作线程退出前调用（如关闭线程的数据库连接）"""
+        self.stats = stats or PipelineStats()
+        self.queue_size = max(1, int(queue_size))
+        self.on_thread_exit = on_thread_exit
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # 最后一个阶段的输出队列
+        self._queue: Optional[queue.Queue] = None
+
+    @property
+    def stopped(self) -> bool:
+        """是否已停止"""
+        return self._stop.is_set()
+
+    def stop(self):
+        """停止流水线：数据源不再产出，各阶段丢弃剩余的数据"""
+        self._stop.set()
+
+    def _put(self, target: queue.Queue, item, stats: StageStats) -> bool:
+        """放入下游队列；队列满时等待（记为背压），停止时放弃并返回False"""
+        start_time = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=self._POLL_INTERVAL)
+            except queue.Full:
+                continue
+            stats.record_blocked(time.monotonic() - start_time)
+            return True
+        return False
+
+    def _get(self, source: queue.Queue):
+        """从上游队列取一条；停止时返回 _END"""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=self._POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _start_thread(self, name: str, target: Callable):
+        def run():
+            try:
+                target()
+            finally:
+                if self.on_thread_exit is not None:
+                    self.on_thread_exit()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def source(self, name: str, items: Iterable) -> 'Pipeline':
+        """数据源阶段：在单独的线程中迭代 items（每次取下一条的耗时记为该阶段的处理耗时）
+
+        迭代出错时把异常作为最后一条送往下游
+        """
+        stats = self.stats.stage(name)
+        output = queue.Queue(maxsize=self.queue_size)
+        self._queue = output
+
+        def run():
+            iterator = iter(items)
+            try:
+                while not self._stop.is_set():
+                    start_time = time.monotonic()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    except Exception as e:
+                        self._put(output, _Failure(e), stats)
+                        return
+                    stats.record(time.monotonic() - start_time)
+                    if not self._put(output, item, stats):
+                        return
+                self._put(output, _END, stats)
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+
+        self._start_thread(f'{name}-0', run)
+        return self
+
+    def stage(self, name: str, func: Callable[[Any], Any], workers: int = 1) -> 'Pipeline':
+        """处理阶段：workers 个线程并行执行 func，结果按输入顺序送往下一阶段
+
+        func 出错时异常代替结果送往下游；上游送来的异常原样传递
+        """
+        if self._queue is None:
+            raise RuntimeError("请先添加数据源阶段")
+
+        workers = max(1, int(workers))
+        stats = self.stats.stage(name, workers)
+        upstream = self._queue
+        output = queue.Queue(maxsize=self.queue_size)
+        self._queue = output
+
+        # 按输入顺序输出：第 n 条的结果要等前 n-1 条都送出后才送出
+        receive = threading.Lock()
+        turn = threading.Condition()
+        # end 为最后送往下游的标记（正常结束或异常），closed 后不再取新数据、不再送出结果
+        state = {'received': 0, 'emitted': 0, 'alive': workers, 'end': _END, 'closed': False}
+
+        def run():
+            try:
+                while True:
+                    with receive:
+                        if state['closed']:
+                            break
+                        # 取数据和分配序号必须一起完成，序号才和输入顺序一致
+                        item = self._get(upstream)
+                        if item is _END or isinstance(item, _Failure):
+                            # 上游结束（或出错）：让其他线程也看到，最后退出的线程负责送往下游
+                            if not state['closed']:
+                                state['end'] = item
+                            upstream.put(item)
+                            break
+                        seq = state['received']
+                        state['received'] += 1
+                    stats.observe_depth(upstream.qsize())
+
+                    start_time = time.monotonic()
+                    try:
+                        result = func(item)
+                    except Exception as e:
+                        result = _Failure(e)
+                    stats.record(time.monotonic() - start_time)
+
+                    with turn:
+                        while (state['emitted'] != seq and not state['closed']
+                               and not self._stop.is_set()):
+                            turn.wait(self._POLL_INTERVAL)
+                        if self._stop.is_set() or state['closed']:
+                            return
+                        state['emitted'] += 1
+                        turn.notify_all()
+                        if isinstance(result, _Failure):
+                            # 出错的这一条之后的结果都丢弃，异常由最后退出的线程送往下游
+                            state['end'] = result
+                            state['closed'] = True
+                            return
+                        ok = self._put(output, result, stats)
+                    if not ok:
+                        return
+            finally:
+                with turn:
+                    state['alive'] -= 1
+                    last = state['alive'] == 0
+                if last and not self._stop.is_set():
+                    self._put(output, state['end'], stats)
+
+        for i in range(workers):
+            self._start_thread(f'{name}-{i}', run)
+        return self
+
+    def sink(self, name: str) -> Iterator:
+        """在调用线程中按顺序逐条取出结果；两次取数之间的耗时记为该阶段的处理耗时
+
+        消费者提前结束循环（break）或出错时流水线自动停止；上游阶段的异常按顺序在这里重新抛出
+        """
+        if self._queue is None:
+            raise RuntimeError("请先添加数据源阶段")
+
+        stats = self.stats.stage(name)
+        upstream = self._queue
+        try:
+            while True:
+                item = self._get(upstream)
+                if isinstance(item, _Failure):
+                    raise item.error
+                if item is _END:
+                    return
+                stats.observe_depth(upstream.qsize())
+
+                start_time = time.monotonic()
+                yield item
+                stats.record(time.monotonic() - start_time)
+        finally:
+            self.close()
+
+    def close(self):
+        """停止流水线并等待所有工作线程退出"""
+        self.stop()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
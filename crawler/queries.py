@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点查询 - Web服务器、静态生成器和爬虫共用的SQL
+
+migrations.HOT_QUERIES 用这里的同一份SQL检查执行计划（python migrations.py --check、tests/test_migrations.py），
+修改查询后检查的就是实际执行的查询
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import retweets
+
+
+# 列表页和详情页的查询（条件、排序和分页另外追加）
+WEIBO_SELECT = f'''
+    SELECT w.*, u.name as user_name, {retweets.SELECT_COLUMNS}
+    FROM weibos w
+    LEFT JOIN users u ON w.uid = u.uid
+    {retweets.JOIN}
+'''
+
+WEIBO_BY_ID = WEIBO_SELECT + ' WHERE w.id = ?'
+
+COUNT_ALL = 'SELECT COUNT(*) FROM weibos'
+COUNT_BY_USER = 'SELECT COUNT(*) FROM weibos WHERE uid = ?'
+COUNT_BY_DATE = 'SELECT COUNT(*) FROM weibos WHERE created_ts >= ? AND created_ts < ?'
+
+# 最早/最新一条微博的发布时间（按ID排序，ID越小越早）
+EARLIEST_CREATED_AT = 'SELECT created_at FROM weibos ORDER BY id_int ASC LIMIT 1'
+LATEST_CREATED_AT = 'SELECT created_at FROM weibos ORDER BY id_int DESC LIMIT 1'
+
+# 爬虫：用户的全部微博ID（已知ID索引）和最新一条微博的ID
+USER_WEIBO_IDS = 'SELECT id FROM weibos WHERE uid = ?'
+USER_LATEST_ID = '''
+    SELECT id FROM weibos
+    WHERE uid = ?
+    ORDER BY id_int DESC
+    LIMIT 1
+'''
+
+
+def local_pics_query(count: int) -> str:
+    """count 条微博已下载图片的本地路径"""
+    placeholders = ','.join('?' * count)
+    return f'''
+        SELECT weibo_id, url, local_path FROM images
+        WHERE weibo_id IN ({placeholders}) AND downloaded = 1 AND local_path IS NOT NULL
+    '''
+
+
+def cursor_key_query(sort_columns: Sequence[str]) -> str:
+    """游标微博在各排序列上的取值"""
+    return f"SELECT {', '.join(sort_columns)} FROM weibos w WHERE w.id = ?"
+
+
+def weibo_page_query(sort_columns: Sequence[str], limit: Optional[int] = None, offset: int = 0,
+                     key: Optional[Sequence] = None, older: bool = True,
+                     where: Optional[str] = None, params: Sequence = (),
+                     bounds: Optional[Tuple] = None) -> Tuple[str, List]:
+    """按 sort_columns 取一页微博的SQL和参数
+
+    key 是游标微博在排序列上的取值：older 为真时取比它更旧的微博（倒序读），否则取更新的微博
+    （正序读，调用方再反转）；没有游标时按 OFFSET 倒序分页。
+    bounds 是第一个排序列的范围 (下限, 上限)，左闭右开：游标位置合并进这个范围，
+    否则 SQLite 会从范围的另一端扫到游标处。
+    """
+    conditions = [where] if where else []
+    condition_params = list(params)
+    lower, upper = bounds or (None, None)
+    if key is not None:
+        if bounds:
+            if older:
+                upper = min(upper, key[0] + 1)
+            else:
+                lower = max(lower, key[0])
+        conditions.append(f"({', '.join(sort_columns)}) {'<' if older else '>'} "
+                          f"({', '.join('?' * len(sort_columns))})")
+        condition_params += list(key)
+    if bounds:
+        conditions.insert(0, f'{sort_columns[0]} >= ? AND {sort_columns[0]} < ?')
+        condition_params = [lower, upper] + condition_params
+
+    direction = 'ASC' if key is not None and not older else 'DESC'
+    query = WEIBO_SELECT
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in sort_columns)
+    if limit is not None:
+        query += ' LIMIT ?'
+        condition_params.append(limit)
+        if key is None:
+            query += ' OFFSET ?'
+            condition_params.append(offset)
+    return query, condition_params
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限速器 - 按主机（端点）划分的令牌桶，速率根据响应情况自适应调整
+
+- 请求成功且延迟正常：速率缓慢上升（加性增加），直到 max_rate
+- 延迟明显变高：速率小幅下降
+- 418/429 或被限流的空页：速率减半（乘性减少），并暂停一段冷却时间，
+  连续被限流时冷却时间翻倍（不超过 max_cooldown）
+
+爬虫的所有请求线程、图片下载线程共享同一个 RateLimiter。
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+
+# 各端点的默认限速参数（rate/min_rate/max_rate 单位为 请求/秒）
+DEFAULT_LIMITS = {
+    'weibo.com': {
+        'rate': 0.5,
+        'burst': 2,
+        'min_rate': 0.05,
+        'max_rate': 2.0,
+        'target_latency': 2.0,
+        'cooldown': 30
+    },
+    'longtext': {
+        'rate': 0.5,
+        'burst': 2,
+        'min_rate': 0.05,
+        'max_rate': 2.0,
+        'target_latency': 2.0,
+        'cooldown': 30
+    },
+    'sinaimg.cn': {
+        'rate': 5.0,
+        'burst': 10,
+        'min_rate': 0.5,
+        'max_rate': 20.0,
+        'target_latency': 5.0,
+        'cooldown': 10
+    }
+}
+
+# 表示被限流的HTTP状态码
+THROTTLE_STATUS_CODES = (418, 429)
+
+
+class TokenBucket:
+    """自适应令牌桶"""
+
+    def __init__(self, rate: float, burst: float = 1, min_rate: float = None,
+                 max_rate: float = None, target_latency: float = 2.0,
+                 cooldown: float = 30, max_cooldown: float = 300,
+                 increase_step: float = None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.min_rate = float(min_rate if min_rate is not None else rate / 10)
+        self.max_rate = max(self.rate, float(max_rate if max_rate is not None else rate))
+        self.target_latency = float(target_latency)
+        self.cooldown = float(cooldown)
+        self.max_cooldown = max(self.cooldown, float(max_cooldown))
+        # 每次成功后增加的速率，默认约50次成功请求从最低速恢复到最高速
+        self.increase_step = float(increase_step if increase_step is not None
+                                   else (self.max_rate - self.min_rate) / 50)
+
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'slow': 0,
+            'wait_time': 0.0
+        }
+
+    def _refill(self, now: float):
+        """按当前速率补充令牌"""
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+    def acquire(self) -> float:
+        """取一个令牌，必要时等待；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.stats['requests'] += 1
+                        self.stats['wait_time'] += waited
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self, latency: float):
+        """请求成功：延迟正常时加速，延迟过高时小幅减速"""
+        with self._lock:
+            self._consecutive_throttles = 0
+            if latency > self.target_latency * 2:
+                self.stats['slow'] += 1
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            elif latency <= self.target_latency:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_error(self):
+        """请求出错（超时、连接失败）：按慢响应处理"""
+        with self._lock:
+            self.stats['slow'] += 1
+            self.rate = max(self.min_rate, self.rate * 0.8)
+
+    def snapshot(self) -> dict:
+        """当前统计和速率"""
+        with self._lock:
+            return dict(self.stats, rate=self.rate)
+
+    def on_throttle(self):
+        """被限流：速率减半，并暂停一段时间（连续被限流时加倍）"""
+        with self._lock:
+            self.stats['throttled'] += 1
+            now = time.monotonic()
+            if now < self._paused_until:
+                # 暂停前已经发出的并发请求陆续返回的限流，不再重复惩罚
+                return
+            self._consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = min(self.cooldown * 2 ** (self._consecutive_throttles - 1), self.max_cooldown)
+            self._paused_until = now + pause
+            self._tokens = 0
+
+
+class RateLimiter:
+    """按端点划分的限速器"""
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self._limits = {key: dict(value) for key, value in DEFAULT_LIMITS.items()}
+
+        # 兼容旧配置：delay 表示两次列表请求之间的秒数
+        delay = config.get('delay')
+        if delay:
+            self._limits['weibo.com']['rate'] = 1.0 / delay
+
+        for key, value in config.get('rate_limits', {}).items():
+            self._limits.setdefault(key, dict(DEFAULT_LIMITS['weibo.com'])).update(value)
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        """获取（或创建）某个端点的令牌桶"""
+        with self._lock:
+            if key not in self._buckets:
+                limits = self._limits.get(key, DEFAULT_LIMITS['weibo.com'])
+                self._buckets[key] = TokenBucket(**limits)
+            return self._buckets[key]
+
+    def acquire(self, key: str) -> float:
+        """请求前调用，返回等待的秒数"""
+        return self.bucket(key).acquire()
+
+    def record(self, key: str, status_code: int, latency: float):
+        """请求完成后调用，根据状态码和延迟调整速率"""
+        bucket = self.bucket(key)
+        if status_code in THROTTLE_STATUS_CODES:
+            bucket.on_throttle()
+        elif status_code < 500:
+            bucket.on_success(latency)
+
+    def record_error(self, key: str):
+        """请求出错（超时、连接失败）后调用"""
+        self.bucket(key).on_error()
+
+    def penalize(self, key: str, reason: str = ''):
+        """响应看起来被限流（如返回空页）时调用"""
+        if reason:
+            print(f"  限速: {key} {reason}，降低请求速率")
+        self.bucket(key).on_throttle()
+
+    def get_stats(self) -> Dict[str, dict]:
+        """获取各端点的统计信息"""
+        with self._lock:
+            buckets = dict(self._buckets)
+
+        return {key: bucket.snapshot() for key, bucket in buckets.items()}
+
+    def print_stats(self):
+        """打印限速统计"""
+        stats = self.get_stats()
+        if not stats:
+            return
+        print("限速统计:")
+        for key, item in sorted(stats.items()):
+            print(f"  {key}: 请求 {item['requests']} 次, 被限流 {item['throttled']} 次, "
+                  f"慢响应 {item['slow']} 次, 等待 {item['wait_time']:.1f}秒, "
+                  f"当前速率 {item['rate']:.2f} 次/秒")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+接口响应缓存 - 把很少变化的接口结果保存在本地，重复爬取时不再请求
+
+- 用户信息（profile）：每次爬取用户都会请求，定时任务每5分钟一次，缓存几个小时即可
+- 长文本（longtext）：按 微博ID + 编辑次数 缓存，强制更新、断点续爬重复抓到的长微博不再请求
+- 每个端点有自己的有效期（ttl，秒），过期的条目视为未命中
+- 缓存文件总大小超过 max_mb 时，按最近访问时间淘汰最久未用的条目（LRU）
+
+缓存保存在单独的 SQLite 文件中（默认 data/response_cache.db），删除该文件即清空缓存：
+
+    "response_cache": {
+        "enabled": true,
+        "path": "../data/response_cache.db",
+        "max_mb": 64,
+        "ttl": {"profile": 21600, "longtext": 2592000}
+    }
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config_loader import resolve_project_path
+
+
+# 各端点默认的有效期（秒）
+DEFAULT_TTLS = {
+    'profile': 6 * 3600,
+    'longtext': 30 * 24 * 3600
+}
+
+
+class ResponseCache:
+    """按端点设置有效期、按总大小LRU淘汰的持久化缓存（线程安全）"""
+
+    # 超出上限时淘汰到上限的这个比例，避免每次写入都触发淘汰
+    _EVICT_TARGET = 0.9
+
+    def __init__(self, path, ttls: Optional[Dict[str, float]] = None,
+                 max_bytes: int = 64 * 1024 * 1024, enabled: bool = True):
+        self.path = Path(path)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max(0, int(max_bytes))
+        self.enabled = enabled
+        self.stats: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size = 0
+
+        if not self.enabled:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 自动提交；所有线程共用一个连接，由 _lock 串行化
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL,
+                PRIMARY KEY (endpoint, key)
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache(accessed_at)')
+        self._size = self._total_size()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'ResponseCache':
+        """按配置创建缓存"""
+        options = config.get('response_cache', {})
+        return cls(resolve_project_path(options.get('path', '../data/response_cache.db')),
+                   ttls=options.get('ttl'),
+                   max_bytes=int(float(options.get('max_mb', 64)) * 1024 * 1024),
+                   enabled=options.get('enabled', True))
+
+    def _total_size(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM response_cache').fetchone()[0]
+
+    def _count(self, endpoint: str, name: str, value: int = 1):
+        self.stats.setdefault(endpoint, Counter())[name] += value
+
+    def get(self, endpoint: str, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created_at FROM response_cache WHERE endpoint = ? AND key = ?',
+                (endpoint, key)).fetchone()
+            if row is None:
+                self._count(endpoint, 'misses')
+                return None
+            if now - row[1] > self.ttls.get(endpoint, 0):
+                self._count(endpoint, 'misses')
+                self._count(endpoint, 'expired')
+                return None
+            self._conn.execute(
+                'UPDATE response_cache SET accessed_at = ? WHERE endpoint = ? AND key = ?',
+                (now, endpoint, key))
+            self._count(endpoint, 'hits')
+        return json.loads(row[0])
+
+    def put(self, endpoint: str, key: str, value: Any):
+        """写入缓存；总大小超过上限时淘汰最久未访问的条目"""
+        if not self.enabled or self.ttls.get(endpoint, 0) <= 0:
+            return
+
+        text = json.dumps(value, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                'SELECT size FROM response_cache WHERE endpoint = ? AND key = ?',
+                (endpoint, key)).fetchone()
+            self._conn.execute('''
+                INSERT OR REPLACE INTO response_cache (endpoint, key, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (endpoint, key, text, size, now, now))
+            self._size += size - (old[0] if old else 0)
+            self._count(endpoint, 'stores')
+            if self.max_bytes and self._size > self.max_bytes:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """先删除过期条目，仍超出上限时按最近访问时间淘汰（调用方持有锁）"""
+        for endpoint, ttl in self.ttls.items():
+            cursor = self._conn.execute(
+                'DELETE FROM response_cache WHERE endpoint = ? AND created_at < ?', (endpoint, now - ttl))
+            if cursor.rowcount:
+                self._count(endpoint, 'evictions', cursor.rowcount)
+
+        # 其他进程也可能在写同一个缓存文件，以实际大小为准
+        self._size = self._total_size()
+        target = self.max_bytes * self._EVICT_TARGET
+        while self._size > target:
+            rows = self._conn.execute('''
+                SELECT endpoint, key, size FROM response_cache ORDER BY accessed_at LIMIT 100
+            ''').fetchall()
+            if not rows:
+                break
+            for endpoint, key, size in rows:
+                if self._size <= target:
+                    break
+                self._conn.execute('DELETE FROM response_cache WHERE endpoint = ? AND key = ?',
+                                   (endpoint, key))
+                self._size -= size
+                self._count(endpoint, 'evictions')
+
+    def invalidate(self, endpoint: str, key: str):
+        """删除一条缓存"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute('DELETE FROM response_cache WHERE endpoint = ? AND key = ?', (endpoint, key))
+
+    def get_stats(self) -> Dict[str, dict]:
+        """各端点的命中/未命中/写入/淘汰次数"""
+        with self._lock:
+            return {endpoint: dict(counter) for endpoint, counter in self.stats.items()}
+
+    def print_stats(self):
+        """打印缓存统计（没有使用缓存时不输出）"""
+        stats = self.get_stats()
+        if not stats:
+            return
+        print(f"响应缓存（{self._size / 1024 / 1024:.1f} MB）:")
+        for endpoint, item in sorted(stats.items()):
+            hits, misses = item.get('hits', 0), item.get('misses', 0)
+            ratio = hits / (hits + misses) * 100 if hits + misses else 0.0
+            print(f"  {endpoint}: 命中 {hits} 次, 未命中 {misses} 次（过期 {item.get('expired', 0)}）, "
+                  f"命中率 {ratio:.0f}%, 写入 {item.get('stores', 0)} 条, 淘汰 {item.get('evictions', 0)} 条")
+
+    def close(self):
+        """关闭缓存文件"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.enabled = False
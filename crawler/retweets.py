@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转发原微博表 - 被转发的原微博只保存一份，转发微博通过 retweeted_id 引用
+
+旧版本把整个 retweeted_status 对象以JSON保存在每条转发微博中：热门原微博被转发多少次就重复保存多少份，
+每次渲染页面还要解析整段JSON。现在 retweeted_originals 表按原微博ID只保存页面显示的字段
+（作者、正文、图片地址），页面查询时按 retweeted_id 连表取出。
+
+旧数据库在爬虫启动时自动迁移（只迁移一次，迁移后整理数据库文件回收空间），也可以手动迁移：
+
+    python retweets.py
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import storage
+from config_loader import load_config, resolve_project_path
+
+
+DEFAULT_IMAGE_BASE = 'https://wx1.sinaimg.cn'
+
+# 页面查询转发微博时连表取出的字段（配合 attach 使用）
+SELECT_COLUMNS = ('r.screen_name AS retweeted_screen_name, r.text_raw AS retweeted_text, '
+                  'r.pics AS retweeted_pics')
+JOIN = 'LEFT JOIN retweeted_originals r ON r.id = w.retweeted_id'
+
+# 迁移时每批处理的行数
+_MIGRATE_BATCH = 1000
+
+
+def extract_pic_urls(weibo: Dict, image_base: str = DEFAULT_IMAGE_BASE) -> List[str]:
+    """提取图片URL - 优先使用pic_ids构造URL，其次使用pics数组"""
+    pic_ids = weibo.get('pic_ids', [])
+    if pic_ids:
+        # 新浪图片URL格式: https://wx1.sinaimg.cn/large/{pic_id}.jpg
+        return [f'{image_base}/large/{pic_id}.jpg' for pic_id in pic_ids]
+    # 降级方案：尝试从pics字段获取
+    return [pic.get('large', {}).get('url', '') for pic in weibo.get('pics', []) or []]
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """创建 retweeted_originals 表，为 weibos 表补充 retweeted_id 列"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS retweeted_originals (
+            id TEXT PRIMARY KEY,
+            uid TEXT,
+            screen_name TEXT,
+            text_raw TEXT,
+            pics TEXT,
+            created_at TEXT
+        )
+    ''')
+
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(weibos)')]
+    if 'retweeted_id' not in columns:
+        cursor.execute('ALTER TABLE weibos ADD COLUMN retweeted_id TEXT')
+
+
+def original_row(status: Dict, image_base: str = DEFAULT_IMAGE_BASE) -> Optional[tuple]:
+    """构造 retweeted_originals 表的一行；没有ID（如原微博已删除）时返回None"""
+    if not isinstance(status, dict) or not status.get('id'):
+        return None
+    user = status.get('user') or {}
+    return (str(status['id']), str(user.get('id', '')), user.get('screen_name', ''),
+            status.get('text_raw', status.get('text', '')),
+            json.dumps(extract_pic_urls(status, image_base), ensure_ascii=False),
+            status.get('created_at', ''))
+
+
+def save_originals(cursor: sqlite3.Cursor, rows: List[tuple]):
+    """写入原微博，已有的以最新抓到的内容为准"""
+    if rows:
+        cursor.executemany('''
+            INSERT INTO retweeted_originals (id, uid, screen_name, text_raw, pics, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                uid = excluded.uid,
+                screen_name = excluded.screen_name,
+                text_raw = excluded.text_raw,
+                pics = excluded.pics,
+                created_at = excluded.created_at
+        ''', rows)
+
+
+def attach(weibo: Dict) -> Dict:
+    """把连表取出的原微博字段（SELECT_COLUMNS）组装成模板使用的 retweeted_status"""
+    screen_name = weibo.pop('retweeted_screen_name', None)
+    text_raw = weibo.pop('retweeted_text', None)
+    pics = weibo.pop('retweeted_pics', None)
+    weibo['retweeted_status'] = None
+    if weibo.get('retweeted_id') and text_raw is not None:
+        weibo['retweeted_status'] = {
+            'user': {'screen_name': screen_name or ''},
+            'text_raw': text_raw,
+            'pics': [{'large': {'url': url}} for url in json.loads(pics or '[]') if url]
+        }
+    return weibo
+
+
+def migrate(conn: sqlite3.Connection, image_base: str = DEFAULT_IMAGE_BASE) -> int:
+    """把旧版本保存在 weibos.retweeted_status 中的JSON移到 retweeted_originals 表，返回迁移的行数
+
+    迁移后清空原来的JSON列；没有需要迁移的行时直接返回0
+    """
+    ensure_schema(conn)
+    cursor = conn.cursor()
+    migrated = 0
+    while True:
+        rows = cursor.execute('''
+            SELECT rowid, retweeted_status FROM weibos
+            WHERE retweeted_status IS NOT NULL AND retweeted_status <> ''
+            LIMIT ?
+        ''', (_MIGRATE_BATCH,)).fetchall()
+        if not rows:
+            break
+
+        originals = {}
+        updates = []
+        for rowid, text in rows:
+            try:
+                row = original_row(json.loads(text), image_base)
+            except ValueError:
+                # 旧版本页面上无法解析的JSON本来就不显示
+                row = None
+            if row is not None:
+                originals[row[0]] = row
+            updates.append((row[0] if row else None, rowid))
+
+        save_originals(cursor, list(originals.values()))
+        cursor.executemany(
+            'UPDATE weibos SET retweeted_id = ?, retweeted_status = NULL WHERE rowid = ?', updates)
+        migrated += len(rows)
+    conn.commit()
+    return migrated
+
+
+def main():
+    """迁移旧数据库中的转发微博并整理数据库文件"""
+    parser = argparse.ArgumentParser(description='把转发微博的原微博移到单独的表')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    db_path = resolve_project_path(config.get('database_path', '../data/database.db'))
+    if not db_path.exists():
+        print(f"数据库不存在: {db_path}")
+        return
+
+    size_before = db_path.stat().st_size
+    conn = storage.connect(db_path, config)
+    try:
+        migrated = migrate(conn, config.get('image_base', DEFAULT_IMAGE_BASE).rstrip('/'))
+        originals = conn.execute('SELECT COUNT(*) FROM retweeted_originals').fetchone()[0]
+        if migrated:
+            storage.vacuum(conn)
+    finally:
+        conn.close()
+
+    size_after = db_path.stat().st_size
+    print(f"迁移转发微博 {migrated} 条，原微博共 {originals} 条")
+    print(f"数据库大小: {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
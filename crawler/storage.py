@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接 - 爬虫、Web服务器和静态生成器统一从这里打开 data/database.db
+
+- WAL 模式：写入不阻塞读取，定时任务爬取时 gunicorn 的读请求不会再遇到 database is locked
+- busy_timeout：写写冲突时等待锁释放，而不是立即报错
+- 每个连接的页缓存（cache_mb）和内存映射（mmap_mb）：热数据直接从内存读，减少系统调用
+- synchronous=NORMAL：WAL 模式下断电最多丢失最后一次提交，不会损坏数据库
+- Checkpointer：后台定时把 WAL 写回数据库文件（PASSIVE，不等待读者），
+  避免读请求不断时 WAL 文件一直增长；爬虫退出时再截断 WAL
+
+配置（均有默认值，Web服务器直接使用默认值）：
+
+    "storage": {"journal_mode": "wal", "busy_timeout": 30, "cache_mb": 64, "mmap_mb": 256,
+                "checkpoint_interval": 60}
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+
+DEFAULT_OPTIONS = {
+    'journal_mode': 'wal',
+    'busy_timeout': 30,
+    'cache_mb': 64,
+    'mmap_mb': 256,
+    'checkpoint_interval': 60
+}
+
+
+def get_options(config: Optional[dict] = None) -> Dict:
+    """合并配置中的 storage 部分和默认值"""
+    return dict(DEFAULT_OPTIONS, **((config or {}).get('storage') or {}))
+
+
+def connect(db_path, config: Optional[dict] = None, **kwargs) -> sqlite3.Connection:
+    """打开数据库并设置日志模式和连接参数；kwargs 传给 sqlite3.connect"""
+    options = get_options(config)
+    busy_timeout = float(options['busy_timeout'])
+    conn = sqlite3.connect(str(db_path), timeout=busy_timeout, **kwargs)
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout * 1000)}')
+
+    # 日志模式保存在数据库文件中，已经是目标模式时不再切换（切换需要独占锁）
+    journal_mode = str(options['journal_mode']).lower()
+    if conn.execute('PRAGMA journal_mode').fetchone()[0].lower() != journal_mode:
+        conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    if journal_mode == 'wal':
+        conn.execute('PRAGMA synchronous = NORMAL')
+
+    conn.execute(f'PRAGMA cache_size = {-int(float(options["cache_mb"]) * 1024)}')
+    conn.execute(f'PRAGMA mmap_size = {int(float(options["mmap_mb"]) * 1024 * 1024)}')
+    return conn
+
+
+def vacuum(conn: sqlite3.Connection):
+    """整理数据库文件；WAL 模式下整理的结果先写入 WAL，写回后数据库文件才会变小"""
+    conn.execute('VACUUM')
+    if conn.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal':
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+class Checkpointer:
+    """后台定时执行 WAL checkpoint（用单独的连接，线程安全）"""
+
+    def __init__(self, db_path, config: Optional[dict] = None):
+        options = get_options(config)
+        self.db_path = Path(db_path)
+        self.config = config
+        self.interval = float(options['checkpoint_interval'])
+        self.enabled = str(options['journal_mode']).lower() == 'wal' and self.interval > 0
+        self.stats = {'checkpoints': 0, 'pages': 0, 'busy': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'Checkpointer':
+        """启动后台线程（未使用 WAL 或间隔为0时不启动）"""
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='checkpointer', daemon=True)
+            self._thread.start()
+        return self
+
+    def checkpoint(self, mode: str = 'PASSIVE', conn: Optional[sqlite3.Connection] = None) -> tuple:
+        """执行一次 checkpoint，返回 (是否被阻塞, WAL页数, 已写回页数)"""
+        own = conn is None
+        conn = conn or connect(self.db_path, self.config)
+        try:
+            busy, log_pages, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+        finally:
+            if own:
+                conn.close()
+        self.stats['checkpoints'] += 1
+        self.stats['pages'] += max(0, checkpointed)
+        self.stats['busy'] += busy
+        return busy, log_pages, checkpointed
+
+    def _run(self):
+        conn = connect(self.db_path, self.config, check_same_thread=False)
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.checkpoint('PASSIVE', conn)
+                except sqlite3.Error as e:
+                    print(f"  WAL checkpoint 失败: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        """停止后台线程，并尽量把 WAL 全部写回、截断 WAL 文件"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.checkpoint('TRUNCATE')
+        except sqlite3.Error as e:
+            print(f"  WAL checkpoint 失败: {e}")
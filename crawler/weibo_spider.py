@@ -4,29 +4,117 @@
 微博爬虫 - 抓取指定用户的所有微博
 """
 
+import hashlib
 import json
 import os
 import re
 import sqlite3
+import sys
+import threading
 import time
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import List, Dict, Optional
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+sys.path.insert(0, str(Path(__file__).parent))
+
+import codec
+import fetch_result
+import image_store
+import migrations
+import queries
+import retweets
+import storage
+from account_pool import AccountPool, AccountPoolExhausted
+from circuit_breaker import CircuitBreaker
+from config_loader import resolve_project_path
+from fetch_result import FetchResult
+from id_index import KnownIdIndex
+from image_downloader import ImageDownloader
+from pipeline import Pipeline, PipelineStats
+from rate_limiter import RateLimiter, THROTTLE_STATUS_CODES
+from response_cache import ResponseCache
+from work_queue import Heartbeat, WorkQueue, default_worker_id
+
 
 class WeiboSpider:
     """微博爬虫类"""
 
-    def __init__(self, config_path: str = "config.json"):
-        """初始化爬虫"""
-        self.config = self._load_config(config_path)
-        self.session = self._create_session()
-        self.db_conn = self._init_database()
+    def __init__(self, config_path: str = "config.json", config: Optional[dict] = None):
+        """初始化爬虫（传入 config 时不读取配置文件）"""
+        self.config = config if config is not None else self._load_config(config_path)
+
+        # 接口和图片地址，可指向本地模拟服务器做压测（见 mock_server.py）
+        self.api_base = self.config.get('api_base', 'https://weibo.com').rstrip('/')
+        self.image_base = self.config.get('image_base', 'https://wx1.sinaimg.cn').rstrip('/')
+
+        # 账号池：每个账号有独立的会话、接口限速和健康状态，接口请求分给健康的账号
+        self.accounts = AccountPool(self.config, self._create_session)
+        self.session = self.accounts.accounts[0].session
+
+        # 主机熔断器：接口连续出现临时错误时暂停请求（限流和Cookie过期由账号池处理）
+        self.circuit_breaker = CircuitBreaker.from_config(self.config)
+
+        # 接口响应缓存：用户信息和长文本很少变化，命中时不再请求
+        self.response_cache = ResponseCache.from_config(self.config)
+
+        # 每个线程使用独立的数据库连接（sqlite3连接不能跨线程共享）
+        self._local = threading.local()
+        self._connections = []
+        self._conn_lock = threading.Lock()
+        self.db_path = self._resolve_db_path()
+        self._init_database()
+
+        # 后台定时把 WAL 写回数据库文件，关闭时截断 WAL
+        self.checkpointer = storage.Checkpointer(self.db_path, self.config).start()
+
+        # 正文和图片列的编码（可选压缩，见 codec.py）；启用字典压缩但还没有字典时用已有微博训练一个
+        self.text_codec = codec.TextCodec.load(self.db_conn, self.config)
+        if self.text_codec.enabled and self.text_codec.use_dictionary and not self.text_codec.dictionaries:
+            codec.train(self.db_conn, self.text_codec)
+
+        # 图片下载限速（接口请求按账号限速，见 AccountPool）
+        self.rate_limiter = RateLimiter(self.config)
+
+        # 每个用户的爬取耗时，用于评估并发数
+        self.user_timings = []
+
+        # 全局吞吐统计（所有线程累加）
+        self.stats = {
+            'pages': 0,
+            'new_weibos': 0,
+            'updated_weibos': 0,
+            'db_write_time': 0.0
+        }
+
+        # 微博列表请求结果分类计数（见 fetch_result.py）
+        self.fetch_stats = Counter()
+
+        # 每个用户的已知微博ID索引（内存中判断是否已存在，不再逐条查库）
+        self._id_indexes = {}
+
+        # 长文本预取线程池（首次使用时创建，所有用户共享，请求经过 longtext 限速）
+        self._longtext_executor = None
+
+        # 流水线各阶段（抓取/补全/写库/图片）的统计，所有用户共用
+        self.pipeline_stats = PipelineStats()
+        for stage in ('fetch', 'enrich', 'persist'):
+            self.pipeline_stats.stage(stage)
+
+        # 后台图片下载池：保存微博时只入队，由下载线程负责下载
+        self.image_downloader = ImageDownloader(self.config, self.db_path,
+                                                session=self.session,
+                                                rate_limiter=self.rate_limiter)
+        self.image_downloader.stage_stats = self.pipeline_stats.stage(
+            'images', self.image_downloader.num_workers)
+        self.image_downloader.upstream_stats = self.pipeline_stats.stage('persist')
 
     def _load_config(self, config_path: str) -> dict:
         """加载配置文件"""
@@ -39,8 +127,8 @@ class WeiboSpider:
         with open(config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
 
-    def _create_session(self) -> requests.Session:
-        """创建带重试机制的会话"""
+    def _create_session(self, cookie: Optional[str] = None) -> requests.Session:
+        """创建带重试机制的会话（cookie 默认使用配置中的 cookie）"""
         session = requests.Session()
         retry = Retry(
             total=self.config.get('max_retries', 3),
@@ -54,186 +142,315 @@ class WeiboSpider:
         # 设置请求头
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Cookie': self.config.get('cookie', ''),
+            'Cookie': cookie if cookie is not None else self.config.get('cookie', ''),
             'Referer': 'https://weibo.com'
         })
         return session
 
-    def _init_database(self) -> sqlite3.Connection:
-        """初始化数据库"""
-        db_path_str = self.config.get('database_path', '../data/database.db')
-        db_path = Path(db_path_str)
-
+    def _resolve_db_path(self) -> Path:
+        """解析数据库文件路径"""
         # 如果是相对路径，相对于项目根目录（crawler的上级目录）
-        if not db_path.is_absolute():
-            # 获取项目根目录（crawler的父目录）
-            project_root = Path(__file__).parent.parent
-            db_path = project_root / db_path_str.lstrip('../')
-
+        db_path = resolve_project_path(self.config.get('database_path', '../data/database.db'))
         db_path.parent.mkdir(parents=True, exist_ok=True)
+        return db_path
+
+    @property
+    def db_conn(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # WAL 模式、忙等待和缓存参数见 storage.py；
+            # 连接只在创建它的线程中使用，close() 时统一在主线程关闭
+            conn = storage.connect(self.db_path, self.config, check_same_thread=False)
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
 
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-
-        # 创建用户表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                uid TEXT PRIMARY KEY,
-                name TEXT,
-                description TEXT,
-                followers_count INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 创建微博表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS weibos (
-                id TEXT PRIMARY KEY,
-                uid TEXT,
-                content TEXT,
-                created_at TEXT,
-                reposts_count INTEGER,
-                comments_count INTEGER,
-                attitudes_count INTEGER,
-                source TEXT,
-                pics TEXT,
-                retweeted_status TEXT,
-                crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (uid) REFERENCES users(uid)
-            )
-        ''')
-
-        # 创建图片表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS images (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                weibo_id TEXT,
-                url TEXT,
-                local_path TEXT,
-                downloaded INTEGER DEFAULT 0,
-                FOREIGN KEY (weibo_id) REFERENCES weibos(id)
-            )
-        ''')
-
-        # 创建全文搜索索引
-        cursor.execute('''
-            CREATE VIRTUAL TABLE IF NOT EXISTS weibos_fts
-            USING fts5(id, content, tokenize='porter unicode61')
-        ''')
+    def close_thread_connection(self):
+        """关闭当前线程的数据库连接（流水线等临时线程退出前调用）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._conn_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
 
-        conn.commit()
+    def _init_database(self) -> sqlite3.Connection:
+        """初始化数据库（创建表或升级旧数据库的表结构，见 migrations.py）"""
+        conn = self.db_conn
+        migrations.migrate(conn, self.config)
         return conn
 
+    def _get(self, url: str, key: str = 'weibo.com', timeout: int = 10) -> requests.Response:
+        """发送GET请求：从账号池取一个健康账号，经过该账号 key 端点的限速器和主机熔断器，并反馈响应状态和延迟
+
+        账号的Cookie过期时换下一个账号重试
+        """
+        host = urlparse(url).netloc
+        for _ in range(len(self.accounts)):
+            account = self.accounts.acquire()
+            self._local.account = account
+            try:
+                account.rate_limiter.acquire(key)
+                self.circuit_breaker.before_request(host)
+                start_time = time.time()
+                try:
+                    response = account.session.get(url, timeout=timeout)
+                except Exception as e:
+                    # 任何异常都要反馈给熔断器，否则半开状态的试探请求一直不结束，其他线程永远等待
+                    self.circuit_breaker.record_failure(host, type(e).__name__)
+                    if isinstance(e, requests.RequestException):
+                        account.rate_limiter.record_error(key)
+                    raise
+                if response.status_code >= 500:
+                    self.circuit_breaker.record_failure(host, f"HTTP {response.status_code}")
+                else:
+                    self.circuit_breaker.record_success(host)
+                account.rate_limiter.record(key, response.status_code, time.time() - start_time)
+                self.accounts.report(account, response)
+            finally:
+                self.accounts.release(account)
+
+            if not account.expired:
+                break
+        return response
+
     def fetch_user_info(self, uid: str) -> Optional[Dict]:
-        """获取用户信息"""
-        url = f'https://weibo.com/ajax/profile/info?uid={uid}'
+        """获取用户信息（优先使用响应缓存）"""
+        cached = self.response_cache.get('profile', str(uid))
+        if cached is not None:
+            return cached
+
+        url = f'{self.api_base}/ajax/profile/info?uid={uid}'
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url, timeout=10)
             response.raise_for_status()
             data = response.json()
 
             if data.get('ok') == 1:
                 user_info = data['data']['user']
-                return {
+                result = {
                     'uid': uid,
                     'name': user_info.get('screen_name', ''),
                     'description': user_info.get('description', ''),
                     'followers_count': user_info.get('followers_count', 0)
                 }
+                self.response_cache.put('profile', str(uid), result)
+                return result
         except Exception as e:
             print(f"获取用户信息失败 {uid}: {str(e)}")
         return None
 
-    def fetch_weibo_list(self, uid: str, page: int = 1) -> List[Dict]:
-        """获取用户微博列表"""
-        url = f'https://weibo.com/ajax/statuses/mymblog?uid={uid}&page={page}&feature=0'
+    def _fetch_page_once(self, uid: str, page: int) -> FetchResult:
+        """请求一次微博列表并分类结果（不重试）"""
+        url = f'{self.api_base}/ajax/statuses/mymblog?uid={uid}&page={page}&feature=0'
+        try:
+            response = self._get(url, timeout=10)
+        except AccountPoolExhausted as e:
+            return FetchResult(fetch_result.AUTH_EXPIRED, message=str(e))
+        except requests.RequestException as e:
+            return FetchResult(fetch_result.TRANSIENT, message=str(e))
+
+        account = self._local.account
+        status_code = response.status_code
+        if account.expired:
+            return FetchResult(fetch_result.AUTH_EXPIRED, message="所有账号的Cookie都已过期",
+                               http_status=status_code)
+        if status_code in THROTTLE_STATUS_CODES:
+            return FetchResult(fetch_result.THROTTLED, http_status=status_code)
+        if status_code >= 500:
+            return FetchResult(fetch_result.TRANSIENT, http_status=status_code)
+        if status_code >= 400:
+            return FetchResult(fetch_result.ERROR, http_status=status_code)
+
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
             data = response.json()
+        except ValueError:
+            # 网关错误页等非JSON响应
+            return FetchResult(fetch_result.TRANSIENT, message="响应不是JSON", http_status=status_code)
+        if data.get('ok') != 1:
+            return FetchResult(fetch_result.ERROR, message=f"ok={data.get('ok')} {data.get('msg', '')}".strip())
+
+        weibo_list = (data.get('data') or {}).get('list', []) or []
+        total = (data.get('data') or {}).get('total', 0) or 0
+        if weibo_list:
+            return FetchResult(fetch_result.OK, weibo_list, total=total)
+        if (page - 1) * 20 >= total:
+            return FetchResult(fetch_result.END, total=total)
+
+        # 还没到总数却返回空页，说明本次请求的账号被限流：降低该账号的速率并隔离，重试时换其他账号
+        account.rate_limiter.penalize('weibo.com')
+        self.accounts.mark_throttled(account, f"第{page}页返回空列表（共{total}条）")
+        return FetchResult(fetch_result.THROTTLED, message=f"空页（共{total}条）", http_status=status_code,
+                           total=total)
+
+    def fetch_page(self, uid: str, page: int = 1) -> FetchResult:
+        """获取用户微博列表的一页，返回分类后的结果（见 fetch_result.py）
+
+        被限流时重试 throttle_retries 次（默认2），临时错误重试 transient_retries 次（默认2）；
+        重试期间的等待由限速器、账号池和熔断器负责
+        """
+        throttle_retries = self.config.get('throttle_retries', 2)
+        transient_retries = self.config.get('transient_retries', 2)
+        throttled = transient = 0
+        while True:
+            result = self._fetch_page_once(uid, page)
+            if result.status == fetch_result.THROTTLED and throttled < throttle_retries:
+                throttled += 1
+                print(f"  第{page}页{result}，稍后重试")
+                continue
+            if result.status == fetch_result.TRANSIENT and transient < transient_retries:
+                transient += 1
+                print(f"  第{page}页{result}，稍后重试")
+                continue
+            break
+
+        if (result.status == fetch_result.THROTTLED and result.http_status == 200
+                and page * 20 >= (result.total or 0)):
+            # 多个账号重试后最后一页（按总数）仍是空的：总数常包含已删除/不可见的微博，按到底处理，
+            # 但调用方会看到 total 比实际少（见 crawl_user）；更靠前的空页仍是失败，不能当作爬完
+            result = FetchResult(fetch_result.END, message=result.message, total=result.total)
+
+        with self._conn_lock:
+            self.fetch_stats[result.status] += 1
+        if not result.ok:
+            print(f"获取微博列表失败 {uid} 第{page}页: {result}")
+        return result
+
+    def print_fetch_stats(self):
+        """打印微博列表请求结果的分类计数和熔断统计"""
+        with self._conn_lock:
+            stats = dict(self.fetch_stats)
+        if stats:
+            print("列表请求结果: " + ", ".join(
+                f"{name} {stats[status]} 次" for status, name in fetch_result.STATUS_NAMES.items()
+                if stats.get(status)))
+        self.circuit_breaker.print_stats()
 
-            if data.get('ok') == 1:
-                return data['data'].get('list', [])
-        except Exception as e:
-            print(f"获取微博列表失败 {uid} 第{page}页: {str(e)}")
-        return []
+    def fetch_weibo_list(self, uid: str, page: int = 1) -> List[Dict]:
+        """获取用户微博列表（失败时返回空列表；需要区分失败和到底时用 fetch_page）"""
+        return self.fetch_page(uid, page).weibos
 
     def download_image(self, url: str, weibo_id: str) -> Optional[str]:
-        """下载图片"""
+        """同步下载单张图片（后台下载池之外的场景使用）"""
         if not self.config.get('download_images', True):
             return None
 
         try:
-            # 创建图片保存目录
-            image_path_str = self.config.get('image_path', '../data/images')
-            image_dir = Path(image_path_str)
-
-            # 如果是相对路径，相对于项目根目录
-            if not image_dir.is_absolute():
-                project_root = Path(__file__).parent.parent
-                image_dir = project_root / image_path_str.lstrip('../')
-
-            # 确保weibo_id是字符串
-            weibo_id_str = str(weibo_id)
-            weibo_dir = image_dir / weibo_id_str
-            weibo_dir.mkdir(parents=True, exist_ok=True)
-
-            # 获取文件名
-            filename = url.split('/')[-1]
-            if '?' in filename:
-                filename = filename.split('?')[0]
-
-            local_path = weibo_dir / filename
-
-            # 如果文件已存在，跳过下载
-            if local_path.exists():
-                # 返回相对路径（从images目录开始）
-                return f"images/{weibo_id_str}/{filename}"
-
-            # 下载图片
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
-
-            # 返回相对路径（从images目录开始）
-            return f"images/{weibo_id_str}/{filename}"
-
+            return self.image_downloader.download(url)
         except Exception as e:
             print(f"下载图片失败 {url}: {str(e)}")
         return None
 
-    def weibo_exists(self, weibo_id: str) -> bool:
-        """检查微博是否已存在"""
+    def load_id_index(self, uid: str) -> KnownIdIndex:
+        """从数据库加载用户的已知微博ID索引"""
+        index = KnownIdIndex.load(self.db_conn, uid)
+        with self._conn_lock:
+            self._id_indexes[uid] = index
+        return index
+
+    def get_id_index(self, uid: str) -> Optional[KnownIdIndex]:
+        """获取已加载的用户ID索引"""
+        return self._id_indexes.get(uid)
+
+    def weibo_exists(self, weibo_id: str, uid: str = None) -> bool:
+        """检查微博是否已存在（已加载该用户索引时不查询数据库）"""
+        index = self.get_id_index(uid) if uid else None
+        if index is not None and KnownIdIndex.supports(weibo_id):
+            return weibo_id in index
+
         cursor = self.db_conn.cursor()
         cursor.execute('SELECT 1 FROM weibos WHERE id = ? LIMIT 1', (weibo_id,))
         return cursor.fetchone() is not None
 
     def get_latest_weibo_id(self, uid: str) -> Optional[str]:
-        """获取用户最新的微博ID"""
+        """获取用户最新的微博ID（ID越大越新，created_at是文本不能用于排序）"""
+        cursor = self.db_conn.cursor()
+        cursor.execute(queries.USER_LATEST_ID, (uid,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def get_high_water_mark(self, uid: str) -> Optional[int]:
+        """获取用户的高水位（已完整抓取到的最大数字微博ID）"""
+        cursor = self.db_conn.cursor()
+        cursor.execute('SELECT high_water_mark FROM crawl_state WHERE uid = ?', (uid,))
+        result = cursor.fetchone()
+        if result and result[0]:
+            return result[0]
+
+        # 旧数据库没有记录时，以已入库的最大ID为准
+        index = self.get_id_index(uid)
+        if index is not None:
+            return index.max_id()
+        latest_id = self.get_latest_weibo_id(uid)
+        return KnownIdIndex.to_int(latest_id) if latest_id else None
+
+    def set_high_water_mark(self, uid: str, high_water_mark: int):
+        """保存用户的高水位"""
+        cursor = self.db_conn.cursor()
+        cursor.execute('''
+            INSERT INTO crawl_state (uid, high_water_mark, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(uid) DO UPDATE SET
+                high_water_mark = excluded.high_water_mark,
+                updated_at = excluded.updated_at
+        ''', (uid, high_water_mark))
+        self.db_conn.commit()
+
+    def get_checkpoint(self, uid: str) -> Optional[Dict]:
+        """获取用户未完成的爬取断点"""
         cursor = self.db_conn.cursor()
         cursor.execute('''
-            SELECT id FROM weibos
-            WHERE uid = ?
-            ORDER BY created_at DESC
-            LIMIT 1
+            SELECT mode, last_page, oldest_id FROM crawl_checkpoints WHERE uid = ?
         ''', (uid,))
         result = cursor.fetchone()
-        return result[0] if result else None
+        if not result:
+            return None
+        return {'mode': result[0], 'last_page': result[1] or 0, 'oldest_id': result[2]}
+
+    def save_checkpoint(self, uid: str, mode: str, last_page: int, oldest_id: Optional[int]):
+        """记录爬取进度（不单独提交，和这一页的数据在同一个事务里提交）"""
+        cursor = self.db_conn.cursor()
+        cursor.execute('''
+            INSERT INTO crawl_checkpoints (uid, mode, last_page, oldest_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(uid) DO UPDATE SET
+                mode = excluded.mode,
+                last_page = excluded.last_page,
+                oldest_id = COALESCE(MIN(crawl_checkpoints.oldest_id, excluded.oldest_id),
+                                     crawl_checkpoints.oldest_id, excluded.oldest_id),
+                updated_at = CURRENT_TIMESTAMP
+        ''', (uid, mode, last_page, oldest_id))
+
+    def clear_checkpoint(self, uid: str):
+        """爬取完成后删除断点"""
+        cursor = self.db_conn.cursor()
+        cursor.execute('DELETE FROM crawl_checkpoints WHERE uid = ?', (uid,))
+        self.db_conn.commit()
+
+    @staticmethod
+    def is_pinned(weibo: Dict) -> bool:
+        """是否为置顶微博（置顶微博可能很旧，不能用于判断增量边界）"""
+        return bool(weibo.get('isTop')) or weibo.get('mblogtype') == 2
 
     def quick_check_new_weibos(self, uid: str, max_check: int = 5) -> bool:
         """快速检查是否有新微博（仅检查前几条ID，不下载完整内容）"""
         try:
-            weibos = self.fetch_weibo_list(uid, page=1)
+            result = self.fetch_page(uid, page=1)
+            if not result.ok:
+                # 请求失败不代表没有新微博，保守起见返回True继续完整爬取
+                return True
+            weibos = result.weibos
             if not weibos:
                 return False
 
             # 只检查前几条
             for weibo in weibos[:max_check]:
                 weibo_id = weibo.get('id', '')
-                if weibo_id and not self.weibo_exists(weibo_id):
+                if weibo_id and not self.weibo_exists(weibo_id, uid):
                     return True
 
             return False
@@ -242,119 +459,576 @@ class WeiboSpider:
             # 如果检查失败，保守起见返回True继续完整爬取
             return True
 
-    def fetch_long_text(self, weibo_id: str) -> Optional[str]:
-        """获取长文本完整内容"""
-        url = f'https://weibo.com/ajax/statuses/longtext?id={weibo_id}'
+    def fetch_long_text(self, weibo_id: str, version: Optional[int] = None) -> Optional[str]:
+        """获取长文本完整内容
+
+        version 为微博的编辑次数：给出时按 微博ID + 编辑次数 使用响应缓存（编辑过的微博不会命中旧内容）
+        """
+        cache_key = f'{weibo_id}:{version}' if version is not None else None
+        if cache_key:
+            cached = self.response_cache.get('longtext', cache_key)
+            if cached is not None:
+                return cached
+
+        url = f'{self.api_base}/ajax/statuses/longtext?id={weibo_id}'
         try:
-            response = self.session.get(url, timeout=10)
+            response = self._get(url, key='longtext', timeout=10)
             response.raise_for_status()
             data = response.json()
 
             if data.get('ok') == 1:
-                return data.get('data', {}).get('longTextContent', '')
+                content = data.get('data', {}).get('longTextContent', '')
+                if cache_key and content:
+                    self.response_cache.put('longtext', cache_key, content)
+                return content
         except Exception as e:
             print(f"  警告: 获取长文本失败 {weibo_id}: {str(e)}")
         return None
 
-    def save_weibo(self, weibo: Dict, uid: str) -> bool:
-        """保存微博到数据库，返回是否是新微博"""
+    @staticmethod
+    def _long_text_versions(weibos: List[Dict]) -> Dict[str, int]:
+        """各微博的编辑次数 {微博ID: edit_count}，用作长文本缓存的版本"""
+        return {str(weibo.get('id', '')): weibo.get('edit_count', 0) for weibo in weibos}
+
+    def prefetch_long_texts(self, weibo_ids: List[str],
+                            versions: Optional[Dict[str, int]] = None) -> Dict[str, Optional[str]]:
+        """并发获取一批长文本，返回 {微博ID: 完整内容}，失败的为None
+
+        并发数由 longtext_workers 控制（默认4），请求速率仍受 longtext 端点限速；
+        versions 为各微博的编辑次数，给出时先查响应缓存
+        """
+        if not weibo_ids:
+            return {}
+        versions = versions or {}
+        if len(weibo_ids) == 1:
+            weibo_id = str(weibo_ids[0])
+            return {weibo_id: self.fetch_long_text(weibo_id, versions.get(weibo_id))}
+
+        with self._conn_lock:
+            if self._longtext_executor is None:
+                workers = max(1, int(self.config.get('longtext_workers', 4)))
+                self._longtext_executor = ThreadPoolExecutor(max_workers=workers,
+                                                             thread_name_prefix='longtext')
+            executor = self._longtext_executor
+
+        futures = {str(weibo_id): executor.submit(self.fetch_long_text, weibo_id, versions.get(str(weibo_id)))
+                   for weibo_id in weibo_ids}
+        return {weibo_id: future.result() for weibo_id, future in futures.items()}
+
+    def _get_content(self, weibo: Dict, long_texts: Optional[Dict[str, Optional[str]]] = None) -> str:
+        """获取微博内容；长文本使用预取结果（未预取时单独请求），获取失败时返回None"""
+        if weibo.get('isLongText'):
+            weibo_id = str(weibo.get('id', ''))
+            if long_texts is not None and weibo_id in long_texts:
+                return long_texts[weibo_id]
+            return self.fetch_long_text(weibo_id, weibo.get('edit_count', 0))
+        return weibo.get('text_raw', weibo.get('text', ''))
+
+    def _record_long_text_results(self, cursor: sqlite3.Cursor, uid: str,
+                                  fetched: List[str], failed: List[str]):
+        """记录长文本获取结果：失败的加入待重试列表，成功的从列表中移除"""
+        if failed:
+            cursor.executemany('''
+                INSERT INTO longtext_failures (weibo_id, uid) VALUES (?, ?)
+                ON CONFLICT(weibo_id) DO UPDATE SET
+                    attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', [(weibo_id, uid) for weibo_id in failed])
+        if fetched:
+            cursor.executemany('DELETE FROM longtext_failures WHERE weibo_id = ?',
+                               [(weibo_id,) for weibo_id in fetched])
+
+    def retry_long_text_failures(self, uid: Optional[str] = None) -> tuple:
+        """重新获取之前失败的长文本并更新内容，返回 (修复数, 仍失败数)
+
+        超过 longtext_max_attempts 次（默认5）仍失败的不再重试，保留在表中供排查
+        """
+        max_attempts = int(self.config.get('longtext_max_attempts', 5))
         cursor = self.db_conn.cursor()
+        query = 'SELECT weibo_id FROM longtext_failures WHERE attempts < ?'
+        params = [max_attempts]
+        if uid:
+            query += ' AND uid = ?'
+            params.append(uid)
+        weibo_ids = [row[0] for row in cursor.execute(query, params).fetchall()]
+        if not weibo_ids:
+            return 0, 0
+
+        print(f"重试获取 {len(weibo_ids)} 条长文本...")
+        long_texts = self.prefetch_long_texts(weibo_ids)
+        update_rows = [(content, weibo_id) for weibo_id, content in long_texts.items() if content]
+        failed = [weibo_id for weibo_id, content in long_texts.items() if not content]
+
+        start_time = time.time()
+        cursor.executemany('UPDATE weibos SET content = ? WHERE id = ?',
+                           [(self.text_codec.encode(content), weibo_id) for content, weibo_id in update_rows])
+        cursor.executemany('UPDATE weibos_fts SET content = ? WHERE id = ?', update_rows)
+        self._record_long_text_results(cursor, uid, [row[1] for row in update_rows], failed)
+        self.db_conn.commit()
+        self._add_db_write_time(time.time() - start_time)
+
+        print(f"长文本重试完成: 修复 {len(update_rows)} 条, 仍失败 {len(failed)} 条")
+        return len(update_rows), len(failed)
+
+    def _extract_pic_urls(self, weibo: Dict) -> List[str]:
+        """提取图片URL - 优先使用pic_ids构造URL，其次使用pics数组"""
+        return retweets.extract_pic_urls(weibo, self.image_base)
+
+    @staticmethod
+    def fingerprint(weibo: Dict) -> str:
+        """微博的内容指纹：列表接口返回的文本和编辑次数
+
+        长微博的全文不在列表接口中，用截断文本、全文长度和编辑次数代替，
+        指纹不变时不需要重新请求长文本。互动数不计入指纹，直接和库中的值比较，
+        这样刷新互动数（refresh_counts）不会让指纹失效
+        """
+        source = [
+            weibo.get('text_raw', weibo.get('text', '')),
+            bool(weibo.get('isLongText')),
+            weibo.get('textLength'),
+            weibo.get('edit_count', 0)
+        ]
+        return hashlib.sha1(json.dumps(source, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def counts(weibo: Dict) -> List[int]:
+        """微博的互动数 [转发, 评论, 点赞]"""
+        return [weibo.get('reposts_count', 0), weibo.get('comments_count', 0),
+                weibo.get('attitudes_count', 0)]
+
+    @staticmethod
+    def parse_created_at(weibo: Dict) -> Optional[datetime]:
+        """解析微博的发布时间（带时区），无法解析时返回None"""
+        try:
+            return datetime.strptime(weibo.get('created_at', ''), '%a %b %d %H:%M:%S %z %Y')
+        except (TypeError, ValueError):
+            return None
 
-        # 提取微博信息
-        weibo_id = weibo.get('id', '')
+    def _build_weibo_row(self, weibo: Dict, uid: str, content: str) -> tuple:
+        """构造 weibos 表的一行数据（转发的原微博只记ID，内容见 _build_original_row）"""
+        original = self._build_original_row(weibo)
+        return (weibo.get('id', ''), uid, self.text_codec.encode(content), weibo.get('created_at', ''),
+                weibo.get('reposts_count', 0), weibo.get('comments_count', 0),
+                weibo.get('attitudes_count', 0), weibo.get('source', ''),
+                self.text_codec.encode(json.dumps(self._extract_pic_urls(weibo), ensure_ascii=False)),
+                original[0] if original else None, self.fingerprint(weibo),
+                migrations.id_int(weibo.get('id')), migrations.created_ts(weibo.get('created_at')))
+
+    def _build_original_row(self, weibo: Dict) -> Optional[tuple]:
+        """构造被转发的原微博在 retweeted_originals 表中的一行，不是转发时返回None"""
+        return retweets.original_row(weibo.get('retweeted_status'), self.image_base)
+
+    def _enqueue_images(self, weibo_ids: List[str]):
+        """将这些微博尚未下载的图片交给后台下载池（必须在提交之后调用）"""
+        if not weibo_ids or not self.config.get('download_images', True):
+            return
 
-        # 获取微博内容
-        # 如果是长文本，需要单独请求完整内容
-        if weibo.get('isLongText'):
-            content = self.fetch_long_text(weibo_id)
-            if not content:
-                # 如果获取失败，降级使用截断的文本
-                content = weibo.get('text_raw', weibo.get('text', ''))
-                print(f"  警告: 微博 {weibo_id} 使用截断文本")
-        else:
-            content = weibo.get('text_raw', weibo.get('text', ''))
+        # 仓库中已有的图片在保存时已标记为已下载，这里每个图片键只入队一次
+        cursor = self.db_conn.cursor()
+        placeholders = ','.join('?' * len(weibo_ids))
+        cursor.execute(f'''
+            SELECT store_key, MIN(url) FROM images
+            WHERE downloaded = 0 AND url IS NOT NULL AND weibo_id IN ({placeholders})
+            GROUP BY store_key ORDER BY MIN(id)
+        ''', [str(weibo_id) for weibo_id in weibo_ids])
+        for key, url in cursor.fetchall():
+            self.image_downloader.enqueue(key, url)
 
-        created_at = weibo.get('created_at', '')
+    def save_weibo(self, weibo: Dict, uid: str) -> bool:
+        """保存微博到数据库，返回是否是新微博"""
+        is_new = self.save_weibos([weibo], uid)[0] == 'new'
+        self.commit_pending()
+        return is_new
+
+    def _load_stored_versions(self, cursor: sqlite3.Cursor, weibo_ids: List[str]) -> Dict[str, tuple]:
+        """读取已存在微博的指纹、内容和互动数，以及待重试长文本的微博"""
+        if not weibo_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(weibo_ids))
+        cursor.execute(f'''
+            SELECT w.id, w.fingerprint, w.content, w.reposts_count, w.comments_count,
+                   w.attitudes_count, f.weibo_id IS NOT NULL
+            FROM weibos w
+            LEFT JOIN longtext_failures f ON f.weibo_id = w.id
+            WHERE w.id IN ({placeholders})
+        ''', weibo_ids)
+        return {str(row[0]): (row[1], self.text_codec.decode(row[2]), *row[3:]) for row in cursor.fetchall()}
+
+    def _plan_page(self, cursor: sqlite3.Cursor, weibos: List[Dict], uid: str) -> tuple:
+        """判断本页哪些微博已存在，返回 (已存在的ID集合, 库中版本, 指纹)
+
+        已加载索引时在内存中判断，其余ID一次查询；库中版本只在强制更新模式下读取
+        """
+        index = self.get_id_index(uid)
+        existing_ids = set()
+        query_ids = []
+        for weibo in weibos:
+            weibo_id = weibo.get('id', '')
+            if index is not None and KnownIdIndex.supports(weibo_id):
+                if weibo_id in index:
+                    existing_ids.add(str(weibo_id))
+            else:
+                query_ids.append(weibo_id)
 
-        # 检查是否已存在
-        exists = self.weibo_exists(weibo_id)
+        if query_ids:
+            placeholders = ','.join('?' * len(query_ids))
+            cursor.execute(f'SELECT id FROM weibos WHERE id IN ({placeholders})', query_ids)
+            existing_ids.update(str(row[0]) for row in cursor.fetchall())
 
-        # 如果开启强制更新模式，更新已存在的微博
+        # 强制更新模式：指纹没变且长文本不在待重试列表中的微博不需要重新获取内容
         force_update = self.config.get('force_update', False)
+        stored = self._load_stored_versions(cursor, sorted(existing_ids)) if force_update else {}
+        fingerprints = {str(weibo.get('id', '')): self.fingerprint(weibo) for weibo in weibos}
+        return existing_ids, stored, fingerprints
+
+    def _pending_change(self, weibo: Dict, existing_ids: set, stored: Dict[str, tuple],
+                        fingerprints: Dict[str, str]) -> Optional[str]:
+        """需要写入的内容：new / content / counts，不需要写入时返回None"""
+        weibo_id = str(weibo.get('id', ''))
+        if weibo_id not in existing_ids:
+            return 'new'
+        if weibo_id not in stored:
+            return None
+        fingerprint, _, *old_counts, long_text_failed_before = stored[weibo_id]
+        if fingerprint != fingerprints[weibo_id] or long_text_failed_before:
+            return 'content'
+        if self.counts(weibo) != old_counts:
+            return 'counts'
+        return None
 
-        if exists and not force_update:
-            return False
+    def _long_text_ids(self, weibos: List[Dict], plan: tuple) -> List[str]:
+        """本页需要获取完整内容的长文本微博ID（只有新微博和内容有变化的微博）"""
+        ids = [str(weibo.get('id', '')) for weibo in weibos
+               if weibo.get('isLongText') and self._pending_change(weibo, *plan) in ('new', 'content')]
+        return list(dict.fromkeys(ids))
 
-        if exists and force_update:
-            # 更新已存在的微博内容
-            cursor.execute('''
+    def save_weibos(self, weibos: List[Dict], uid: str,
+                    long_texts: Optional[Dict[str, Optional[str]]] = None) -> List[str]:
+        """批量保存一页微博，返回每条的结果：
+
+        - new: 新微博
+        - skipped: 已存在，跳过
+        - changed / unchanged / failed: 强制更新模式下已存在的微博内容有变化 / 没有变化 / 长文本获取失败
+
+        只做一次存在性查询，用 executemany 写入，提交时机由 commit_pending 决定。
+        强制更新模式下先比较内容指纹和互动数，指纹没变的微博不请求长文本，都没变的不写库。
+        long_texts 为流水线补全阶段已经获取的长文本，其余需要的长文本在这里获取。
+        """
+        if not weibos:
+            return []
+
+        cursor = self.db_conn.cursor()
+        force_update = self.config.get('force_update', False)
+        index = self.get_id_index(uid)
+        existing_ids, stored, fingerprints = plan = self._plan_page(cursor, weibos, uid)
+
+        # 长文本预取：只获取需要更新内容的微博的完整内容，并发请求
+        long_texts = dict(long_texts or {})
+        missing_ids = [weibo_id for weibo_id in self._long_text_ids(weibos, plan)
+                       if weibo_id not in long_texts]
+        long_texts.update(self.prefetch_long_texts(missing_ids, self._long_text_versions(weibos)))
+
+        results = []
+        weibo_rows = []
+        original_rows = []
+        fts_rows = []
+        image_rows = []
+        update_rows = []
+        fts_update_rows = []
+        long_text_fetched = []
+        long_text_failed = []
+
+        for weibo in weibos:
+            weibo_id = weibo.get('id', '')
+            exists = str(weibo_id) in existing_ids
+
+            change = self._pending_change(weibo, *plan) if exists else 'new'
+            if change is None:
+                results.append('unchanged' if force_update else 'skipped')
+                continue
+
+            if change == 'counts':
+                # 只有互动数变化，沿用库中的内容
+                content = stored[str(weibo_id)][1]
+            else:
+                content = self._get_content(weibo, long_texts)
+            if content is None:
+                long_text_failed.append(str(weibo_id))
+                if exists:
+                    # 不用截断文本覆盖已有内容，也不更新指纹，下次强制更新时再试
+                    print(f"  警告: 微博 {weibo_id} 长文本获取失败，保留原内容，稍后重试")
+                    results.append('failed')
+                    continue
+                # 先用截断的文本，记入失败列表，之后的重试会补全
+                content = weibo.get('text_raw', weibo.get('text', ''))
+                print(f"  警告: 微博 {weibo_id} 长文本获取失败，暂存截断文本，稍后重试")
+            elif weibo.get('isLongText') and change != 'counts':
+                long_text_fetched.append(str(weibo_id))
+
+            if exists:
+                # 强制更新模式：只写入内容或互动数真正变化的微博
+                _, old_content, *old_counts, _ = stored[str(weibo_id)]
+                counts = self.counts(weibo)
+                update_rows.append((self.text_codec.encode(content), *counts, fingerprints[str(weibo_id)],
+                                    weibo_id))
+                if content != old_content:
+                    fts_update_rows.append((content, weibo_id))
+                results.append('changed' if content != old_content or counts != old_counts
+                               else 'unchanged')
+                continue
+
+            # 同一页内重复出现的微博只插入一次
+            existing_ids.add(str(weibo_id))
+            if index is not None:
+                index.add(weibo_id)
+
+            row = self._build_weibo_row(weibo, uid, content)
+            weibo_rows.append(row)
+            original = self._build_original_row(weibo)
+            if original:
+                original_rows.append(original)
+            fts_rows.append((weibo_id, content))
+            for pic_url in self._extract_pic_urls(weibo):
+                # 图片先记为未下载，提交后交给后台下载池
+                image_rows.append((weibo_id, pic_url, image_store.store_key(pic_url)))
+            results.append('new')
+
+        start_time = time.time()
+
+        if weibo_rows:
+            cursor.executemany('''
+                INSERT INTO weibos
+                (id, uid, content, created_at, reposts_count, comments_count,
+                 attitudes_count, source, pics, retweeted_id, fingerprint, id_int, created_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', weibo_rows)
+            retweets.save_originals(cursor, original_rows)
+
+            # 插入全文搜索表
+            cursor.executemany('''
+                INSERT INTO weibos_fts (id, content)
+                VALUES (?, ?)
+            ''', fts_rows)
+
+            cursor.executemany('''
+                INSERT INTO images (weibo_id, url, local_path, downloaded, store_key)
+                VALUES (?, ?, NULL, 0, ?)
+            ''', image_rows)
+
+            # 登记图片引用；仓库中已有的图片直接指向已有文件，不再下载
+            image_store.add_references(cursor, [row[2] for row in image_rows])
+            image_store.resolve_stored(cursor, [row[0] for row in weibo_rows])
+
+        if update_rows:
+            cursor.executemany('''
                 UPDATE weibos
-                SET content = ?
+                SET content = ?, reposts_count = ?, comments_count = ?,
+                    attitudes_count = ?, fingerprint = ?
                 WHERE id = ?
-            ''', (content, weibo_id))
+            ''', update_rows)
 
-            # 更新全文搜索表
-            cursor.execute('''
+        if fts_update_rows:
+            # 只有正文变化时才更新全文搜索表
+            cursor.executemany('''
                 UPDATE weibos_fts
                 SET content = ?
                 WHERE id = ?
-            ''', (content, weibo_id))
+            ''', fts_update_rows)
 
-            self.db_conn.commit()
-            return False  # 返回False表示不是新微博，是更新
-
-        # 统计信息
-        reposts_count = weibo.get('reposts_count', 0)
-        comments_count = weibo.get('comments_count', 0)
-        attitudes_count = weibo.get('attitudes_count', 0)
-        source = weibo.get('source', '')
-
-        # 图片信息 - 优先使用pic_ids构造URL，其次使用pics数组
-        pic_urls = []
-        pic_ids = weibo.get('pic_ids', [])
-        if pic_ids:
-            # 通过pic_id构造图片URL
-            for pic_id in pic_ids:
-                # 新浪图片URL格式: https://wx1.sinaimg.cn/large/{pic_id}.jpg
-                pic_url = f'https://wx1.sinaimg.cn/large/{pic_id}.jpg'
-                pic_urls.append(pic_url)
-        else:
-            # 降级方案：尝试从pics字段获取
-            pics = weibo.get('pics', [])
-            pic_urls = [pic.get('large', {}).get('url', '') for pic in pics]
+        # 只有真正写入了完整内容的微博才从待重试列表中移除
+        self._record_long_text_results(cursor, uid, long_text_fetched, long_text_failed)
 
-        # 转发微博
-        retweeted_status = weibo.get('retweeted_status')
-        retweeted_text = ''
-        if retweeted_status:
-            retweeted_text = json.dumps(retweeted_status, ensure_ascii=False)
+        self._local.pending_weibo_ids = (getattr(self._local, 'pending_weibo_ids', [])
+                                         + [row[0] for row in weibo_rows])
+        self._local.pending_pages = getattr(self._local, 'pending_pages', 0) + 1
+        self._add_db_write_time(time.time() - start_time)
 
-        # 插入微博
-        cursor.execute('''
-            INSERT INTO weibos
-            (id, uid, content, created_at, reposts_count, comments_count,
-             attitudes_count, source, pics, retweeted_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (weibo_id, uid, content, created_at, reposts_count,
-              comments_count, attitudes_count, source,
-              json.dumps(pic_urls, ensure_ascii=False), retweeted_text))
-
-        # 插入全文搜索表
-        cursor.execute('''
-            INSERT INTO weibos_fts (id, content)
-            VALUES (?, ?)
-        ''', (weibo_id, content))
+        if self._local.pending_pages >= max(1, int(self.config.get('commit_interval', 1))):
+            self.commit_pending()
 
-        # 下载并保存图片
-        for pic_url in pic_urls:
-            local_path = self.download_image(pic_url, weibo_id)
-            cursor.execute('''
-                INSERT INTO images (weibo_id, url, local_path, downloaded)
-                VALUES (?, ?, ?, ?)
-            ''', (weibo_id, pic_url, local_path, 1 if local_path else 0))
+        return results
 
+    def _add_stat(self, key: str, value):
+        """累加全局统计"""
+        with self._conn_lock:
+            self.stats[key] += value
+
+    def _add_db_write_time(self, elapsed: float):
+        """累加数据库写入耗时（当前线程和全局）"""
+        self._local.db_write_time = getattr(self._local, 'db_write_time', 0.0) + elapsed
+        self._add_stat('db_write_time', elapsed)
+
+    def commit_pending(self):
+        """提交当前线程未提交的写入，并把新图片交给下载池"""
+        start_time = time.time()
         self.db_conn.commit()
-        return True
+        self._add_db_write_time(time.time() - start_time)
+
+        pending = getattr(self._local, 'pending_weibo_ids', [])
+        self._local.pending_weibo_ids = []
+        self._local.pending_pages = 0
+        self._enqueue_images(pending)
+
+    def save_counts(self, weibos: List[Dict]) -> Dict[str, int]:
+        """批量更新一页微博的互动数，并为有变化的微博追加历史快照
+
+        不修改内容和全文搜索表；库中没有的微博不会插入。返回 updated/unchanged/missing 计数
+        """
+        result = {'updated': 0, 'unchanged': 0, 'missing': 0}
+        latest = {}
+        for weibo in weibos:
+            if KnownIdIndex.to_int(weibo.get('id')) is not None:
+                latest[str(weibo.get('id'))] = self.counts(weibo)
+        if not latest:
+            return result
+
+        cursor = self.db_conn.cursor()
+        placeholders = ','.join('?' * len(latest))
+        cursor.execute(f'''
+            SELECT id, reposts_count, comments_count, attitudes_count
+            FROM weibos WHERE id IN ({placeholders})
+        ''', list(latest))
+        stored = {str(row[0]): list(row[1:]) for row in cursor.fetchall()}
+
+        changed = [(weibo_id, counts) for weibo_id, counts in latest.items()
+                   if weibo_id in stored and counts != stored[weibo_id]]
+        result['missing'] = len(latest) - len(stored)
+        result['unchanged'] = len(stored) - len(changed)
+        result['updated'] = len(changed)
+        if not changed:
+            return result
+
+        start_time = time.time()
+        changed_ids = [weibo_id for weibo_id, _ in changed]
+        placeholders = ','.join('?' * len(changed_ids))
+
+        # 第一次变化时补一个入库时的快照作为起点
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO weibo_count_history
+            (weibo_id, ts, reposts_count, comments_count, attitudes_count)
+            SELECT CAST(id AS INTEGER), CAST(strftime('%s', crawled_at) AS INTEGER),
+                   reposts_count, comments_count, attitudes_count
+            FROM weibos
+            WHERE id IN ({placeholders}) AND crawled_at IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM weibo_count_history h
+                              WHERE h.weibo_id = CAST(weibos.id AS INTEGER))
+        ''', changed_ids)
+
+        now = int(time.time())
+        cursor.executemany('''
+            INSERT OR REPLACE INTO weibo_count_history
+            (weibo_id, ts, reposts_count, comments_count, attitudes_count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(int(weibo_id), now, *counts) for weibo_id, counts in changed])
+
+        cursor.executemany('''
+            UPDATE weibos
+            SET reposts_count = ?, comments_count = ?, attitudes_count = ?
+            WHERE id = ?
+        ''', [(*counts, weibo_id) for weibo_id, counts in changed])
+
+        self.db_conn.commit()
+        self._add_db_write_time(time.time() - start_time)
+        return result
+
+    def refresh_counts(self, uid: str, name: str = '', days: Optional[int] = None) -> Dict[str, int]:
+        """刷新最近 days 天内微博的互动数（默认 refresh_days，7天）
+
+        从第一页开始翻列表，直到出现早于时间窗口的非置顶微博为止，每页批量更新一次
+        """
+        days = days if days is not None else int(self.config.get('refresh_days', 7))
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        print(f"\n刷新用户 {name} ({uid}) 最近 {days} 天微博的互动数")
+
+        self._local.db_write_time = 0.0
+        total = {'updated': 0, 'unchanged': 0, 'missing': 0}
+        page = 1
+        while True:
+            # 请求失败时抛出 FetchError，不把失败当作翻到底
+            weibos = self.fetch_page(uid, page).raise_for_error().weibos
+            if not weibos:
+                break
+
+            in_window = []
+            reached_end = False
+            for weibo in weibos:
+                created_at = self.parse_created_at(weibo)
+                if created_at is None or created_at >= cutoff:
+                    in_window.append(weibo)
+                elif not self.is_pinned(weibo):
+                    reached_end = True
+
+            result = self.save_counts(in_window)
+            for key, value in result.items():
+                total[key] += value
+            self._add_stat('pages', 1)
+            print(f"第 {page} 页: 更新 {result['updated']} 条, 未变 {result['unchanged']} 条")
+
+            if reached_end:
+                break
+            page += 1
+
+        print(f"用户 {name} 互动数刷新完成: 更新 {total['updated']} 条, 未变 {total['unchanged']} 条, "
+              f"未入库 {total['missing']} 条")
+        return total
+
+    @staticmethod
+    def _page_ids(weibos: List[Dict]) -> List[int]:
+        """一页中非置顶微博的数字ID（置顶微博可能很旧，不参与高水位判断）"""
+        page_ids = [KnownIdIndex.to_int(weibo.get('id', ''))
+                    for weibo in weibos if not WeiboSpider.is_pinned(weibo)]
+        return [weibo_id for weibo_id in page_ids if weibo_id]
+
+    def _fetch_pages(self, uid: str, mode: str, start_page: int, first_page: Optional[List[Dict]],
+                     high_water_mark: Optional[int], checkpoint: Optional[Dict]):
+        """抓取阶段：按顺序逐页请求微博列表，产出 {page, weibos, page_ids}
+
+        空页（没有更多微博）也会产出，随后结束；增量模式下越过高水位的一页产出后结束，不再多抓。
+        total 为接口返回的微博总数，写库阶段用它判断空页是否来得过早。
+        请求失败（被限流、Cookie过期、临时错误）时抛出 FetchError，而不是当作空页
+        """
+        page = start_page
+        step_back_budget = 5 if checkpoint else 0  # 断点页前移时最多往回退的页数
+        while True:
+            if page == 1 and first_page is not None:
+                weibos, first_page, total = first_page, None, None
+            else:
+                print(f"正在爬取第 {page} 页...")
+                # 请求失败时抛出 FetchError（按顺序传给写库阶段），之前的页照常写入，断点保留
+                result = self.fetch_page(uid, page).raise_for_error()
+                weibos, total = result.weibos, result.total
+            page_ids = self._page_ids(weibos)
+
+            # 断点续爬：如果有微博被删除，断点页会整体前移，这一页可能已经比断点处更旧，往回退一页
+            if (step_back_budget and page > 1 and page_ids and checkpoint['oldest_id']
+                    and max(page_ids) < checkpoint['oldest_id']):
+                step_back_budget -= 1
+                page -= 1
+                continue
+            step_back_budget = 0
+
+            yield {'page': page, 'weibos': weibos, 'page_ids': page_ids, 'total': total}
+            if not weibos:
+                return
+            if mode == "incremental" and high_water_mark and any(
+                    weibo_id <= high_water_mark for weibo_id in page_ids):
+                return
+            # 请求间隔由限速器控制
+            page += 1
+
+    def _enrich_page(self, item: Dict, uid: str) -> Dict:
+        """补全阶段：并发获取本页需要的长文本
+
+        这里只能看到已提交的数据，判断结果只用于预取；写库阶段会重新判断并补齐遗漏的长文本
+        """
+        weibos = item['weibos']
+        item['long_texts'] = {}
+        if weibos:
+            plan = self._plan_page(self.db_conn.cursor(), weibos, uid)
+            item['long_texts'] = self.prefetch_long_texts(self._long_text_ids(weibos, plan),
+                                                          self._long_text_versions(weibos))
+        return item
 
     def crawl_user(self, uid: str, name: str = ''):
         """爬取指定用户的所有微博（增量更新）"""
@@ -372,104 +1046,271 @@ class WeiboSpider:
             self.db_conn.commit()
             print(f"用户信息: {user_info['name']}, 粉丝数: {user_info['followers_count']}")
 
-        # 检查数据库中是否已有该用户的微博
-        cursor = self.db_conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM weibos WHERE uid = ?', (uid,))
-        existing_count = cursor.fetchone()[0]
+        # 加载该用户的已知微博ID索引
+        index = self.load_id_index(uid)
+        existing_count = len(index)
+        if existing_count > 0:
+            print(f"已加载 {existing_count} 个已知微博ID（索引占用 {index.memory_bytes() / 1024 / 1024:.1f} MB）")
 
         force_update = self.config.get('force_update', False)
-
-        if existing_count > 0:
+        high_water_mark = None
+        first_page = None
+        start_page = 1
+
+        # 上次的全量爬取/强制更新没有完成：从断点继续，而不是退化成增量模式提前停止
+        checkpoint = self.get_checkpoint(uid)
+        if checkpoint and checkpoint['mode'] == 'force_update' and not force_update:
+            self.clear_checkpoint(uid)
+            checkpoint = None
+
+        if checkpoint:
+            mode = checkpoint['mode']
+            # 从最后完成的那一页重新开始：新微博会把旧微博往后挤，重叠一页更稳妥
+            start_page = max(1, checkpoint['last_page'])
+            print(f"发现未完成的爬取（{mode}，已完成到第 {checkpoint['last_page']} 页，"
+                  f"最旧微博 {checkpoint['oldest_id']}），从第 {start_page} 页继续...")
+        elif existing_count > 0 or self.get_high_water_mark(uid):
+            # 分布式模式下本机可能没有该用户的微博，但队列中带来了其他机器爬到的高水位
             if force_update:
                 print(f"数据库中已有 {existing_count} 条微博，开始强制更新...")
                 mode = "force_update"
             else:
                 print(f"数据库中已有 {existing_count} 条微博，开始增量更新...")
                 mode = "incremental"
+                high_water_mark = self.get_high_water_mark(uid)
 
-                # 快速检查：如果前5条都已存在，直接跳过（适合频繁更新场景）
-                # 注意：强制更新模式下跳过此检查
-                print(f"执行快速检查（检查前5条ID）...")
-                has_new = self.quick_check_new_weibos(uid, max_check=5)
-                if not has_new:
-                    print(f"快速检查：前5条都已存在，无新微博，跳过爬取")
+                # 快速检查：第一页没有未入库的微博，直接跳过（第一页会在下面复用，不重复请求）
+                first_page = self.fetch_page(uid, 1).raise_for_error().weibos
+                if first_page and not any(not self.weibo_exists(weibo.get('id', ''), uid)
+                                          for weibo in first_page):
+                    print(f"快速检查：第一页都已存在，无新微博，跳过爬取")
                     print(f"\n用户 {name} 爬取完成:")
                     print(f"  新增微博: 0 条")
                     print(f"  跳过已存在: 0 条")
                     print(f"  数据库总计: {existing_count} 条")
                     print(f"  [超快模式] 快速检查发现无更新")
                     return
-                else:
-                    print(f"快速检查：发现新微博，开始完整爬取...")
+                print(f"快速检查：发现新微博（高水位: {high_water_mark}），开始增量爬取...")
         else:
             print(f"首次爬取该用户，将获取所有微博...")
             mode = "full"
 
-        # 爬取微博
-        page = 1
+        # 爬取微博：抓取 → 补全长文本 → 写库 三个阶段用有界队列连接，抓取可以领先写库几页
+        crawl_start = time.time()
+        self._local.db_write_time = 0.0
         new_weibos = 0
-        updated_weibos = 0  # 强制更新模式下更新的微博数
+        updated_weibos = 0  # 强制更新模式下内容或互动数有变化的微博数
+        unchanged_weibos = 0  # 强制更新模式下没有变化的微博数
+        failed_weibos = 0  # 强制更新模式下长文本获取失败、保留原内容的微博数
         skipped_weibos = 0
         consecutive_existing = 0  # 连续遇到已存在微博的计数
-        first_page_all_exist = False  # 第一页是否全部已存在
-
-        while True:
-            print(f"正在爬取第 {page} 页...")
-            weibos = self.fetch_weibo_list(uid, page)
+        max_seen_id = 0  # 本次看到的最大非置顶微博ID
+        completed = False  # 是否走到了增量边界或最后一页
+
+        pipeline_config = self.config.get('pipeline', {})
+        pipeline = Pipeline(self.pipeline_stats,
+                            queue_size=pipeline_config.get('queue_size', 4),
+                            on_thread_exit=self.close_thread_connection)
+        pipeline.source('fetch', self._fetch_pages(uid, mode, start_page, first_page,
+                                                   high_water_mark, checkpoint))
+        pipeline.stage('enrich', lambda item: self._enrich_page(item, uid),
+                       workers=pipeline_config.get('enrich_workers', 2))
 
-            if not weibos:
-                print("没有更多微博了")
-                break
-
-            page_new_count = 0
-            page_updated_count = 0
-            for weibo in weibos:
-                is_new = self.save_weibo(weibo, uid)
-                if is_new:
-                    new_weibos += 1
-                    page_new_count += 1
-                    consecutive_existing = 0  # 重置计数
-                else:
-                    if mode == "force_update":
-                        # 强制更新模式下，已存在的微博被更新了
+        try:
+            for item in pipeline.sink('persist'):
+                page, weibos, page_ids = item['page'], item['weibos'], item['page_ids']
+                if not weibos:
+                    total = item['total'] or 0
+                    if (page - 1) * 20 < total:
+                        # 按总数还没到底就是空页（总数可能包含已删除的微博，也可能是限流）：
+                        # 不当作爬完，保留断点、不推进高水位，下次从断点重新检查
+                        stored = self.db_conn.execute(queries.COUNT_BY_USER, (uid,)).fetchone()[0]
+                        print(f"第 {page} 页为空，但接口显示共 {total} 条，已入库 {stored} 条"
+                              f"（缺 {max(0, total - stored)} 条），保留断点，不推进高水位")
+                        break
+                    print("没有更多微博了")
+                    completed = True
+                    break
+
+                if mode in ("full", "force_update"):
+                    self.save_checkpoint(uid, mode, page, min(page_ids) if page_ids else None)
+
+                page_new_count = 0
+                page_updated_count = 0
+                page_unchanged_count = 0
+                page_failed_count = 0
+                for status in self.save_weibos(weibos, uid, item['long_texts']):
+                    if status == 'new':
+                        new_weibos += 1
+                        page_new_count += 1
+                        consecutive_existing = 0  # 重置计数
+                    elif status == 'changed':
                         updated_weibos += 1
                         page_updated_count += 1
+                    elif status == 'unchanged':
+                        unchanged_weibos += 1
+                        page_unchanged_count += 1
+                    elif status == 'failed':
+                        failed_weibos += 1
+                        page_failed_count += 1
                     else:
                         skipped_weibos += 1
                         consecutive_existing += 1
 
-            if mode == "force_update":
-                print(f"第 {page} 页完成，新增 {page_new_count} 条，更新 {page_updated_count} 条")
-            else:
-                print(f"第 {page} 页完成，新增 {page_new_count} 条，跳过 {len(weibos) - page_new_count} 条")
-
-            # 优化：第一页如果全部已存在，立即退出（仅在增量模式）
-            if page == 1 and page_new_count == 0 and len(weibos) > 0 and mode == "incremental":
-                print(f"第一页全部已存在，无新微博，快速退出")
-                first_page_all_exist = True
-                break
-
-            # 增量更新模式：如果连续2页都是已存在的微博，说明已经更新完毕
-            if mode == "incremental" and consecutive_existing >= 40:  # 2页约40条
-                print(f"连续遇到已存在的微博，增量更新完成")
-                break
+                self._add_stat('pages', 1)
+                self._add_stat('new_weibos', page_new_count)
+                self._add_stat('updated_weibos', page_updated_count)
 
-            # 延迟，避免请求过快
-            time.sleep(self.config.get('delay', 2))
-            page += 1
+                if mode == "force_update":
+                    print(f"第 {page} 页完成，新增 {page_new_count} 条，更新 {page_updated_count} 条，"
+                          f"未变 {page_unchanged_count} 条，失败 {page_failed_count} 条")
+                else:
+                    print(f"第 {page} 页完成，新增 {page_new_count} 条，跳过 {len(weibos) - page_new_count} 条")
+
+                if page_ids:
+                    max_seen_id = max(max_seen_id, max(page_ids))
+
+                # 增量更新模式：本页已经越过高水位，说明之后都是已抓取过的微博
+                if mode == "incremental" and high_water_mark and any(
+                        weibo_id <= high_water_mark for weibo_id in page_ids):
+                    print(f"已到达上次抓取的位置（高水位 {high_water_mark}），增量更新完成")
+                    completed = True
+                    break
+
+                # 没有高水位时的兜底：连续2页都是已存在的微博，说明已经更新完毕
+                # （结束循环会停止流水线，抓取阶段已经领先抓到的页直接丢弃）
+                if mode == "incremental" and not high_water_mark and consecutive_existing >= 40:  # 2页约40条
+                    print(f"连续遇到已存在的微博，增量更新完成")
+                    completed = True
+                    break
+        finally:
+            pipeline.close()
+
+        # 提交剩余未提交的页
+        self.commit_pending()
+
+        # 补抓之前（包括本次）获取失败的长文本
+        self.retry_long_text_failures(uid)
+
+        # 只有完整走到边界才推进高水位，中途失败时下次仍会补抓中间的微博
+        if completed:
+            new_high_water_mark = max(max_seen_id, high_water_mark or 0)
+            if mode in ("full", "force_update"):
+                # 全量爬取走完后库里所有微博都已抓全（包括断点之前的页）
+                new_high_water_mark = max(new_high_water_mark, index.max_id() or 0)
+                self.clear_checkpoint(uid)
+            if new_high_water_mark:
+                self.set_high_water_mark(uid, new_high_water_mark)
+        crawl_elapsed = time.time() - crawl_start
+        db_write_time = self._local.db_write_time
 
         print(f"\n用户 {name} 爬取完成:")
         print(f"  新增微博: {new_weibos} 条")
         if mode == "force_update":
-            print(f"  更新微博: {updated_weibos} 条")
+            print(f"  更新微博: {updated_weibos} 条, 未变化: {unchanged_weibos} 条, "
+                  f"长文本失败: {failed_weibos} 条")
         else:
             print(f"  跳过已存在: {skipped_weibos} 条")
         print(f"  数据库总计: {existing_count + new_weibos} 条")
-        if first_page_all_exist:
-            print(f"  [快速模式] 第一页无更新，跳过后续检查")
+        if crawl_elapsed > 0:
+            print(f"  耗时: {crawl_elapsed:.1f}秒, {(new_weibos + updated_weibos) / crawl_elapsed:.1f} 条/秒, "
+                  f"数据库写入: {db_write_time:.2f}秒")
+
+    def _crawl_user_timed(self, uid: str, name: str, refresh_days: Optional[int] = None) -> Dict:
+        """爬取单个用户（或只刷新互动数）并记录耗时，返回本次的耗时记录"""
+        start_time = time.time()
+        success = True
+        error = ''
+        try:
+            if refresh_days is not None:
+                self.refresh_counts(uid, name, refresh_days)
+            else:
+                self.crawl_user(uid, name)
+        except Exception as e:
+            print(f"爬取用户 {name} 时出错: {str(e)}")
+            success = False
+            error = str(e)
+            # 保留出错前已经抓取的页
+            try:
+                self.commit_pending()
+            except sqlite3.Error as commit_error:
+                print(f"提交已抓取数据失败: {str(commit_error)}")
+
+        elapsed = time.time() - start_time
+        timing = {
+            'uid': uid,
+            'name': name,
+            'elapsed': elapsed,
+            'success': success,
+            'error': error
+        }
+        with self._conn_lock:
+            self.user_timings.append(timing)
+        return timing
+
+    def _work_loop(self, queue: WorkQueue, worker_id: str):
+        """分布式模式的工作线程：不断租用用户并爬取，直到队列中没有未完成的任务"""
+        poll_interval = float(self.config.get('queue_poll_interval', 10))
+        while True:
+            task = queue.lease(worker_id)
+            if task is None:
+                # 其他进程租用中的任务可能因为崩溃而过期，等它们完成或过期
+                if not queue.has_pending_work():
+                    return
+                time.sleep(poll_interval)
+                continue
 
-    def run(self):
-        """运行爬虫"""
+            uid, name = task['uid'], task['name']
+            local_high_water_mark = self.get_high_water_mark(uid)
+            if task['high_water_mark'] and task['high_water_mark'] > (local_high_water_mark or 0):
+                self.set_high_water_mark(uid, task['high_water_mark'])
+
+            with Heartbeat(queue, uid, worker_id) as heartbeat:
+                timing = self._crawl_user_timed(uid, name)
+
+            if heartbeat.lost:
+                continue
+            if timing['success']:
+                queue.complete(uid, worker_id, self.get_high_water_mark(uid))
+            else:
+                queue.fail(uid, worker_id, timing['error'])
+
+    def run_worker(self, queue: Optional[WorkQueue] = None, worker_id: Optional[str] = None):
+        """分布式模式：从共享任务队列租用用户爬取，多个进程/机器可以同时运行"""
+        queue = queue or WorkQueue.from_config(self.config)
+        worker_id = worker_id or default_worker_id()
+        concurrency = max(1, int(self.config.get('concurrency', 1)))
+
+        print("=" * 50)
+        print(f"微博爬虫启动（分布式模式，进程 {worker_id}，线程数 {concurrency}）")
+        print(f"任务队列: {queue.db_path}")
+        print("=" * 50)
+
+        self.user_timings = []
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker') as executor:
+            futures = [executor.submit(self._work_loop, queue, worker_id) for _ in range(concurrency)]
+            for future in futures:
+                future.result()
+        total_elapsed = time.time() - start_time
+
+        if self.image_downloader.running:
+            print("\n等待图片下载完成...")
+            self.image_downloader.close()
+            self.image_downloader.print_stats()
+
+        self.accounts.print_stats()
+        self.print_fetch_stats()
+        self.response_cache.print_stats()
+        self.pipeline_stats.print_stats()
+        stats = queue.get_stats()
+        print("\n" + "=" * 50)
+        print(f"队列中已没有可租用的任务，本进程爬取了 {len(self.user_timings)} 个用户，耗时 {total_elapsed:.1f}秒")
+        print(f"队列: 完成 {stats['done']}, 失败 {stats['failed']}, 等待 {stats['pending']}")
+        print("=" * 50)
+
+    def run(self, refresh_days: Optional[int] = None):
+        """运行爬虫；指定 refresh_days 时只刷新最近几天微博的互动数"""
         print("=" * 50)
         print("微博爬虫启动")
         print("=" * 50)
@@ -480,30 +1321,89 @@ class WeiboSpider:
             print("错误: 请在 config.json 中配置 target_users")
             return
 
-        for user in target_users:
-            uid = user.get('uid', '')
-            name = user.get('name', '')
+        users = [(user.get('uid', ''), user.get('name', ''))
+                 for user in target_users if user.get('uid', '')]
 
-            if uid:
-                try:
-                    self.crawl_user(uid, name)
-                except Exception as e:
-                    print(f"爬取用户 {name} 时出错: {str(e)}")
-                    continue
+        # 并发数：每个用户仍由单个线程按页顺序爬取，多个用户同时进行
+        concurrency = max(1, int(self.config.get('concurrency', 1)))
+        concurrency = min(concurrency, len(users)) if users else 1
+
+        self.user_timings = []
+        start_time = time.time()
+
+        if concurrency == 1:
+            for uid, name in users:
+                self._crawl_user_timed(uid, name, refresh_days)
+        else:
+            print(f"并发模式: {concurrency} 个线程")
+            with ThreadPoolExecutor(max_workers=concurrency,
+                                    thread_name_prefix='crawler') as executor:
+                futures = [executor.submit(self._crawl_user_timed, uid, name, refresh_days)
+                           for uid, name in users]
+                for future in futures:
+                    future.result()
+
+        total_elapsed = time.time() - start_time
+
+        # 等待后台图片下载完成
+        if self.image_downloader.running:
+            print("\n等待图片下载完成...")
+            self.image_downloader.close()
+            self.image_downloader.print_stats()
+
+        self.accounts.print_stats()
+        self.rate_limiter.print_stats()
+        self.print_fetch_stats()
+        self.response_cache.print_stats()
+        self.pipeline_stats.print_stats()
 
         print("\n" + "=" * 50)
         print("所有用户爬取完成")
+        print(f"总耗时: {total_elapsed:.1f}秒 (并发数: {concurrency})")
+        for timing in self.user_timings:
+            status = '' if timing['success'] else ' [失败]'
+            print(f"  {timing['name']} ({timing['uid']}): {timing['elapsed']:.1f}秒{status}")
+        serial_elapsed = sum(t['elapsed'] for t in self.user_timings)
+        if total_elapsed > 0 and serial_elapsed > 0:
+            print(f"用户耗时合计: {serial_elapsed:.1f}秒, 并行加速比: {serial_elapsed / total_elapsed:.2f}x")
         print("=" * 50)
 
     def close(self):
         """关闭数据库连接"""
-        if self.db_conn:
-            self.db_conn.close()
+        self.image_downloader.close()
+        if self._longtext_executor is not None:
+            self._longtext_executor.shutdown()
+            self._longtext_executor = None
+        self.response_cache.close()
+        with self._conn_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+        self.checkpointer.stop()
 
 
 if __name__ == '__main__':
-    spider = WeiboSpider()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='微博爬虫')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--refresh-counts', action='store_true',
+                        help='只刷新最近几天微博的转发/评论/点赞数，不抓取新内容')
+    parser.add_argument('--days', type=int, help='刷新互动数的天数（默认 refresh_days，7天）')
+    parser.add_argument('--worker', action='store_true',
+                        help='分布式模式：从任务队列（work_queue_path）租用用户爬取')
+    parser.add_argument('--worker-id', help='分布式模式下的进程标识（默认 主机名-进程号）')
+    args = parser.parse_args()
+
+    spider = WeiboSpider(args.config)
     try:
-        spider.run()
+        if args.worker:
+            spider.run_worker(worker_id=args.worker_id)
+        elif args.refresh_counts:
+            spider.run(refresh_days=args.days if args.days is not None
+                       else int(spider.config.get('refresh_days', 7)))
+        else:
+            spider.run()
     finally:
         spider.close()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式爬取任务队列 - 多个爬虫进程（或多台机器）从同一个队列租用用户
+
+- 每个用户是一条任务，爬虫进程租用（lease）后才能爬取，租约有过期时间
+- 爬取期间后台线程定期发送心跳续租；进程崩溃后租约过期，任务会被其他进程重新租用
+- 失败的任务重新排队，超过 queue_max_attempts 次后标记为失败
+- 队列中同时保存每个用户的高水位，换一台机器爬取同一个用户时也能增量更新
+
+参考实现基于 SQLite（BEGIN IMMEDIATE 保证租用的原子性），可以放在共享目录中，
+单机上也可以启动多个进程测试：
+
+    python work_queue.py init              # 把 target_users 加入队列
+    python work_queue.py status            # 查看队列状态
+    python work_queue.py reset             # 新一轮：已完成/失败的任务重新排队
+    python weibo_spider.py --worker        # 启动一个爬虫进程（可以启动多个）
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config_loader import load_config, resolve_project_path
+
+
+def default_worker_id() -> str:
+    """默认的进程标识：主机名-进程号-随机后缀"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """基于 SQLite 的租约任务队列"""
+
+    def __init__(self, db_path, lease_seconds: float = 300, max_attempts: int = 3):
+        self.db_path = str(db_path)
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = max(1, int(max_attempts))
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_queue (
+                    uid TEXT PRIMARY KEY,
+                    name TEXT,
+                    state TEXT DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER DEFAULT 0,
+                    high_water_mark INTEGER,
+                    last_error TEXT,
+                    updated_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_crawl_queue_state ON crawl_queue(state, lease_expires)')
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'WorkQueue':
+        """按配置创建队列"""
+        return cls(resolve_project_path(config.get('work_queue_path', '../data/work_queue.db')),
+                   lease_seconds=config.get('lease_seconds', 300),
+                   max_attempts=config.get('queue_max_attempts', 3))
+
+    def _connect(self) -> sqlite3.Connection:
+        """自动提交模式的连接，事务由 BEGIN IMMEDIATE 显式控制"""
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def enqueue(self, users: Iterable[Dict]) -> int:
+        """加入任务（已存在的用户不变），返回新加入的数量"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            added = 0
+            for user in users:
+                uid = user.get('uid', '')
+                if not uid:
+                    continue
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO crawl_queue (uid, name, updated_at) VALUES (?, ?, ?)
+                ''', (uid, user.get('name', ''), time.time()))
+                added += cursor.rowcount
+            conn.execute('COMMIT')
+            return added
+        finally:
+            conn.close()
+
+    def reset(self, include_failed: bool = True) -> int:
+        """开始新一轮：已完成（和失败）的任务重新排队，返回数量"""
+        states = ('done', 'failed') if include_failed else ('done',)
+        conn = self._connect()
+        try:
+            placeholders = ','.join('?' * len(states))
+            cursor = conn.execute(f'''
+                UPDATE crawl_queue
+                SET state = 'pending', attempts = 0, worker = NULL, lease_expires = NULL, updated_at = ?
+                WHERE state IN ({placeholders})
+            ''', (time.time(), *states))
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def lease(self, worker_id: str) -> Optional[Dict]:
+        """租用一个任务（等待中的，或租约已过期的），没有可租用的任务时返回None"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            # 多次租约过期（进程反复崩溃）的任务不再重试
+            conn.execute('''
+                UPDATE crawl_queue SET state = 'failed', last_error = '租约多次过期', updated_at = ?
+                WHERE state = 'leased' AND lease_expires < ? AND attempts + 1 >= ?
+            ''', (now, now, self.max_attempts))
+            row = conn.execute('''
+                SELECT uid, name, high_water_mark, state FROM crawl_queue
+                WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY attempts, updated_at
+                LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            uid, name, high_water_mark, state = row
+            if state == 'leased':
+                # 上一个租用者没有按时续租（崩溃或失联），算作一次失败
+                conn.execute('UPDATE crawl_queue SET attempts = attempts + 1 WHERE uid = ?', (uid,))
+            conn.execute('''
+                UPDATE crawl_queue
+                SET state = 'leased', worker = ?, lease_expires = ?, updated_at = ?
+                WHERE uid = ?
+            ''', (worker_id, now + self.lease_seconds, now, uid))
+            conn.execute('COMMIT')
+            return {'uid': uid, 'name': name, 'high_water_mark': high_water_mark}
+        finally:
+            conn.close()
+
+    def heartbeat(self, uid: str, worker_id: str) -> bool:
+        """续租，返回租约是否仍属于该进程"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            cursor = conn.execute('''
+                UPDATE crawl_queue SET lease_expires = ?, updated_at = ?
+                WHERE uid = ? AND worker = ? AND state = 'leased'
+            ''', (now + self.lease_seconds, now, uid, worker_id))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, uid: str, worker_id: str, high_water_mark: Optional[int] = None) -> bool:
+        """任务完成，记录高水位；返回租约是否仍属于该进程"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                UPDATE crawl_queue
+                SET state = 'done', lease_expires = NULL, attempts = 0, last_error = NULL,
+                    high_water_mark = MAX(COALESCE(high_water_mark, 0), COALESCE(?, 0)),
+                    updated_at = ?
+                WHERE uid = ? AND worker = ? AND state = 'leased'
+            ''', (high_water_mark, time.time(), uid, worker_id))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def fail(self, uid: str, worker_id: str, error: str = '') -> bool:
+        """任务失败：重新排队，超过最大尝试次数时标记为失败"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                UPDATE crawl_queue
+                SET attempts = attempts + 1,
+                    state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                    lease_expires = NULL, last_error = ?, updated_at = ?
+                WHERE uid = ? AND worker = ? AND state = 'leased'
+            ''', (self.max_attempts, error[:500], time.time(), uid, worker_id))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        """各状态的任务数（租约已过期的计入 expired）"""
+        conn = self._connect()
+        try:
+            stats = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+            now = time.time()
+            for state, expired, count in conn.execute('''
+                SELECT state, state = 'leased' AND lease_expires < ?, COUNT(*)
+                FROM crawl_queue GROUP BY 1, 2
+            ''', (now,)):
+                key = 'expired' if expired else state
+                stats[key] = stats.get(key, 0) + count
+            return stats
+        finally:
+            conn.close()
+
+    def has_pending_work(self) -> bool:
+        """是否还有未完成的任务（等待中或租用中）"""
+        stats = self.get_stats()
+        return stats['pending'] + stats['leased'] + stats['expired'] > 0
+
+
+class Heartbeat:
+    """租约心跳：在后台线程中定期续租，用 with 语句包住一次爬取"""
+
+    def __init__(self, queue: WorkQueue, uid: str, worker_id: str, interval: Optional[float] = None):
+        self.queue = queue
+        self.uid = uid
+        self.worker_id = worker_id
+        self.interval = interval or max(1.0, queue.lease_seconds / 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.uid, self.worker_id):
+                    self.lost = True
+                    print(f"  警告: 用户 {self.uid} 的租约已被其他进程接管")
+                    return
+            except sqlite3.Error as e:
+                print(f"  警告: 续租失败 {self.uid}: {str(e)}")
+
+    def __enter__(self) -> 'Heartbeat':
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{self.uid}', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    """管理任务队列"""
+    parser = argparse.ArgumentParser(description='管理分布式爬取任务队列')
+    parser.add_argument('command', choices=['init', 'status', 'reset'],
+                        help='init: 加入 target_users; status: 查看状态; reset: 开始新一轮')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    queue = WorkQueue.from_config(config)
+
+    if args.command == 'init':
+        added = queue.enqueue(config.get('target_users', []))
+        print(f"加入队列: {added} 个用户")
+    elif args.command == 'reset':
+        print(f"重新排队: {queue.reset()} 个用户")
+
+    stats = queue.get_stats()
+    print(f"队列: {queue.db_path}")
+    print(f"  等待: {stats['pending']}, 租用中: {stats['leased']}, 租约过期: {stats['expired']}, "
+          f"完成: {stats['done']}, 失败: {stats['failed']}")
+
+
+if __name__ == '__main__':
+    main()
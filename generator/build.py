@@ -8,12 +8,21 @@ import json
 import os
 import shutil
 import sqlite3
+import sys
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict
 
 from jinja2 import Environment, FileSystemLoader
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'crawler'))
+
+import codec
+import migrations
+import queries
+import retweets
+import storage
+
 
 class SiteGenerator:
     """静态网站生成器"""
@@ -21,8 +30,12 @@ class SiteGenerator:
     def __init__(self, db_path: str = "../data/database.db", output_dir: str = "../site"):
         self.db_path = db_path
         self.output_dir = Path(output_dir)
-        self.db_conn = sqlite3.connect(db_path)
+        self.db_conn = storage.connect(db_path)
         self.db_conn.row_factory = sqlite3.Row
+        # 升级旧数据库的表结构（见 crawler/migrations.py，已是最新版本时不做任何事）
+        migrations.migrate(self.db_conn)
+        # 正文和图片列可能是压缩的（见 crawler/codec.py）
+        self.text_codec = codec.TextCodec.load(self.db_conn)
 
         # 设置Jinja2模板环境
         template_dir = Path(__file__).parent / 'templates'
@@ -46,53 +59,47 @@ class SiteGenerator:
         cursor.execute('SELECT * FROM users ORDER BY name')
         return [dict(row) for row in cursor.fetchall()]
 
-    def get_weibos(self, uid: str = None, limit: int = None, offset: int = 0) -> List[Dict]:
-        """获取微博列表"""
-        cursor = self.db_conn.cursor()
-
-        if uid:
-            query = '''
-                SELECT w.*, u.name as user_name
-                FROM weibos w
-                LEFT JOIN users u ON w.uid = u.uid
-                WHERE w.uid = ?
-                ORDER BY CAST(w.id AS INTEGER) DESC
-            '''
-            params = [uid]
-        else:
-            query = '''
-                SELECT w.*, u.name as user_name
-                FROM weibos w
-                LEFT JOIN users u ON w.uid = u.uid
-                ORDER BY CAST(w.id AS INTEGER) DESC
-            '''
-            params = []
-
-        if limit:
-            query += f' LIMIT {limit} OFFSET {offset}'
+    def get_weibos(self, uid: str = None, limit: int = None, offset: int = 0, before: int = None) -> List[Dict]:
+        """获取微博列表
 
+        before 为整数微博ID（id_int）时只取比它更旧的微博（游标分页）：逐页生成时传入上一页最后一条的 id_int，
+        从索引上的位置直接开始读，不再每页 OFFSET 跳过前面所有页
+        """
+        cursor = self.db_conn.cursor()
+        query, params = queries.weibo_page_query(
+            ('w.id_int',), limit, offset=offset, key=None if before is None else (before,),
+            where='w.uid = ?' if uid else None, params=(uid,) if uid else ())
         cursor.execute(query, params)
         weibos = []
 
         for row in cursor.fetchall():
-            weibo = dict(row)
+            weibo = self.text_codec.decode_row(dict(row))
             # 解析图片JSON
             if weibo['pics']:
                 weibo['pics'] = json.loads(weibo['pics'])
             else:
                 weibo['pics'] = []
 
-            # 解析转发微博
-            if weibo['retweeted_status']:
-                try:
-                    weibo['retweeted_status'] = json.loads(weibo['retweeted_status'])
-                except:
-                    weibo['retweeted_status'] = None
+            # 转发的原微博
+            retweets.attach(weibo)
 
             weibos.append(weibo)
 
         return weibos
 
+    def get_next_page(self, weibos: List[Dict], page: int, per_page: int, uid: str = None) -> List[Dict]:
+        """逐页生成时取第 page 页：weibos 是上一页
+
+        上一页最后一条有整数ID时按游标取；非数字ID的微博没有 id_int，排在最后且游标条件取不到它们，
+        这时（游标为空，或游标页不满而后面还有微博）改用 OFFSET 取这一页
+        """
+        last_id = weibos[-1]['id_int'] if weibos else None
+        if last_id is not None:
+            next_weibos = self.get_weibos(uid=uid, limit=per_page, before=last_id)
+            if len(next_weibos) == per_page:
+                return next_weibos
+        return self.get_weibos(uid=uid, limit=per_page, offset=(page - 1) * per_page)
+
     def get_weibo_by_id(self, weibo_id: str) -> Dict:
         """获取单条微博"""
         weibos = self.get_weibos()
@@ -135,10 +142,11 @@ class SiteGenerator:
         output_file = self.output_dir / 'index.html'
         output_file.write_text(html, encoding='utf-8')
 
-        # 生成其他页面
+        # 生成其他页面（从上一页最后一条微博往后取）
         for page in range(2, total_pages + 1):
-            offset = (page - 1) * per_page
-            weibos = self.get_weibos(limit=per_page, offset=offset)
+            weibos = self.get_next_page(weibos, page, per_page)
+            if not weibos:
+                break
             html = template.render(
                 weibos=weibos,
                 users=users,
@@ -163,7 +171,7 @@ class SiteGenerator:
         for user in users:
             # 获取该用户的微博总数
             cursor = self.db_conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM weibos WHERE uid = ?', (user['uid'],))
+            cursor.execute(queries.COUNT_BY_USER, (user['uid'],))
             total_count = cursor.fetchone()[0]
 
             if total_count == 0:
@@ -184,10 +192,11 @@ class SiteGenerator:
             output_file = user_dir / f"{user['uid']}.html"
             output_file.write_text(html, encoding='utf-8')
 
-            # 生成其他页面
+            # 生成其他页面（从上一页最后一条微博往后取）
             for page in range(2, total_pages + 1):
-                offset = (page - 1) * per_page
-                weibos = self.get_weibos(uid=user['uid'], limit=per_page, offset=offset)
+                weibos = self.get_next_page(weibos, page, per_page, uid=user['uid'])
+                if not weibos:
+                    break
                 html = template.render(
                     user=user,
                     weibos=weibos,
@@ -231,14 +240,15 @@ class SiteGenerator:
             shutil.copytree(assets_src, assets_dst)
             print("复制静态资源完成")
 
-        # 复制图片
+        # 复制图片（图片仓库已去重；跳过下载中的临时文件）
         images_src = Path(__file__).parent.parent / 'data' / 'images'
         images_dst = self.output_dir / 'images'
 
         if images_src.exists():
             if images_dst.exists():
                 shutil.rmtree(images_dst)
-            shutil.copytree(images_src, images_dst)
+            shutil.copytree(images_src, images_dst,
+                            ignore=shutil.ignore_patterns('.partial', '*.part'))
             print("复制图片完成")
 
     def generate_search_index(self, weibos: List[Dict]):
@@ -265,7 +275,7 @@ class SiteGenerator:
         # 获取数据统计
         users = self.get_users()
         cursor = self.db_conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM weibos')
+        cursor.execute(queries.COUNT_ALL)
         total_weibos = cursor.fetchone()[0]
 
         print(f"\n数据统计:")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库迁移测试 - 用 migrations.migrate 建库后，热点查询都必须用到索引
+
+    python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'crawler'))
+
+import migrations
+import storage
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """从空库执行全部迁移后的数据库连接"""
+    conn = storage.connect(tmp_path / 'database.db')
+    migrations.migrate(conn, vacuum=False)
+    yield conn
+    conn.close()
+
+
+def _fill(conn, users: int = 5, per_user: int = 200):
+    """写入一些微博和图片并更新统计信息，让查询规划器按真实数据选择索引"""
+    conn.executemany('INSERT INTO users (uid, name) VALUES (?, ?)',
+                     [(str(1000 + i), f'用户{i}') for i in range(users)])
+    weibos, images = [], []
+    for i in range(users * per_user):
+        weibo_id = str(4000000000000000 + i * 7919)
+        created_at = f'Tue Dec {1 + i % 28:02d} 12:00:00 +0800 2024'
+        weibos.append((weibo_id, str(1000 + i % users), f'微博{i}', created_at,
+                       migrations.id_int(weibo_id), migrations.created_ts(created_at)))
+        images.append((weibo_id, f'https://wx1.sinaimg.cn/large/{weibo_id}.jpg',
+                       f'images/{weibo_id}.jpg', 1))
+    conn.executemany('INSERT INTO weibos (id, uid, content, created_at, id_int, created_ts) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', weibos)
+    conn.executemany('INSERT INTO images (weibo_id, url, local_path, downloaded) VALUES (?, ?, ?, ?)', images)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def test_migrate_reaches_latest_version(conn):
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    # 再次执行不会重复迁移
+    assert migrations.migrate(conn, vacuum=False) == []
+
+
+def test_hot_queries_use_indexes_on_empty_database(conn):
+    assert migrations.check_query_plans(conn) == []
+
+
+def test_hot_queries_use_indexes_with_data(conn):
+    _fill(conn)
+    assert migrations.check_query_plans(conn) == []
+
+
+def test_check_query_plans_reports_missing_index(conn):
+    _fill(conn)
+    conn.execute('DROP INDEX idx_images_weibo_url')
+    problems = migrations.check_query_plans(conn)
+    assert [name for name, _ in problems] == ['整页图片本地路径']
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接测试 - WAL 模式下长时间的写事务不阻塞读取，写写冲突按 busy_timeout 等待
+
+    python -m pytest -q tests
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'crawler'))
+
+import storage
+
+
+# 读者的 busy_timeout 很短：读取一旦需要等写锁就会立即报 database is locked
+READER_CONFIG = {'storage': {'busy_timeout': 0.1}}
+# 写者的页缓存很小：写入的数据超出缓存后必须写入数据库文件（非 WAL 模式下会独占数据库）
+WRITER_CONFIG = {'storage': {'cache_mb': 0.1}}
+WRITE_SECONDS = 1.0
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """带一张测试表的数据库文件"""
+    path = tmp_path / 'database.db'
+    conn = storage.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)')
+    conn.executemany('INSERT INTO items (value) VALUES (?)', [(f'初始{i}',) for i in range(100)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_connect_uses_wal(db_path):
+    conn = storage.connect(db_path)
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 30000
+    finally:
+        conn.close()
+
+
+def test_long_write_does_not_block_readers(db_path):
+    errors = []
+    reads = []
+    write_started = threading.Event()
+    write_done = threading.Event()
+
+    def writer():
+        conn = storage.connect(db_path, WRITER_CONFIG)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            write_started.set()
+            deadline = time.time() + WRITE_SECONDS
+            while time.time() < deadline:
+                conn.executemany('INSERT INTO items (value) VALUES (?)', [('写' * 2000,)] * 20)
+                time.sleep(0.01)
+            conn.commit()
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            write_done.set()
+            conn.close()
+
+    def reader():
+        conn = storage.connect(db_path, READER_CONFIG)
+        try:
+            write_started.wait()
+            while not write_done.is_set():
+                reads.append(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0])
+                time.sleep(0.005)
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # 写事务进行中读者照常读到提交前的数据，之后读到的是提交后的完整数据
+    conn = storage.connect(db_path)
+    try:
+        total = conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+    assert reads.count(100) > 10
+    assert set(reads) <= {100, total}
+
+
+def test_concurrent_writer_waits_for_lock(db_path):
+    errors = []
+    holding = threading.Event()
+
+    def long_writer():
+        conn = storage.connect(db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO items (value) VALUES (?)', ('长事务',))
+            holding.set()
+            time.sleep(WRITE_SECONDS)
+            conn.commit()
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=long_writer)
+    thread.start()
+    holding.wait()
+    conn = storage.connect(db_path)
+    try:
+        conn.execute('INSERT INTO items (value) VALUES (?)', ('等待锁',))
+        conn.commit()
+    except sqlite3.Error as e:
+        errors.append(e)
+    finally:
+        conn.close()
+        thread.join()
+
+    assert errors == []
+    conn = storage.connect(db_path)
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 102
+    finally:
+        conn.close()